@@ -0,0 +1,125 @@
+"""
+Benchmarks load time, memory and inference latency of the pickled grooming model against the compact model format
+
+Run from the repository root:
+    python -m benchmarks.grooming_model_format --tfidf <tf_idf_vectoriser.pk> --lr <lr_model.pk> --compact <dir>
+
+Each load is measured in a fresh interpreter so resident memory isn't shared between the two formats.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+MODELS_DIR = os.path.join('src', 'ai', 'grooming_detection', 'models')
+
+# Short messages in the style of the chat logs the detector is run on
+SAMPLE_MESSAGES = [
+    "hey whats up",
+    "dont u have school 2mor?",
+    "are your parents home right now",
+    "send me a pic of you",
+    "lol that game was so good last night",
+    "you can trust me, i wont tell anyone",
+    "what are you wearing",
+    "ok see you at practice tomorrow",
+]
+
+
+def measure_load(fmt: str, tfidf_path: str, lr_path: str, compact_dir: str) -> dict:
+    """
+    Loads one model format in the current process and measures it
+    :param fmt: 'pickle' or 'compact'
+    :param tfidf_path: pickled TF-IDF vectoriser
+    :param lr_path: pickled logistic regression model
+    :param compact_dir: compact model directory
+    :return: dictionary of measurements
+    """
+    import psutil
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+
+    start = time.perf_counter()
+    if fmt == 'pickle':
+        import pickle
+        with open(tfidf_path, 'rb') as f:
+            vectoriser = pickle.load(f)
+        with open(lr_path, 'rb') as f:
+            classifier = pickle.load(f)
+
+        def predict(text):
+            return classifier.predict_proba(vectoriser.transform([text]))[0][1]
+    else:
+        from src.ai.grooming_detection.compactmodel import CompactGroomingModel
+        model = CompactGroomingModel(compact_dir)
+
+        def predict(text):
+            return model.predict(text)[1]
+    load_seconds = time.perf_counter() - start
+    rss_after_load = process.memory_info().rss
+
+    # Warm up then time single message inference, which is how the detector is called
+    probabilities = [predict(message) for message in SAMPLE_MESSAGES]
+    repeats = 200
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for message in SAMPLE_MESSAGES:
+            predict(message)
+    per_message_ms = (time.perf_counter() - start) / (repeats * len(SAMPLE_MESSAGES)) * 1000
+
+    return {
+        'format': fmt,
+        'load_seconds': load_seconds,
+        'rss_load_mb': (rss_after_load - rss_before) / 2 ** 20,
+        'rss_total_mb': process.memory_info().rss / 2 ** 20,
+        'per_message_ms': per_message_ms,
+        'probabilities': probabilities,
+    }
+
+
+def run_child(fmt: str, args) -> dict:
+    """
+    Runs a measurement in a fresh interpreter
+    :param fmt: 'pickle' or 'compact'
+    :param args: parsed command line arguments
+    :return: dictionary of measurements
+    """
+    cmd = [sys.executable, '-m', 'benchmarks.grooming_model_format', '--child', fmt,
+           '--tfidf', args.tfidf, '--lr', args.lr, '--compact', args.compact]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark pickled vs compact grooming model formats")
+    parser.add_argument('--tfidf', default=os.path.join(MODELS_DIR, 'tf_idf_vectoriser.pk'))
+    parser.add_argument('--lr', default=os.path.join(MODELS_DIR, 'lr_model.pk'))
+    parser.add_argument('--compact', default=os.path.join(MODELS_DIR, 'compact'))
+    parser.add_argument('--child', choices=['pickle', 'compact'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure_load(args.child, args.tfidf, args.lr, args.compact)))
+        return
+
+    # Create the compact model from the pickles if it hasn't been exported yet
+    if not os.path.isdir(args.compact):
+        subprocess.run([sys.executable, '-m', 'src.ai.grooming_detection.compactmodel', '--tfidf', args.tfidf,
+                        '--lr', args.lr, '--output', args.compact], check=True)
+
+    results = [run_child('pickle', args), run_child('compact', args)]
+
+    print(f"{'format':<10}{'load (s)':>12}{'load RSS (MB)':>16}{'total RSS (MB)':>17}{'ms/message':>13}")
+    for result in results:
+        print(f"{result['format']:<10}{result['load_seconds']:>12.3f}{result['rss_load_mb']:>16.1f}"
+              f"{result['rss_total_mb']:>17.1f}{result['per_message_ms']:>13.3f}")
+
+    # Both formats must agree on every prediction
+    max_diff = max(abs(a - b) for a, b in zip(results[0]['probabilities'], results[1]['probabilities']))
+    print(f"max probability difference: {max_diff:.2e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Benchmarks reference hash set import and lookup against a set of random MD5 hashes
+
+Run from the repository root:
+    python -m benchmarks.hashset_lookup --size 10000000
+
+Lookups are timed for hashes in the set, which go through the Bloom filter and the binary search, and for hashes
+not in the set, which the Bloom filter should nearly always reject on its own.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from src.utility.hashsets import CATEGORY_ALERT, HashSet, import_hash_set
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark reference hash set lookups")
+    parser.add_argument('--size', type=int, default=1000000, help="Number of hashes in the set")
+    parser.add_argument('--lookups', type=int, default=100000, help="Number of hits and of misses to look up")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    digests = rng.integers(0, 256, size=(args.size + args.lookups, 16), dtype=np.uint8)
+    hits = [row.tobytes() for row in digests[rng.choice(args.size, args.lookups)]]
+    misses = [row.tobytes() for row in digests[args.size:]]
+
+    with tempfile.TemporaryDirectory() as directory:
+        source_path = os.path.join(directory, 'hashes.txt')
+        with open(source_path, 'w') as f:
+            for row in digests[:args.size]:
+                f.write(row.tobytes().hex() + '\n')
+
+        start = time.perf_counter()
+        meta = import_hash_set(source_path, 'benchmark', CATEGORY_ALERT, directory)
+        import_seconds = time.perf_counter() - start
+        size_mb = sum(os.path.getsize(os.path.join(directory, f"benchmark.{extension}"))
+                      for extension in ['bin', 'bloom']) / 1e6
+        print(f"Imported {meta['count']} hashes in {import_seconds:.1f}s, {size_mb:.1f} MB on disk, "
+              f"{meta['bloom_hashes']} Bloom hashes")
+
+        hash_set = HashSet(directory, 'benchmark')
+        print(f"{'lookups':<10}{'found':>10}{'us each':>10}")
+        for label, queries in [('hits', hits), ('misses', misses)]:
+            start = time.perf_counter()
+            found = sum(digest in hash_set for digest in queries)
+            seconds = time.perf_counter() - start
+            print(f"{label:<10}{found:>10}{seconds / len(queries) * 1e6:>10.2f}")
+        hash_set.close()
+
+
+if __name__ == '__main__':
+    main()
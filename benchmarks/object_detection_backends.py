@@ -0,0 +1,108 @@
+"""
+Benchmarks object detection latency and accuracy for each installed inference backend at 640 and 1280 image sizes
+
+Run from the repository root:
+    python -m benchmarks.object_detection_backends --images src/ai/object_detection/test
+
+Accuracy is measured against PyTorch at 1280, the size photos are detected at. A detection matches a reference
+detection of the same class with an IoU of at least 0.5.
+"""
+import argparse
+import os
+import time
+
+# Hide any GPU so the numbers reflect examiner workstations
+os.environ['CUDA_VISIBLE_DEVICES'] = ''
+
+import cv2
+
+from src.ai.object_detection.backends import available_backends, load_model, BACKEND_PYTORCH
+
+WEIGHTS_PATH = os.path.join('src', 'ai', 'object_detection', 'models', 'yolov8n.pt')
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png']
+IMAGE_SIZES = [640, 1280]
+CONFIDENCE = 0.4
+IOU_THRESHOLD = 0.5
+
+
+def iou(a, b) -> float:
+    """
+    Intersection over union of two (x1, y1, x2, y2) boxes
+    """
+    width = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    height = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    intersection = width * height
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def match_count(detections: [(int, tuple)], reference: [(int, tuple)]) -> int:
+    """
+    Greedily matches detections to reference detections of the same class
+    :param detections: list of (class, normalised box)
+    :param reference: list of (class, normalised box)
+    :return: number of matched detections
+    """
+    unmatched = list(reference)
+    matches = 0
+    for cls, box in detections:
+        best = max((ref for ref in unmatched if ref[0] == cls), key=lambda ref: iou(box, ref[1]), default=None)
+        if best is not None and iou(box, best[1]) >= IOU_THRESHOLD:
+            unmatched.remove(best)
+            matches += 1
+    return matches
+
+
+def run(model, images: [str], imgsz: int) -> (float, dict):
+    """
+    Detects objects in each image one at a time
+    :return: mean milliseconds per image and dictionary of image path to list of (class, normalised box)
+    """
+    # Warm up so one-off setup isn't timed
+    model.predict(cv2.imread(images[0]), imgsz=imgsz, conf=CONFIDENCE, verbose=False)
+    detections = {}
+    total = 0.0
+    for image_path in images:
+        image = cv2.imread(image_path)
+        start = time.perf_counter()
+        result = model.predict(image, imgsz=imgsz, conf=CONFIDENCE, verbose=False)[0]
+        total += time.perf_counter() - start
+        detections[image_path] = [(int(box.cls), tuple(float(v) for v in box.xyxyn[0])) for box in result.boxes]
+    return total / len(images) * 1000, detections
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark object detection backends")
+    parser.add_argument('--images', default=os.path.join('src', 'ai', 'object_detection', 'test'),
+                        help="Directory of test images")
+    parser.add_argument('--weights', default=WEIGHTS_PATH, help="YOLO .pt weights")
+    args = parser.parse_args()
+
+    images = sorted(os.path.join(args.images, name) for name in os.listdir(args.images)
+                    if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS)
+    if not images:
+        raise SystemExit(f"No images found in {args.images}")
+
+    # Reference detections from the current photo path
+    reference_model, _ = load_model(args.weights, BACKEND_PYTORCH)
+    _, reference = run(reference_model, images, 1280)
+    reference_total = sum(len(detections) for detections in reference.values())
+
+    print(f"{len(images)} images, {reference_total} reference detections from {BACKEND_PYTORCH} at 1280")
+    print(f"{'backend':<10}{'imgsz':>6}{'ms/image':>10}{'precision':>11}{'recall':>8}")
+    for backend in reversed(available_backends()):
+        model, used = load_model(args.weights, backend)
+        if used != backend:
+            print(f"{backend:<10} could not be loaded, skipped")
+            continue
+        for imgsz in IMAGE_SIZES:
+            ms, detections = run(model, images, imgsz)
+            matches = sum(match_count(detections[path], reference[path]) for path in images)
+            found = sum(len(d) for d in detections.values())
+            precision = matches / found if found else 1.0
+            recall = matches / reference_total if reference_total else 1.0
+            print(f"{backend:<10}{imgsz:>6}{ms:>10.1f}{precision:>11.0%}{recall:>8.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmarks the grooming detector's text cleaning: the original per-character implementation against the
+shared normalisation module, both one message at a time and as a batch, for each normaliser version
+
+Run from the repository root:
+    python -m benchmarks.text_normalisation --messages 1000000
+
+Version 1 must match the original output, as the shipped model was trained on it, and the single message and batch
+paths of each version must match each other. The run fails if they don't.
+"""
+import argparse
+import html
+import random
+import re
+import time
+
+import pandas as pd
+
+from src.ai.grooming_detection import normalisation
+
+# Fragments mixed together to make chat style messages, including HTML entities, emoji and odd whitespace
+FRAGMENTS = [
+    "hey", "whats", "up", "dont", "u", "have", "school", "2mor?", "are", "your", "parents", "home",
+    "send", "me", "pics", "lol", "games", "you", "can", "trust", "me", "&quot;secret&quot;", "&amp;",
+    "café", "\U0001F60A", "❤️", "  ", "\t", "\n", "friends", "messages", "ok", "tomorrow",
+]
+
+# Short messages that recur throughout real chat logs
+COMMON_MESSAGES = ["lol", "ok", "hey", "yeah", "haha", "u there?", "brb", "whats up", "k", "&lt;3"]
+
+
+def legacy_clean_text(text: str) -> str:
+    """
+    The cleaning implementation used before the shared normalisation module
+    :param text: raw message text
+    :return: cleaned text
+    """
+    text = html.unescape(text)
+    text = normalisation.wnl.lemmatize(text)
+    text = ''.join([i if ord(i) < 128 else ' ' for i in text])
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text
+
+
+def generate_messages(count: int, seed: int = 0) -> [str]:
+    """
+    Generates synthetic chat messages
+    :param count: number of messages
+    :param seed: random seed so runs are repeatable
+    :return: list of messages
+    """
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        if rng.random() < 0.3:
+            messages.append(rng.choice(COMMON_MESSAGES))
+        else:
+            messages.append(' '.join(rng.choices(FRAGMENTS, k=rng.randint(1, 12))))
+    return messages
+
+
+def timed(func, *args) -> (object, float):
+    """
+    Runs a function once and times it
+    :param func: function to run
+    :param args: arguments to pass
+    :return: function result and elapsed seconds
+    """
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark grooming detector text cleaning")
+    parser.add_argument('--messages', type=int, default=1000000, help="Number of synthetic messages")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed for message generation")
+    args = parser.parse_args()
+
+    messages = generate_messages(args.messages, args.seed)
+    series = pd.Series(messages, dtype=object)
+
+    legacy, legacy_seconds = timed(lambda: [legacy_clean_text(m) for m in messages])
+    timings = [('legacy', legacy_seconds)]
+    for version in normalisation.NORMALISER_VERSIONS:
+        normalisation.lemmatise_message.cache_clear()
+        normalisation.lemmatise_token.cache_clear()
+        single, single_seconds = timed(lambda: [normalisation.clean_text(m, version) for m in messages])
+        normalisation.lemmatise_message.cache_clear()
+        normalisation.lemmatise_token.cache_clear()
+        batch, batch_seconds = timed(normalisation.clean_series, series, version)
+        batch = batch.tolist()
+        timings += [(f"v{version} single", single_seconds), (f"v{version} batch", batch_seconds)]
+
+        expected = legacy if version == normalisation.NORMALISER_VERSION_WHOLE_MESSAGE else single
+        for name, output in [('clean_text', single), ('clean_series', batch)]:
+            mismatches = sum(1 for a, b in zip(expected, output) if a != b)
+            if mismatches:
+                raise SystemExit(f"Version {version} {name} output differs on {mismatches} of {len(messages)} "
+                                 f"messages")
+
+    print(f"{'path':<12}{'seconds':>10}{'msgs/s':>14}{'speedup':>10}")
+    for name, seconds in timings:
+        print(f"{name:<12}{seconds:>10.2f}{len(messages) / seconds:>14,.0f}{legacy_seconds / seconds:>9.1f}x")
+    print(f"Version 1 identical to the original and single and batch output identical for {len(messages)} messages")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""
+Benchmarks video object detection throughput with and without the decode/inference pipeline on the CPU
+
+Run from the repository root:
+    python -m benchmarks.video_pipeline clip1.mp4 clip2.mp4 ... --strategy all
+
+Frames per second counts the sampled frames that were run through the model.
+"""
+import argparse
+import os
+import time
+
+# Hide any GPU so the numbers reflect CPU-only machines
+os.environ['CUDA_VISIBLE_DEVICES'] = ''
+
+from src.ai.object_detection.framesampling import FrameSampler, SAMPLING_STRATEGIES, SAMPLE_ALL
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipelined video object detection")
+    parser.add_argument('clips', nargs='+', help="Sample video clips")
+    parser.add_argument('--strategy', choices=SAMPLING_STRATEGIES, default=SAMPLE_ALL,
+                        help="Frame sampling strategy")
+    parser.add_argument('--batch-size', type=int, default=8, help="Frames taken from the queue at a time")
+    parser.add_argument('--queue-size', type=int, default=32, help="Decoded frames held between stages")
+    args = parser.parse_args()
+
+    # Imported here so the model is only loaded once arguments are valid
+    from src.ai.object_detection.objectdetection import ObjectDetection
+
+    print(f"{'clip':<30}{'mode':<12}{'frames':>8}{'seconds':>10}{'fps':>8}")
+    for clip in args.clips:
+        sampler = FrameSampler(args.strategy)
+        frames = sum(1 for _ in sampler.iter_frames(clip))
+        # Warm up the model so the first timed run doesn't include its setup
+        ObjectDetection.detect_objects_video(clip, 'every_n', pipelined=False, every_n=max(frames, 1))
+
+        for mode, pipelined in [('sequential', False), ('pipelined', True)]:
+            start = time.perf_counter()
+            ObjectDetection.detect_objects_video(clip, args.strategy, pipelined=pipelined,
+                                                 batch_size=args.batch_size, queue_size=args.queue_size)
+            seconds = time.perf_counter() - start
+            print(f"{clip[-30:]:<30}{mode:<12}{frames:>8}{seconds:>10.2f}{frames / seconds:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
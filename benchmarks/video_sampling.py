@@ -0,0 +1,59 @@
+"""
+Benchmarks the frame sampling strategies of video object detection for speed against recall
+
+Run from the repository root:
+    python -m benchmarks.video_sampling clip1.mp4 clip2.mp4 ...
+
+Every strategy is compared with running detection on all frames. Recall is the fraction of object classes found
+using every frame that the strategy also finds.
+"""
+import argparse
+import time
+
+from src.ai.object_detection.framesampling import FrameSampler, SAMPLING_STRATEGIES, SAMPLE_ALL
+
+
+def detected_classes(records: [dict]) -> set:
+    """
+    Gets the object classes from the output of ObjectDetection.detect_objects_video
+    :param records: tracked object records
+    :return: set of class names
+    """
+    return {record['class_name'] for record in records}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark video frame sampling strategies")
+    parser.add_argument('clips', nargs='+', help="Sample video clips")
+    parser.add_argument('--every-n', type=int, default=10, help="Frame interval for 'every_n'")
+    parser.add_argument('--target-fps', type=float, default=5.0, help="Sample rate for 'fps'")
+    parser.add_argument('--scene-threshold', type=float, default=0.3, help="Histogram distance for 'scene_change'")
+    args = parser.parse_args()
+
+    # Imported here so the model is only loaded once arguments are valid
+    from src.ai.object_detection.objectdetection import ObjectDetection
+
+    sampling = {'every_n': args.every_n, 'target_fps': args.target_fps, 'scene_threshold': args.scene_threshold}
+    print(f"{'clip':<30}{'strategy':<14}{'frames':>8}{'seconds':>10}{'speedup':>9}{'recall':>8}")
+    for clip in args.clips:
+        reference = None
+        reference_seconds = None
+        for strategy in SAMPLING_STRATEGIES:
+            # Count the frames each strategy samples without running detection
+            sampler = FrameSampler(strategy, **sampling)
+            frames = sum(1 for _ in sampler.iter_frames(clip))
+
+            start = time.perf_counter()
+            classes = detected_classes(ObjectDetection.detect_objects_video(clip, strategy, **sampling))
+            seconds = time.perf_counter() - start
+
+            if strategy == SAMPLE_ALL:
+                reference = classes
+                reference_seconds = seconds
+            recall = len(classes & reference) / len(reference) if reference else 1.0
+            print(f"{clip[-30:]:<30}{strategy:<14}{frames:>8}{seconds:>10.2f}"
+                  f"{reference_seconds / seconds:>8.1f}x{recall:>8.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,342 @@
+import argparse
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+
+# Bumped whenever the on-disk layout changes
+COMPACT_FORMAT_VERSION = 1
+
+# Files that make up a compact model directory
+META_FILE = 'meta.json'
+TERMS_FILE = 'vocab_terms.bin'
+OFFSETS_FILE = 'vocab_offsets.npy'
+COLUMNS_FILE = 'vocab_columns.npy'
+IDF_FILE = 'idf.npy'
+COEF_FILE = 'coef.npy'
+INTERCEPT_FILE = 'intercept.npy'
+
+
+def export_compact_model(vectoriser, classifier, output_dir: str) -> None:
+    """
+    Exports a fitted TF-IDF or hashing vectoriser and linear classifier to the compact model format.
+    A TF-IDF vocabulary is stored as a sorted UTF-8 blob with an offsets array so it can be memory-mapped
+    and binary searched, a hashing vectoriser needs no vocabulary at all. The IDF weights and coefficients
+    are stored as NumPy arrays
+    :param vectoriser: fitted sklearn TfidfVectorizer or HashingVectorizer
+    :param classifier: fitted binary sklearn LogisticRegression (or any linear model with coef_/intercept_)
+    :param output_dir: directory to write the model files to
+    :return:
+    """
+    # Text normaliser version set on the vectoriser by training, models from before it was recorded used version 1
+    normaliser_version = getattr(vectoriser, 'normaliser_version_', 1)
+
+    # Only the default word analyzer can be reproduced without sklearn
+    if vectoriser.analyzer != 'word' or vectoriser.tokenizer is not None or vectoriser.preprocessor is not None \
+            or vectoriser.stop_words is not None or vectoriser.strip_accents is not None:
+        raise ValueError("Only word analyzers without custom tokenizers, preprocessors, stop words or accent "
+                         "stripping can be exported")
+    if len(classifier.classes_) != 2:
+        raise ValueError("Only binary classifiers can be exported")
+
+    os.makedirs(output_dir, exist_ok=True)
+    logging.info(f"Exporting compact grooming model to {output_dir}")
+
+    meta = {
+        'format_version': COMPACT_FORMAT_VERSION,
+        'lowercase': bool(vectoriser.lowercase),
+        'token_pattern': vectoriser.token_pattern,
+        'ngram_range': list(vectoriser.ngram_range),
+        'norm': vectoriser.norm,
+        'link': _probability_link(classifier),
+        'classes': [int(c) for c in classifier.classes_],
+        'normaliser_version': normaliser_version,
+    }
+
+    if hasattr(vectoriser, 'vocabulary_'):
+        # Sort terms so lookups can binary search, UTF-8 byte order matches code point order
+        vocabulary = vectoriser.vocabulary_
+        terms = sorted(vocabulary)
+        encoded_terms = [term.encode('utf-8') for term in terms]
+
+        # Offsets into the terms blob, term i is blob[offsets[i]:offsets[i + 1]]
+        offsets = np.zeros(len(encoded_terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(term) for term in encoded_terms])
+        with open(os.path.join(output_dir, TERMS_FILE), 'wb') as f:
+            f.write(b''.join(encoded_terms))
+        np.save(os.path.join(output_dir, OFFSETS_FILE), offsets)
+
+        # Feature column for each sorted term
+        columns = np.array([vocabulary[term] for term in terms], dtype=np.int32)
+        np.save(os.path.join(output_dir, COLUMNS_FILE), columns)
+
+        # IDF weights indexed by feature column
+        if vectoriser.use_idf:
+            np.save(os.path.join(output_dir, IDF_FILE), np.asarray(vectoriser.idf_, dtype=np.float64))
+
+        meta.update({
+            'vectoriser': 'tfidf',
+            'use_idf': bool(vectoriser.use_idf),
+            'sublinear_tf': bool(vectoriser.sublinear_tf),
+            'n_features': len(terms),
+        })
+    else:
+        # Feature columns are computed from a MurmurHash3 of each n-gram
+        if vectoriser.binary:
+            raise ValueError("Binary hashing vectorisers can't be exported")
+        meta.update({
+            'vectoriser': 'hashing',
+            'use_idf': False,
+            'sublinear_tf': False,
+            'n_features': int(vectoriser.n_features),
+            'alternate_sign': bool(vectoriser.alternate_sign),
+        })
+
+    # Linear model weights indexed by feature column
+    np.save(os.path.join(output_dir, COEF_FILE), np.asarray(classifier.coef_, dtype=np.float64).ravel())
+    np.save(os.path.join(output_dir, INTERCEPT_FILE), np.asarray(classifier.intercept_, dtype=np.float64).ravel())
+
+    with open(os.path.join(output_dir, META_FILE), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    logging.info(f"Compact grooming model exported with {meta['n_features']} features")
+
+
+def murmurhash3_32(data: bytes, seed: int = 0) -> int:
+    """
+    Signed 32-bit MurmurHash3 (x86 variant), matching sklearn's murmurhash3_32
+    :param data: bytes to hash
+    :param seed: hash seed
+    :return: signed 32-bit hash
+    """
+    c1 = 0xcc9e2d51
+    c2 = 0x1b873593
+    length = len(data)
+    h1 = seed & 0xffffffff
+    rounded_end = length & ~3
+
+    # Body, 4 bytes at a time
+    for i in range(0, rounded_end, 4):
+        k1 = int.from_bytes(data[i:i + 4], 'little')
+        k1 = (k1 * c1) & 0xffffffff
+        k1 = ((k1 << 15) | (k1 >> 17)) & 0xffffffff
+        k1 = (k1 * c2) & 0xffffffff
+        h1 ^= k1
+        h1 = ((h1 << 13) | (h1 >> 19)) & 0xffffffff
+        h1 = (h1 * 5 + 0xe6546b64) & 0xffffffff
+
+    # Tail, the last 1-3 bytes
+    tail = length & 3
+    if tail:
+        k1 = 0
+        if tail == 3:
+            k1 ^= data[rounded_end + 2] << 16
+        if tail >= 2:
+            k1 ^= data[rounded_end + 1] << 8
+        k1 ^= data[rounded_end]
+        k1 = (k1 * c1) & 0xffffffff
+        k1 = ((k1 << 15) | (k1 >> 17)) & 0xffffffff
+        k1 = (k1 * c2) & 0xffffffff
+        h1 ^= k1
+
+    # Finalisation mix
+    h1 ^= length
+    h1 ^= h1 >> 16
+    h1 = (h1 * 0x85ebca6b) & 0xffffffff
+    h1 ^= h1 >> 13
+    h1 = (h1 * 0xc2b2ae35) & 0xffffffff
+    h1 ^= h1 >> 16
+
+    return h1 - 0x100000000 if h1 & 0x80000000 else h1
+
+
+def _probability_link(classifier) -> str:
+    """
+    Works out how the classifier turns its decision function into a probability
+    :param classifier: fitted linear classifier
+    :return: 'softmax' for binary multinomial logistic regression, 'logistic' otherwise
+    """
+    # sklearn applies a softmax over [-d, d] for binary multinomial models, which is sigmoid(2d)
+    if getattr(classifier, 'multi_class', None) == 'multinomial':
+        return 'softmax'
+    return 'logistic'
+
+
+class CompactGroomingModel:
+    """
+    Loads a compact grooming model and runs inference on it using only NumPy and the standard library
+    """
+
+    def __init__(self, model_dir: str) -> None:
+        with open(os.path.join(model_dir, META_FILE)) as f:
+            self.meta = json.load(f)
+        if self.meta['format_version'] != COMPACT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported compact model format version {self.meta['format_version']}")
+
+        # Everything large is memory-mapped so only the pages touched by lookups are loaded
+        self.coef = np.load(os.path.join(model_dir, COEF_FILE), mmap_mode='r')
+        self.intercept = float(np.load(os.path.join(model_dir, INTERCEPT_FILE))[0])
+        self.idf = None
+        if self.meta['use_idf']:
+            self.idf = np.load(os.path.join(model_dir, IDF_FILE), mmap_mode='r')
+
+        self.hashing = self.meta['vectoriser'] == 'hashing'
+        if not self.hashing:
+            self.offsets = np.load(os.path.join(model_dir, OFFSETS_FILE), mmap_mode='r')
+            self.columns = np.load(os.path.join(model_dir, COLUMNS_FILE), mmap_mode='r')
+            self.n_terms = len(self.offsets) - 1
+            terms_path = os.path.join(model_dir, TERMS_FILE)
+            with open(terms_path, 'rb') as f:
+                self.terms = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(terms_path) else b''
+
+        self.token_pattern = re.compile(self.meta['token_pattern'])
+        self.classes = self.meta['classes']
+
+    def lookup(self, term: str) -> int:
+        """
+        Binary searches the sorted vocabulary for a term
+        :param term: n-gram to look up
+        :return: feature column of the term, or -1 if it's not in the vocabulary
+        """
+        key = term.encode('utf-8')
+        offsets = self.offsets
+        low, high = 0, self.n_terms
+        while low < high:
+            middle = (low + high) // 2
+            candidate = self.terms[offsets[middle]:offsets[middle + 1]]
+            if candidate < key:
+                low = middle + 1
+            elif candidate > key:
+                high = middle
+            else:
+                return int(self.columns[middle])
+        return -1
+
+    def hash_feature(self, term: str) -> (int, int):
+        """
+        Maps a term to its hashed feature column the same way HashingVectorizer does
+        :param term: n-gram to hash
+        :return: (feature column, sign of the feature value)
+        """
+        h = murmurhash3_32(term.encode('utf-8'))
+        n_features = self.meta['n_features']
+        if h == -0x80000000:
+            # abs(-2**31) overflows in sklearn's int32 arithmetic, this is its defined result
+            column = (0x7fffffff - (n_features - 1)) % n_features
+        else:
+            column = abs(h) % n_features
+        sign = -1 if self.meta['alternate_sign'] and h < 0 else 1
+        return column, sign
+
+    def analyse(self, text: str) -> [str]:
+        """
+        Splits text into word n-grams the same way the sklearn word analyzer does
+        :param text: cleaned text
+        :return: list of n-grams
+        """
+        if self.meta['lowercase']:
+            text = text.lower()
+        tokens = self.token_pattern.findall(text)
+
+        min_n, max_n = self.meta['ngram_range']
+        if max_n == 1:
+            return tokens
+
+        # Unigrams are the tokens themselves so only slice out the longer n-grams
+        ngrams = list(tokens) if min_n == 1 else []
+        min_n = max(min_n, 2)
+        for n in range(min_n, min(max_n + 1, len(tokens) + 1)):
+            for i in range(len(tokens) - n + 1):
+                ngrams.append(' '.join(tokens[i:i + n]))
+        return ngrams
+
+    def vectorise(self, text: str) -> {int: float}:
+        """
+        Vectorises text into a sparse mapping of feature column to weight
+        :param text: cleaned text
+        :return: dictionary of feature column to weight
+        """
+        counts = {}
+        for ngram in self.analyse(text):
+            if self.hashing:
+                column, sign = self.hash_feature(ngram)
+                counts[column] = counts.get(column, 0) + sign
+            else:
+                column = self.lookup(ngram)
+                if column >= 0:
+                    counts[column] = counts.get(column, 0) + 1
+
+        weights = {}
+        for column, count in counts.items():
+            weight = 1 + math.log(count) if self.meta['sublinear_tf'] else float(count)
+            if self.idf is not None:
+                weight *= float(self.idf[column])
+            weights[column] = weight
+
+        # Normalise the same way TfidfVectorizer does
+        if self.meta['norm'] == 'l2':
+            norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+        elif self.meta['norm'] == 'l1':
+            norm = sum(abs(weight) for weight in weights.values())
+        else:
+            norm = 0
+        if norm > 0:
+            weights = {column: weight / norm for column, weight in weights.items()}
+        return weights
+
+    def decision_function(self, text: str) -> float:
+        """
+        Linear decision value for the positive class
+        :param text: cleaned text
+        :return: decision value
+        """
+        weights = self.vectorise(text)
+        return self.intercept + sum(weight * float(self.coef[column]) for column, weight in weights.items())
+
+    def predict(self, text: str) -> (int, float):
+        """
+        Predicts the class and positive class probability of cleaned text
+        :param text: cleaned text
+        :return: (predicted class, probability of the positive class)
+        """
+        decision = self.decision_function(text)
+        if self.meta['link'] == 'softmax':
+            decision *= 2
+        probability = 1 / (1 + math.exp(-decision)) if decision > -700 else 0.0
+        predicted_class = self.classes[1] if decision > 0 else self.classes[0]
+        return predicted_class, probability
+
+
+def main() -> None:
+    """
+    Converts the trusted pickled grooming model into the compact model format
+    :return:
+    """
+    import pickle
+
+    models_dir = os.path.join(os.path.dirname(__file__), 'models')
+    parser = argparse.ArgumentParser(description="Convert pickled grooming model to the compact model format")
+    parser.add_argument('--tfidf', default=os.path.join(models_dir, 'tf_idf_vectoriser.pk'),
+                        help="pickled TF-IDF vectoriser")
+    parser.add_argument('--lr', default=os.path.join(models_dir, 'lr_model.pk'),
+                        help="pickled logistic regression model")
+    parser.add_argument('--output', default=os.path.join(models_dir, 'compact'),
+                        help="directory to write the compact model to")
+    args = parser.parse_args()
+
+    # Only ever convert pickles from a trusted source, unpickling runs arbitrary code
+    with open(args.tfidf, 'rb') as f:
+        vectoriser = pickle.load(f)
+    with open(args.lr, 'rb') as f:
+        classifier = pickle.load(f)
+
+    export_compact_model(vectoriser, classifier, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,31 +1,36 @@
-import html
 import os
 import pickle
-import re
-import ssl
-import nltk
-from nltk import WordNetLemmatizer
-
-try:
-    _create_unverified_https_context = ssl._create_unverified_context
-except AttributeError:
-    pass
-else:
-    ssl._create_default_https_context = _create_unverified_https_context
+from src.ai.grooming_detection import normalisation
+from src.ai.grooming_detection.compactmodel import CompactGroomingModel
+from src.utility.progress import Progress
+from src.utility.utility import FileManager
 
-nltk.download("wordnet")
-wnl = WordNetLemmatizer()
 tf_idf_dir = os.path.join(os.path.dirname(__file__), 'models', 'tf_idf_vectoriser.pk')
 lr_dir = os.path.join(os.path.dirname(__file__), 'models', 'lr_model.pk')
+compact_dir = os.path.join(os.path.dirname(__file__), 'models', 'compact')
+
+# Prefer the compact model, it loads faster, uses less memory and is safe to load from case bundles
+compact_model = None
+tfidf_vectoriser = None
+lr_model = None
+if os.path.isdir(compact_dir):
+    compact_model = CompactGroomingModel(compact_dir)
+else:
+    # Load the fitted TF-IDF vectoriser
+    with open(tf_idf_dir, "rb") as f:
+        tfidf_vectoriser = pickle.load(f)
 
+    # Load the trained Logistic Regression model
+    with open(lr_dir, "rb") as f:
+        lr_model = pickle.load(f)
 
-# Load the fitted TF-IDF vectoriser
-with open(tf_idf_dir, "rb") as f:
-    tfidf_vectoriser = pickle.load(f)
-
-# Load the trained Logistic Regression model
-with open(lr_dir, "rb") as f:
-    lr_model = pickle.load(f)
+# The model's vocabulary only matches text cleaned the same way it was trained on, models without a version were
+# trained before per-word lemmatisation
+model_normaliser_version = compact_model.meta.get('normaliser_version', 1) if compact_model is not None \
+    else getattr(tfidf_vectoriser, 'normaliser_version_', 1)
+if model_normaliser_version not in normalisation.NORMALISER_VERSIONS:
+    raise ValueError(f"Grooming model was trained with unknown text normaliser version {model_normaliser_version}, "
+                     f"retrain it with python -m src.ai.grooming_detection.training.ml --deploy")
 
 
 class GroomingDetector:
@@ -54,16 +59,8 @@ class GroomingDetector:
         :param text:
         :return:
         """
-        # Convert HTML characters to ASCII
-        text = html.unescape(text)
-        # Lemmatise
-        text = wnl.lemmatize(text)
-        # Remove any non-ASCII characters
-        text = ''.join([i if ord(i) < 128 else ' ' for i in text])
-        # Remove trailing whitespace
-        text = re.sub(r'\s+', ' ', text).strip()
-
-        return text
+        # Shared with training so the model sees identically cleaned text
+        return normalisation.clean_text(text, model_normaliser_version)
 
     @staticmethod
     def vectorise(cleaned_text):
@@ -82,13 +79,48 @@ class GroomingDetector:
         return predicted_class, probability
 
     def detect_grooming(self, raw_text):
-        cleaned_text = [self.clean_text(raw_text)]
-        vectorised_text = self.vectorise(cleaned_text)
-        predicted_class, probability = self.predict_grooming(vectorised_text)
+        if compact_model is not None:
+            predicted_class, probability = compact_model.predict(self.clean_text(raw_text))
+        else:
+            cleaned_text = [self.clean_text(raw_text)]
+            vectorised_text = self.vectorise(cleaned_text)
+            predicted_class, probability = self.predict_grooming(vectorised_text)
         if predicted_class == 1:
             return f"GROOMING DETECTED: '{raw_text}' with probability {probability:.3f} "
         else:
             return None
 
+    def detect_grooming_in_clog(self, clog_path: str, progress: Progress = None) -> [(str, str)]:
+        """
+        Detects grooming in every message of a chat log
+        :param clog_path: path to the chat log
+        :param progress: reports messages checked and allows cancelling
+        :return: list of (message, result) for messages where grooming was detected, None if the chat log format
+        isn't recognised
+        """
+        clog_type = FileManager().validate_clog(clog_path)
+        if clog_type == 'instagram-json':
+            # Valid Instagram JSON chatlog
+            messages = list(FileManager().parse_insta_json(clog_path)['message'])
+        elif clog_type == 'snapchat-json':
+            # Valid Snapchat JSON chatlog
+            messages = [message for _, df in FileManager().parse_snap_json(clog_path) for message in df['message']]
+        elif clog_type == 'plaintext':
+            # Plaintext chat log
+            messages = FileManager().parse_txt_file(clog_path).splitlines()
+        else:
+            # Invalid format can't parse it
+            return None
+
+        progress = progress or Progress()
+        progress.start(f"Detecting grooming in {os.path.basename(clog_path)}", len(messages))
+        detected = []
+        for message in messages:
+            result = self.detect_grooming(message)
+            if result is not None:
+                detected.append((message, result))
+            progress.advance()
+        return detected
+
 
 # print(GroomingDetector().detect_grooming("dont u have school 2mor?"))
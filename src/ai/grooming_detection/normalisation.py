@@ -0,0 +1,109 @@
+import functools
+import html
+import ssl
+import nltk
+import pandas as pd
+from nltk import WordNetLemmatizer
+
+try:
+    _create_unverified_https_context = ssl._create_unverified_context
+except AttributeError:
+    pass
+else:
+    ssl._create_default_https_context = _create_unverified_https_context
+
+nltk.download("wordnet")
+nltk.download("omw-1.4")
+wnl = WordNetLemmatizer()
+
+# Versions of clean_text's output. Models and cleaned corpora record the version they were made with, and text is
+# cleaned with a model's own version as its vocabulary only matches text cleaned that way.
+# 1 lemmatises the whole message as one token, as the shipped model was trained with, 2 lemmatises each word
+NORMALISER_VERSION_WHOLE_MESSAGE = 1
+NORMALISER_VERSION_PER_WORD = 2
+NORMALISER_VERSIONS = [NORMALISER_VERSION_WHOLE_MESSAGE, NORMALISER_VERSION_PER_WORD]
+# Used by new training runs
+NORMALISER_VERSION = NORMALISER_VERSION_PER_WORD
+
+
+class _NonASCIITable(dict):
+    """
+    str.translate table mapping every non-ASCII character to a space.
+    ASCII characters map to themselves and non-ASCII characters are added the first time they're seen,
+    so translate only falls back to Python for characters it hasn't met before
+    """
+
+    def __missing__(self, codepoint: int) -> str:
+        self[codepoint] = ' '
+        return ' '
+
+
+NON_ASCII_TABLE = _NonASCIITable({codepoint: codepoint for codepoint in range(128)})
+
+
+@functools.lru_cache(maxsize=200000)
+def lemmatise_message(text: str) -> str:
+    """
+    Lemmatises a whole message as a single token, as the shipped model was trained with. Only single word messages
+    change. Memoised as short chat messages repeat heavily
+    :param text: message text
+    :return: lemmatised text
+    """
+    return wnl.lemmatize(text)
+
+
+@functools.lru_cache(maxsize=200000)
+def lemmatise_token(token: str) -> str:
+    """
+    Lemmatises a single word, memoised as chat vocabularies repeat heavily
+    :param token: single word
+    :return: lemmatised word
+    """
+    return wnl.lemmatize(token)
+
+
+def lemmatise_words(words: [str]) -> str:
+    """
+    Lemmatises each word and joins them with single spaces
+    :param words: words of a message
+    :return: lemmatised text
+    """
+    return ' '.join([lemmatise_token(word) for word in words])
+
+
+def clean_text(text: str, version: int = NORMALISER_VERSION) -> str:
+    """
+    Performs small amount of data cleaning while preserving potentially important features.
+    Used for both training and inference so the model always sees the same text
+    :param text: raw message text
+    :param version: one of NORMALISER_VERSIONS, the version the model was trained with
+    :return: cleaned text
+    """
+    # Convert HTML characters to ASCII
+    text = html.unescape(text)
+    if version == NORMALISER_VERSION_WHOLE_MESSAGE:
+        # Lemmatise
+        text = lemmatise_message(text)
+    # Replace any non-ASCII characters with spaces
+    if not text.isascii():
+        text = text.translate(NON_ASCII_TABLE)
+    if version == NORMALISER_VERSION_WHOLE_MESSAGE:
+        # Collapse whitespace and remove trailing whitespace
+        return ' '.join(text.split())
+    # Collapse whitespace, remove trailing whitespace and lemmatise each word
+    return lemmatise_words(text.split())
+
+
+def clean_series(texts: pd.Series, version: int = NORMALISER_VERSION) -> pd.Series:
+    """
+    Batch version of clean_text for whole columns of messages, output is identical to clean_text.
+    Chat logs repeat short messages heavily so each distinct message is only cleaned once
+    :param texts: series of raw message text
+    :param version: one of NORMALISER_VERSIONS
+    :return: series of cleaned text
+    """
+    # Mapping clean_text over the distinct messages is faster than chaining pandas .str methods, which each make
+    # another pass over the column
+    unique_texts = pd.unique(texts)
+    cleaned = dict(zip(unique_texts, [clean_text(text, version) for text in unique_texts]))
+    return texts.map(cleaned)
@@ -1,30 +1,72 @@
-import html
-import re
-import ssl
+import argparse
+import csv
+import json
+import logging
+import os
+import pickle
+import shutil
+import time
 import xml.etree.ElementTree as ET
+import zlib
+from contextlib import contextmanager
 import matplotlib.pyplot as plt
-import nltk
+import numpy as np
 import pandas as pd
-from nltk.stem import WordNetLemmatizer
+from sklearn.feature_extraction.text import HashingVectorizer
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.linear_model import LogisticRegression
+from sklearn.linear_model import SGDClassifier
 from sklearn.metrics import ConfusionMatrixDisplay
 from sklearn.metrics import classification_report
 from sklearn.metrics import confusion_matrix
 from sklearn.model_selection import train_test_split
 from sklearn.utils import resample
-
-try:
-    _create_unverified_https_context = ssl._create_unverified_context
-except AttributeError:
-    pass
-else:
-    ssl._create_default_https_context = _create_unverified_https_context
-
-nltk.download("wordnet")
-nltk.download("omw-1.4")
-nltk.download("stopwords")
-wnl = WordNetLemmatizer()
+from src.ai.grooming_detection.compactmodel import export_compact_model
+from src.ai.grooming_detection.normalisation import clean_series, NORMALISER_VERSION
+
+logging.basicConfig(level=logging.INFO)
+
+# Default locations of the PAN12 training corpus and outputs
+DATASETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'datasets')
+CORPUS_XML = os.path.join(DATASETS_DIR, 'pan12-sexual-predator-identification-training-corpus-2012-05-01.xml')
+PREDATORS_TXT = os.path.join(DATASETS_DIR,
+                             'pan12-sexual-predator-identification-training-corpus-predators-2012-05-01.txt')
+CLEANED_CORPUS_CSV = os.path.join(DATASETS_DIR, 'pan12-cleaned-corpus.csv')
+# Models the detector loads, only replaced by deploying a trained model
+MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'models')
+TRAINING_OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'output')
+# Files save_models writes, the compact model directory and the sklearn pickles of a TF-IDF model
+MODEL_FILES = ['compact', 'tf_idf_vectoriser.pk', 'lr_model.pk']
+
+# Messages cleaned together when building the cleaned corpus
+CLEANING_BATCH_SIZE = 10000
+
+# Rebalancing of the in-memory training set, as fractions of the rows passed in so training splits and cross
+# validation folds of any size are balanced the same way
+NON_PREDATOR_FRACTION = 0.5
+PREDATOR_FACTOR = 2
+# Seed for rebalancing, so runs are repeatable
+RESAMPLE_RANDOM_STATE = 42
+
+# Stage name to elapsed seconds for the current run
+stage_timings = {}
+
+
+@contextmanager
+def timed_stage(name: str):
+    """
+    Times a stage of the training pipeline and records it in stage_timings
+    :param name: name of the stage
+    :return:
+    """
+    logging.info(f"Starting stage: {name}")
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_timings[name] = stage_timings.get(name, 0) + elapsed
+        logging.info(f"Finished stage: {name} in {elapsed:.2f}s")
 
 
 def plot_confusion_matrix(cm) -> None:
@@ -38,159 +80,371 @@ def plot_confusion_matrix(cm) -> None:
     plt.show()
 
 
-def clean_text(s):
+def load_predator_authors(predators_path: str) -> set:
+    """
+    Loads the predator author IDs that come with the training corpus
+    :param predators_path: txt file with one predator author ID per line
+    :return: set of predator author IDs
+    """
+    with open(predators_path, 'r') as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def iter_corpus_messages(corpus_path: str, predator_authors: set):
+    """
+    Streams (text, label) pairs from the PAN12 corpus XML without loading the whole tree into memory
+    :param corpus_path: PAN12 training corpus XML
+    :param predator_authors: set of predator author IDs
+    :return: generator of (message text, 1 if sent by a predator else 0)
+    """
+    context = ET.iterparse(corpus_path, events=('start', 'end'))
+    _, root = next(context)
+    for event, ele in context:
+        if event != 'end':
+            continue
+        if ele.tag == 'message':
+            text = ele.findtext('text')
+            if text is not None:
+                yield text, int((ele.findtext('author') or '').strip() in predator_authors)
+        elif ele.tag == 'conversation':
+            # Drop finished conversations so memory stays flat
+            root.clear()
+
+
+def build_cleaned_corpus(corpus_path: str, predators_path: str, cache_path: str, rebuild: bool = False) -> dict:
+    """
+    Cleans the corpus once and caches it on disk as CSV so later runs can skip parsing and cleaning.
+    Only messages that are more than one word after cleaning are kept. The cache is rebuilt if it was cleaned by
+    another version of the text normaliser
+    :param corpus_path: PAN12 training corpus XML
+    :param predators_path: txt file of predator author IDs
+    :param cache_path: CSV file to write the cleaned corpus to
+    :param rebuild: rebuild the cache even if it is up to date
+    :return: summary of the cached corpus, {'rows': int, 'label_counts': {label: count}, 'normaliser_version': int}
+    """
+    summary_path = cache_path + '.json'
+
+    # Reuse the cache if it is newer than the corpus and predator list and was cleaned by this normaliser
+    if not rebuild and os.path.exists(cache_path) and os.path.exists(summary_path):
+        cache_mtime = os.path.getmtime(cache_path)
+        with open(summary_path) as f:
+            summary = json.load(f)
+        if cache_mtime >= os.path.getmtime(corpus_path) and cache_mtime >= os.path.getmtime(predators_path) \
+                and summary.get('normaliser_version') == NORMALISER_VERSION:
+            logging.info(f"Using cached cleaned corpus {cache_path}")
+            return summary
+        logging.info(f"Rebuilding cleaned corpus {cache_path}, it is out of date")
+
+    predator_authors = load_predator_authors(predators_path)
+    logging.info(f"Loaded {len(predator_authors)} predator authors")
+
+    label_counts = {0: 0, 1: 0}
+    rows = 0
+
+    def write_batch(texts, labels):
+        """
+        Cleans a batch of messages with the vectorised cleaner and writes the multi-word ones
+        """
+        nonlocal rows
+        cleaned = clean_series(pd.Series(texts, dtype=object), NORMALISER_VERSION)
+        for cleaned_text, label in zip(cleaned, labels):
+            # Get only the rows where the text is more than 1 word
+            if ' ' in cleaned_text:
+                writer.writerow([cleaned_text, label])
+                label_counts[label] += 1
+                rows += 1
+
+    # Write to a temporary file first so an interrupted run never leaves a partial cache behind
+    temp_path = cache_path + '.tmp'
+    with open(temp_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['text', 'labels'])
+        batch_texts = []
+        batch_labels = []
+        for text, label in iter_corpus_messages(corpus_path, predator_authors):
+            batch_texts.append(text)
+            batch_labels.append(label)
+            if len(batch_texts) == CLEANING_BATCH_SIZE:
+                write_batch(batch_texts, batch_labels)
+                batch_texts = []
+                batch_labels = []
+        if batch_texts:
+            write_batch(batch_texts, batch_labels)
+    os.replace(temp_path, cache_path)
+
+    summary = {'rows': rows, 'label_counts': label_counts, 'normaliser_version': NORMALISER_VERSION}
+    with open(summary_path, 'w') as f:
+        json.dump(summary, f)
+    logging.info(f"Cached {rows} cleaned messages to {cache_path}: {label_counts}")
+
+    # Keys come back as strings when the summary is reloaded, keep them consistent
+    return json.loads(json.dumps(summary))
+
+
+def iter_cleaned_corpus(cache_path: str, chunk_size: int):
+    """
+    Streams the cached cleaned corpus in chunks
+    :param cache_path: cleaned corpus CSV
+    :param chunk_size: rows per chunk
+    :return: generator of DataFrames with 'text' and 'labels' columns
+    """
+    for chunk in pd.read_csv(cache_path, chunksize=chunk_size, keep_default_na=False,
+                             dtype={'text': str, 'labels': np.int8}):
+        yield chunk
+
+
+def is_test_row(text: str, test_percent: int) -> bool:
+    """
+    Deterministically assigns a message to the test split so streamed runs are repeatable
+    :param text: cleaned message text
+    :param test_percent: percentage of rows to hold out
+    :return: True if the row belongs to the test split
+    """
+    return zlib.crc32(text.encode('utf-8')) % 100 < test_percent
+
+
+def resample_corpus(df: pd.DataFrame, random_state: int = RESAMPLE_RANDOM_STATE) -> pd.DataFrame:
+    """
+    Rebalances the corpus by downsampling non-predator rows and upsampling predator rows.
+    Upsampling copies rows, so only ever resample training rows after splitting off the test rows, otherwise copies
+    of the same message end up on both sides of the split
+    :param df: cleaned training rows
+    :param random_state: seed so runs are repeatable
+    :return: rebalanced rows
+    """
+    # Separate sexual predator and non-predator rows
+    predator_rows = df[df['labels'] == 1]
+    non_predator_rows = df[df['labels'] == 0]
+
+    # Downsample non-predator (majority) class by 1/2
+    non_predator_rows_downsampled = resample(non_predator_rows,
+                                             replace=False,
+                                             n_samples=round(len(non_predator_rows) * NON_PREDATOR_FRACTION),
+                                             random_state=random_state)
+
+    # Upsample the predator (minority) class by x2
+    predator_rows_upsampled = resample(predator_rows,
+                                       replace=True,
+                                       n_samples=len(predator_rows) * PREDATOR_FACTOR,
+                                       random_state=random_state)
+
+    logging.info(f"Predator rows {predator_rows.shape}, non-predator rows {non_predator_rows.shape}, "
+                 f"downsampled non-predator rows {non_predator_rows_downsampled.shape}")
+
+    # Put downsampled and upsampled data back together
+    return pd.concat([non_predator_rows_downsampled, predator_rows_upsampled])
+
+
+def train_tfidf(cache_path: str, output_dir: str, plot: bool = False) -> None:
+    """
+    Trains the TF-IDF + logistic regression model in memory, as used by the detector
+    :param cache_path: cleaned corpus CSV
+    :param output_dir: directory to save the models to
+    :param plot: show the confusion matrix plot
+    :return:
+    """
+    with timed_stage('load cleaned corpus'):
+        df = pd.read_csv(cache_path, keep_default_na=False, dtype={'text': str, 'labels': np.int8})
+
+    # Test train split using 67% for training and 33% for testing
+    train_df, test_df = train_test_split(df, test_size=0.33, random_state=42)
+
+    with timed_stage('resample'):
+        # Only the training rows are rebalanced, so the test split is never seen in training
+        train_df = resample_corpus(train_df)
+    X_train_cleaned, y_train = train_df['text'], train_df['labels']
+    X_test_cleaned, y_test = test_df['text'], test_df['labels']
+
+    with timed_stage('vectorise'):
+        # TF-IDF instance
+        tf_idf = TfidfVectorizer(analyzer='word', ngram_range=(1, 3), max_features=100000)
+
+        # Apply TF-IDF to training and testing splits
+        X_train_tfidf = tf_idf.fit_transform(X_train_cleaned)
+        X_val_tfidf = tf_idf.transform(X_test_cleaned)
+
+    with timed_stage('fit'):
+        # Create LR model using the best parameters from hyperparameter tuning
+        log_reg = LogisticRegression(penalty='l2', C=10, multi_class='multinomial', solver='lbfgs',
+                                     random_state=100, tol=0.0001, max_iter=1000)
+
+        # Fit model to training data
+        log_reg.fit(X_train_tfidf, y_train)
+
+    with timed_stage('evaluate'):
+        # Make predictions on test split
+        y_pred = log_reg.predict(X_val_tfidf)
+        evaluate(y_test, y_pred, plot)
+
+    with timed_stage('save'):
+        save_models(tf_idf, log_reg, output_dir)
+
+
+def train_hashing(cache_path: str, summary: dict, output_dir: str, chunk_size: int, n_features: int,
+                  epochs: int, plot: bool = False) -> None:
+    """
+    Trains a hashing vectoriser + logistic regression (SGD) model out-of-core, one chunk of the cached corpus
+    at a time, so corpora bigger than RAM can be used
+    :param cache_path: cleaned corpus CSV
+    :param summary: summary returned by build_cleaned_corpus
+    :param output_dir: directory to save the models to
+    :param chunk_size: rows per chunk
+    :param n_features: number of hashed features
+    :param epochs: passes over the training split
+    :param plot: show the confusion matrix plot
+    :return:
+    """
+    # Hashing needs no fitting so every chunk can be vectorised independently
+    vectoriser = HashingVectorizer(analyzer='word', ngram_range=(1, 3), n_features=n_features,
+                                   alternate_sign=False, norm='l2')
+    classifier = SGDClassifier(loss='log_loss', penalty='l2', alpha=1e-6, random_state=100)
+
+    # Weight classes by their frequency instead of resampling, which needs the whole corpus in memory
+    label_counts = {int(label): count for label, count in summary['label_counts'].items()}
+    total = sum(label_counts.values())
+    class_weights = {label: total / (2 * count) for label, count in label_counts.items() if count}
+
+    test_percent = 33
+    for epoch in range(epochs):
+        with timed_stage('partial fit'):
+            for chunk in iter_cleaned_corpus(cache_path, chunk_size):
+                train_chunk = chunk[~chunk['text'].map(lambda t: is_test_row(t, test_percent))]
+                if train_chunk.empty:
+                    continue
+                X = vectoriser.transform(train_chunk['text'])
+                y = train_chunk['labels'].to_numpy()
+                sample_weight = np.array([class_weights[label] for label in y])
+                classifier.partial_fit(X, y, classes=np.array([0, 1]), sample_weight=sample_weight)
+        logging.info(f"Finished epoch {epoch + 1} of {epochs}")
+
+    with timed_stage('evaluate'):
+        # Only the labels and predictions are kept, never the test text
+        y_test = []
+        y_pred = []
+        for chunk in iter_cleaned_corpus(cache_path, chunk_size):
+            test_chunk = chunk[chunk['text'].map(lambda t: is_test_row(t, test_percent))]
+            if test_chunk.empty:
+                continue
+            y_test.append(test_chunk['labels'].to_numpy())
+            y_pred.append(classifier.predict(vectoriser.transform(test_chunk['text'])))
+        evaluate(np.concatenate(y_test), np.concatenate(y_pred), plot)
+
+    with timed_stage('save'):
+        save_models(vectoriser, classifier, output_dir)
+
+
+def evaluate(y_test, y_pred, plot: bool = False) -> None:
+    """
+    Prints evaluation metrics for predictions on the test split
+    :param y_test: true labels
+    :param y_pred: predicted labels
+    :param plot: show the confusion matrix plot
+    :return:
+    """
+    report = classification_report(y_test, y_pred)
+    conf_matrix = confusion_matrix(y_test, y_pred)
+    print(report)
+    print(conf_matrix)
+    if plot:
+        plot_confusion_matrix(conf_matrix)
+
+
+def save_models(vectoriser, classifier, output_dir: str) -> None:
+    """
+    Saves the trained models in the compact format used by the detector, a fitted TF-IDF vectoriser is
+    also pickled alongside the classifier for use with sklearn
+    :param vectoriser: fitted vectoriser
+    :param classifier: fitted classifier
+    :param output_dir: directory to save the models to
+    :return:
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Record which text normaliser the model was trained with, the detector refuses a model made with another
+    vectoriser.normaliser_version_ = NORMALISER_VERSION
+    export_compact_model(vectoriser, classifier, os.path.join(output_dir, 'compact'))
+
+    if isinstance(vectoriser, TfidfVectorizer):
+        # Save fitted TFIDF
+        with open(os.path.join(output_dir, 'tf_idf_vectoriser.pk'), 'wb') as fin:
+            pickle.dump(vectoriser, fin)
+
+        # Save the trained classifier to a pickle file
+        with open(os.path.join(output_dir, 'lr_model.pk'), 'wb') as fin:
+            pickle.dump(classifier, fin)
+    else:
+        # Pickles from an earlier TF-IDF run don't belong with this model, so mustn't be deployed with it
+        for name in MODEL_FILES[1:]:
+            if os.path.exists(os.path.join(output_dir, name)):
+                os.remove(os.path.join(output_dir, name))
+
+
+def deploy_models(output_dir: str, models_dir: str = MODELS_DIR) -> None:
+    """
+    Replaces the detector's models with trained ones
+    :param output_dir: directory the models were saved to by save_models
+    :param models_dir: directory the detector loads its models from
+    :return:
+    """
+    if not os.path.isdir(os.path.join(output_dir, 'compact')):
+        raise FileNotFoundError(f"No trained model in {output_dir}")
+    for name in MODEL_FILES:
+        source = os.path.join(output_dir, name)
+        if not os.path.exists(source):
+            continue
+        target = os.path.join(models_dir, name)
+        # Copied next to the target first so the detector never loads a partly copied model
+        staging = target + '.tmp'
+        if os.path.isdir(source):
+            shutil.rmtree(staging, ignore_errors=True)
+            shutil.copytree(source, staging)
+            shutil.rmtree(target, ignore_errors=True)
+        else:
+            shutil.copy2(source, staging)
+        os.replace(staging, target)
+    logging.info(f"Deployed the model trained in {output_dir} to {models_dir}")
+
+
+def main() -> None:
     """
-    Performs small amount of data cleaning while preserving potentially important features
-    :param s:
+    Command line entry point for retraining the grooming model
     :return:
     """
-    # Convert HTML characters to ASCII
-    s = html.unescape(s)
-    # Lemmatise
-    s = wnl.lemmatize(s)
-    # Remove any non-ASCII characters
-    s = ''.join([i if ord(i) < 128 else ' ' for i in s])
-    # Remove trailing whitespace
-    s = re.sub(r'\s+', ' ', s).strip()
-
-    return s
-
-
-# Get predator authors from the txt file that comes with the training corpus
-predator_authors = open('datasets/pan12-sexual-predator-identification-training-corpus-predators-2012-05-01.txt',
-                        'r').read()
-
-# Get the training corpus xml and parse it
-tree = ET.parse('datasets/pan12-sexual-predator-identification-training-corpus-2012-05-01.xml')
-root = tree.getroot()
-
-# Drop all but the text and label for each row
-text_messages = []
-labels = []
-text_message = []
-label = []
-for messages in root.iter('message'):
-    for ele in messages.findall('*'):
-        if ele.tag == 'author':
-            label.append(int(ele.text in predator_authors))
-        elif ele.tag == 'text':
-            text_message.append(ele.text)
-for i in range(len(text_message)):
-    if text_message[i] != None:
-        text_messages.append(text_message[i])
-        labels.append(label[i])
-
-# Combine text and label columns
-df = pd.DataFrame({'text': text_messages, "labels": labels})
-print(df.info())
-
-# Drop NaNs
-df.dropna(subset=['text'], inplace=True)
-df.reset_index(drop=True, inplace=True)
-print(df.info())
-
-# Perform limited text cleaning
-df['text'] = df['text'].apply(clean_text)
-df.info()
-
-# Get only the rows where the text is more than 1 word
-df_sub = df[df['text'].apply(lambda t: len(t.split()) > 1)]
-df_sub.index = range(0, df_sub.shape[0])
-print(df_sub.shape)
-
-# Separate sexual predator and non-predator rows
-predator_rows = df_sub[df_sub['labels'] == 1]
-non_predator_rows = df_sub[df_sub['labels'] == 0]
-
-# Downsample non-predator (majority) class by 1/2
-non_predator_rows_downsampled = resample(non_predator_rows,
-                                         replace=False,
-                                         n_samples=315769)
-
-# Upsample the predator (minority) class by x2
-predator_rows_upsampled = resample(predator_rows,
-                                   replace=True,
-                                   n_samples=61032)
-
-# Put downsampled and upsampled data back together
-df_sub = pd.concat([non_predator_rows_downsampled, predator_rows_upsampled])
-print(predator_rows.shape)
-print(non_predator_rows.shape)
-print(non_predator_rows_downsampled.shape)
-
-# Test train split using 67% for training and 33% for testing
-X_train_cleaned, X_test_cleaned, y_train, y_test = train_test_split(df_sub['text'], df_sub['labels'], test_size=0.33,
-                                                                    random_state=42)
-
-# TF-IDF instance
-tf_idf = TfidfVectorizer(analyzer='word', ngram_range=(1, 3), max_features=100000)
-
-# Apply TF-IDF to training and testing splits
-X_train_tfidf = tf_idf.fit_transform(X_train_cleaned)
-
-# # Save fitted TFIDF
-# with open('models/tf_idf_vectoriser.pk', 'wb') as fin:
-#     pickle.dump(tf_idf, fin)
-
-X_val_tfidf = tf_idf.transform(X_test_cleaned)
-
-# Create LR model using the best parameters from hyperparameter tuning
-log_reg = LogisticRegression(penalty='l2', C=10, multi_class='multinomial', solver='lbfgs', random_state=100,
-                             tol=0.0001,
-                             max_iter=1000)
-
-# Fit model to training data
-log_reg.fit(X_train_tfidf, y_train)
-
-# # Save the trained classifier to a pickle file
-# with open('models/lr_model.pk', 'wb') as fin:
-#     pickle.dump(log_reg, fin)
-
-
-# Make predictions on test split
-y_pred = log_reg.predict(X_val_tfidf)
-
-# Get evaluation metrics
-report = classification_report(y_test, y_pred)
-conf_matrix = confusion_matrix(y_test, y_pred)
-print(report)
-print(conf_matrix)
-plot_confusion_matrix(conf_matrix)
-
-
-# -- Below is the grid search used for hyperparameter tuning --
-
-# # Define the parameters for grid search
-# param_grid = {'C': [100, 10, 1.0, 0.1, 0.01],
-#               'tol': [1e-4, 1e-3, 1e-2, 1e-1]}
-#
-# # Create a GridSearchCV object
-# grid_search = GridSearchCV(LogisticRegression(penalty='l2', multi_class='multinomial', solver='lbfgs', random_state=42, max_iter=1000),
-#                            param_grid, cv=10, verbose=True)
-#
-# # Fit the GridSearchCV object to the training data
-# grid_search.fit(X_train_tfidf, y_train)
-#
-# # Print the best parameters found
-# print("Best parameters found:", grid_search.best_params_)
-#
-# # Get the best model
-# best_model = grid_search.best_estimator_
-#
-# # Predict on the validation set using the best model
-# y_pred = best_model.predict(X_val_tfidf)
-#
-# # Evaluate the model
-# report = classification_report(y_test, y_pred)
-# conf_matrix = confusion_matrix(y_test, y_pred)
-#
-# print(report)
-# print(conf_matrix)
-
-# loaded_tfidf = pickle.load(open("models/tf_idf.pickle", "rb"))
-# loaded_lr = pickle.load(open("models/lr_classifier.pickle", "rb"))
-#
-# X_val_loaded = loaded_tfidf.transform(X_test_cleaned)
-# y_pred_loaded = loaded_lr.predict(X_val_loaded)
-#
-# print(classification_report(y_test, y_pred_loaded))
+    parser = argparse.ArgumentParser(description="Train the grooming detection model on the PAN12 corpus")
+    parser.add_argument('--corpus', default=CORPUS_XML, help="PAN12 training corpus XML")
+    parser.add_argument('--predators', default=PREDATORS_TXT, help="PAN12 predator author IDs")
+    parser.add_argument('--cache', default=CLEANED_CORPUS_CSV, help="where to cache the cleaned corpus")
+    parser.add_argument('--rebuild-cache', action='store_true', help="rebuild the cleaned corpus cache")
+    parser.add_argument('--output', default=TRAINING_OUTPUT_DIR, help="directory to save the trained models to")
+    parser.add_argument('--deploy', action='store_true',
+                        help="replace the detector's models with the trained ones once training finishes")
+    parser.add_argument('--mode', choices=['tfidf', 'hashing'], default='tfidf',
+                        help="in-memory TF-IDF training, or out-of-core hashing training for large corpora")
+    parser.add_argument('--chunk-size', type=int, default=100000, help="rows per chunk in hashing mode")
+    parser.add_argument('--n-features', type=int, default=2 ** 20, help="hashed features in hashing mode")
+    parser.add_argument('--epochs', type=int, default=3, help="passes over the corpus in hashing mode")
+    parser.add_argument('--plot', action='store_true', help="show the confusion matrix")
+    args = parser.parse_args()
+
+    with timed_stage('build cleaned corpus'):
+        summary = build_cleaned_corpus(args.corpus, args.predators, args.cache, args.rebuild_cache)
+
+    if args.mode == 'tfidf':
+        train_tfidf(args.cache, args.output, args.plot)
+    else:
+        train_hashing(args.cache, summary, args.output, args.chunk_size, args.n_features, args.epochs, args.plot)
+
+    if args.deploy:
+        deploy_models(args.output)
+    else:
+        print(f"Trained model saved to {args.output}, pass --deploy to replace the detector's models with it")
+
+    # Timing output per stage
+    print("Stage timings:")
+    for name, elapsed in stage_timings.items():
+        print(f"  {name:<24}{elapsed:>10.2f}s")
+    print(f"  {'total':<24}{sum(stage_timings.values()):>10.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import scipy.sparse
+from joblib import Parallel, delayed
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import precision_recall_fscore_support
+from sklearn.model_selection import StratifiedKFold
+from src.ai.grooming_detection.compactmodel import CompactGroomingModel, export_compact_model
+from src.ai.grooming_detection.training.ml import build_cleaned_corpus, resample_corpus, timed_stage, \
+    stage_timings, CORPUS_XML, PREDATORS_TXT, CLEANED_CORPUS_CSV, DATASETS_DIR, NON_PREDATOR_FRACTION, \
+    PREDATOR_FACTOR, RESAMPLE_RANDOM_STATE
+
+logging.basicConfig(level=logging.INFO)
+
+# Where vectorised folds and results are written by default
+FOLD_CACHE_DIR = os.path.join(DATASETS_DIR, 'fold-cache')
+RESULTS_JSON = os.path.join(DATASETS_DIR, 'tuning-results.json')
+
+# Number of messages latency is measured over
+LATENCY_MESSAGES = 1000
+
+
+def fold_cache_key(cache_path: str, n_splits: int, fold: int, vectoriser_params: dict, resampled: bool,
+                   random_state: int) -> str:
+    """
+    Fingerprint of everything that changes a vectorised fold, so stale caches are never reused
+    :param cache_path: cleaned corpus CSV
+    :param n_splits: number of folds
+    :param fold: fold index
+    :param vectoriser_params: TfidfVectorizer parameters
+    :param resampled: whether the fold's training rows were rebalanced
+    :param random_state: seed for rebalancing
+    :return: hex digest
+    """
+    stat = os.stat(cache_path)
+    key = json.dumps([os.path.abspath(cache_path), stat.st_size, stat.st_mtime, n_splits, fold,
+                      sorted(vectoriser_params.items()),
+                      ['train-fold', NON_PREDATOR_FRACTION, PREDATOR_FACTOR, random_state] if resampled else None],
+                     default=str)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+
+def vectorise_folds(df: pd.DataFrame, cache_path: str, cache_dir: str, n_splits: int, vectoriser_params: dict,
+                    resampled: bool, random_state: int = RESAMPLE_RANDOM_STATE) -> [dict]:
+    """
+    Fits the TF-IDF vectoriser once per fold and caches the vectorised train/validation matrices on disk.
+    Every grid point for that fold then reuses the cached matrices instead of refitting TF-IDF
+    :param df: cleaned corpus with 'text' and 'labels' columns
+    :param cache_path: cleaned corpus CSV the frame came from, used for the cache key
+    :param cache_dir: directory to cache vectorised folds in
+    :param n_splits: number of folds
+    :param vectoriser_params: TfidfVectorizer parameters
+    :param resampled: rebalance each fold's training rows, validation rows keep the corpus' own balance
+    :param random_state: seed for rebalancing
+    :return: list of fold dictionaries with the cached file paths
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    folds = []
+    splitter = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=42)
+    for fold, (train_index, val_index) in enumerate(splitter.split(df['text'], df['labels'])):
+        key = fold_cache_key(cache_path, n_splits, fold, vectoriser_params, resampled, random_state)
+        paths = {name: os.path.join(cache_dir, f"{key}-{name}") for name in
+                 ['X_train.npz', 'X_val.npz', 'y_train.npy', 'y_val.npy', 'val_text.json', 'vectoriser.json']}
+        folds.append({'fold': fold, 'key': key, 'paths': paths})
+
+        if all(os.path.exists(path) for path in paths.values()):
+            logging.info(f"Using cached vectorised fold {fold} ({key})")
+            continue
+
+        # Rebalance after splitting, upsampled copies of a message must never reach the validation rows
+        train_df = df.iloc[train_index]
+        if resampled:
+            train_df = resample_corpus(train_df, random_state)
+
+        vectoriser = TfidfVectorizer(analyzer='word', **vectoriser_params)
+        X_train = vectoriser.fit_transform(train_df['text'])
+        X_val = vectoriser.transform(df['text'].iloc[val_index])
+        scipy.sparse.save_npz(paths['X_train.npz'], X_train)
+        scipy.sparse.save_npz(paths['X_val.npz'], X_val)
+        np.save(paths['y_train.npy'], train_df['labels'].to_numpy())
+        np.save(paths['y_val.npy'], df['labels'].iloc[val_index].to_numpy())
+
+        # Keep a sample of raw validation text and the fitted vocabulary for latency and size measurements
+        with open(paths['val_text.json'], 'w') as f:
+            json.dump(df['text'].iloc[val_index[:LATENCY_MESSAGES]].tolist(), f)
+        with open(paths['vectoriser.json'], 'w') as f:
+            json.dump({'vocabulary': {term: int(column) for term, column in vectoriser.vocabulary_.items()},
+                       'idf': vectoriser.idf_.tolist()}, f)
+        logging.info(f"Vectorised and cached fold {fold} ({key}) with {X_train.shape[1]} features")
+    return folds
+
+
+def fit_and_score(fold: dict, classifier_params: dict) -> dict:
+    """
+    Fits a classifier on one cached fold and scores it on the fold's validation split.
+    Runs inside a joblib worker so only paths and parameters are sent to it
+    :param fold: fold dictionary from vectorise_folds
+    :param classifier_params: LogisticRegression parameters
+    :return: metrics, plus the fitted weights so latency and size can be measured afterwards
+    """
+    paths = fold['paths']
+    X_train = scipy.sparse.load_npz(paths['X_train.npz'])
+    X_val = scipy.sparse.load_npz(paths['X_val.npz'])
+    y_train = np.load(paths['y_train.npy'])
+    y_val = np.load(paths['y_val.npy'])
+
+    classifier = LogisticRegression(penalty='l2', multi_class='multinomial', solver='lbfgs', random_state=100,
+                                    max_iter=1000, **classifier_params)
+    start = time.perf_counter()
+    classifier.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - start
+
+    y_pred = classifier.predict(X_val)
+    precision, recall, f1, _ = precision_recall_fscore_support(y_val, y_pred, average='binary', zero_division=0)
+    return {
+        'fold': fold['fold'],
+        'precision': float(precision),
+        'recall': float(recall),
+        'f1': float(f1),
+        'fit_seconds': fit_seconds,
+        'classifier': classifier,
+    }
+
+
+def measure_deployment(fold: dict, vectoriser_params: dict, classifier) -> dict:
+    """
+    Exports a fitted model in the compact format and measures its size and inference latency
+    :param fold: fold dictionary from vectorise_folds
+    :param vectoriser_params: TfidfVectorizer parameters the fold was vectorised with
+    :param classifier: classifier fitted on the fold
+    :return: model size in bytes and latency per 1k messages in milliseconds
+    """
+    paths = fold['paths']
+    with open(paths['vectoriser.json']) as f:
+        fitted = json.load(f)
+    with open(paths['val_text.json']) as f:
+        messages = json.load(f)
+
+    # Rebuild the fitted vectoriser from the cached vocabulary rather than refitting it
+    vectoriser = TfidfVectorizer(analyzer='word', **vectoriser_params)
+    vectoriser.vocabulary_ = fitted['vocabulary']
+    vectoriser.idf_ = np.asarray(fitted['idf'])
+
+    model_dir = tempfile.mkdtemp(prefix='grooming-model-')
+    try:
+        export_compact_model(vectoriser, classifier, model_dir)
+        size_bytes = sum(os.path.getsize(os.path.join(model_dir, name)) for name in os.listdir(model_dir))
+        model = CompactGroomingModel(model_dir)
+
+        # Detector path, one message at a time through the compact model
+        start = time.perf_counter()
+        for message in messages:
+            model.predict(message)
+        compact_ms = (time.perf_counter() - start) * 1000
+
+        # Batched sklearn path
+        start = time.perf_counter()
+        classifier.predict_proba(vectoriser.transform(messages))
+        sklearn_ms = (time.perf_counter() - start) * 1000
+    finally:
+        shutil.rmtree(model_dir, ignore_errors=True)
+
+    scale = LATENCY_MESSAGES / max(len(messages), 1)
+    return {
+        'model_size_bytes': size_bytes,
+        'latency_ms_per_1k_compact': compact_ms * scale,
+        'latency_ms_per_1k_sklearn_batch': sklearn_ms * scale,
+    }
+
+
+def pareto_front(results: [dict]) -> [int]:
+    """
+    Finds the grid points no other point beats on both F1 and latency
+    :param results: aggregated grid results
+    :return: indices of the non-dominated results, fastest first
+    """
+    front = []
+    for i, result in enumerate(results):
+        dominated = any(
+            other['f1_mean'] >= result['f1_mean'] and
+            other['latency_ms_per_1k_compact'] <= result['latency_ms_per_1k_compact'] and
+            (other['f1_mean'] > result['f1_mean'] or
+             other['latency_ms_per_1k_compact'] < result['latency_ms_per_1k_compact'])
+            for j, other in enumerate(results) if j != i)
+        if not dominated:
+            front.append(i)
+    return sorted(front, key=lambda i: results[i]['latency_ms_per_1k_compact'])
+
+
+def expand_grid(grid: dict) -> [dict]:
+    """
+    Expands a parameter grid into every combination
+    :param grid: parameter name to list of values
+    :return: list of parameter dictionaries
+    """
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def run_search(cache_path: str, cache_dir: str, results_path: str, n_splits: int, n_jobs: int,
+               vectoriser_grid: dict, classifier_grid: dict, resampled: bool,
+               random_state: int = RESAMPLE_RANDOM_STATE) -> dict:
+    """
+    Runs the grid search and writes the results JSON
+    :param cache_path: cleaned corpus CSV
+    :param cache_dir: directory to cache vectorised folds in
+    :param results_path: JSON file to write results to
+    :param n_splits: number of folds
+    :param n_jobs: joblib workers, -1 for all cores
+    :param vectoriser_grid: TfidfVectorizer parameter grid
+    :param classifier_grid: LogisticRegression parameter grid
+    :param resampled: rebalance the training rows of each fold
+    :param random_state: seed for rebalancing
+    :return: results dictionary
+    """
+    with timed_stage('load cleaned corpus'):
+        df = pd.read_csv(cache_path, keep_default_na=False, dtype={'text': str, 'labels': np.int8})
+
+    results = []
+    for vectoriser_params in expand_grid(vectoriser_grid):
+        with timed_stage('vectorise folds'):
+            folds = vectorise_folds(df, cache_path, cache_dir, n_splits, vectoriser_params, resampled, random_state)
+
+        classifier_points = expand_grid(classifier_grid)
+        with timed_stage('grid search'):
+            scores = Parallel(n_jobs=n_jobs, verbose=5)(
+                delayed(fit_and_score)(fold, classifier_params)
+                for classifier_params in classifier_points for fold in folds)
+
+        with timed_stage('measure latency and size'):
+            for i, classifier_params in enumerate(classifier_points):
+                point_scores = scores[i * len(folds):(i + 1) * len(folds)]
+                # Latency and size are measured sequentially so workers don't skew the timings
+                deployment = measure_deployment(folds[0], vectoriser_params, point_scores[0]['classifier'])
+                result = {
+                    'vectoriser_params': {k: list(v) if isinstance(v, tuple) else v
+                                          for k, v in vectoriser_params.items()},
+                    'classifier_params': classifier_params,
+                    'folds': [{k: v for k, v in score.items() if k != 'classifier'} for score in point_scores],
+                }
+                for metric in ['precision', 'recall', 'f1', 'fit_seconds']:
+                    values = [score[metric] for score in point_scores]
+                    result[f"{metric}_mean"] = float(np.mean(values))
+                    result[f"{metric}_std"] = float(np.std(values))
+                result.update(deployment)
+                results.append(result)
+                logging.info(f"{result['vectoriser_params']} {classifier_params}: F1 {result['f1_mean']:.4f}, "
+                             f"{result['latency_ms_per_1k_compact']:.1f}ms per 1k messages, "
+                             f"{result['model_size_bytes'] / 2 ** 20:.1f}MB")
+
+    output = {
+        'corpus': os.path.abspath(cache_path),
+        'n_splits': n_splits,
+        'resampled': resampled,
+        'random_state': random_state,
+        'results': results,
+        'best_f1': int(np.argmax([result['f1_mean'] for result in results])) if results else None,
+        'pareto_front': pareto_front(results),
+        'stage_timings': dict(stage_timings),
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(results_path)), exist_ok=True)
+    with open(results_path, 'w') as f:
+        json.dump(output, f, indent=2)
+    logging.info(f"Tuning results written to {results_path}")
+    return output
+
+
+def main() -> None:
+    """
+    Command line entry point for the grooming classifier hyperparameter search
+    :return:
+    """
+    parser = argparse.ArgumentParser(description="Parallel hyperparameter search for the grooming classifier")
+    parser.add_argument('--corpus', default=CORPUS_XML, help="PAN12 training corpus XML")
+    parser.add_argument('--predators', default=PREDATORS_TXT, help="PAN12 predator author IDs")
+    parser.add_argument('--cache', default=CLEANED_CORPUS_CSV, help="where to cache the cleaned corpus")
+    parser.add_argument('--fold-cache', default=FOLD_CACHE_DIR, help="where to cache vectorised folds")
+    parser.add_argument('--results', default=RESULTS_JSON, help="JSON file to write results to")
+    parser.add_argument('--folds', type=int, default=5, help="number of cross validation folds")
+    parser.add_argument('--jobs', type=int, default=-1, help="parallel workers, -1 for all cores")
+    parser.add_argument('--no-resample', action='store_true', help="don't rebalance the training rows of each fold")
+    parser.add_argument('--seed', type=int, default=RESAMPLE_RANDOM_STATE, help="random seed for rebalancing")
+    parser.add_argument('--C', type=float, nargs='+', default=[100, 10, 1.0, 0.1, 0.01])
+    parser.add_argument('--tol', type=float, nargs='+', default=[1e-4, 1e-3, 1e-2, 1e-1])
+    parser.add_argument('--max-features', type=int, nargs='+', default=[100000])
+    parser.add_argument('--ngram-max', type=int, nargs='+', default=[3])
+    args = parser.parse_args()
+
+    with timed_stage('build cleaned corpus'):
+        build_cleaned_corpus(args.corpus, args.predators, args.cache)
+
+    vectoriser_grid = {'ngram_range': [(1, n) for n in args.ngram_max], 'max_features': args.max_features}
+    classifier_grid = {'C': args.C, 'tol': args.tol}
+    output = run_search(args.cache, args.fold_cache, args.results, args.folds, args.jobs, vectoriser_grid,
+                        classifier_grid, not args.no_resample, args.seed)
+
+    # Summary table, the accuracy/speed trade-off is what models should be picked on
+    print(f"{'#':>3} {'ngrams':>7} {'features':>9} {'C':>8} {'tol':>8} {'F1':>7} {'prec':>7} {'recall':>7} "
+          f"{'ms/1k':>8} {'MB':>6}")
+    for i, result in enumerate(output['results']):
+        marker = '*' if i in output['pareto_front'] else ' '
+        print(f"{i:>3}{marker}{str(result['vectoriser_params']['ngram_range']):>7} "
+              f"{result['vectoriser_params']['max_features']:>9} {result['classifier_params']['C']:>8g} "
+              f"{result['classifier_params']['tol']:>8g} {result['f1_mean']:>7.4f} {result['precision_mean']:>7.4f} "
+              f"{result['recall_mean']:>7.4f} {result['latency_ms_per_1k_compact']:>8.1f} "
+              f"{result['model_size_bytes'] / 2 ** 20:>6.1f}")
+    print("* on the F1/latency Pareto front")
+
+
+if __name__ == '__main__':
+    main()
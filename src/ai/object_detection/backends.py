@@ -0,0 +1,125 @@
+import argparse
+import importlib.util
+import logging
+import os
+from ultralytics import YOLO
+
+logging.basicConfig(level=logging.INFO)
+
+# Inference backends for the YOLO model
+BACKEND_AUTO = 'auto'
+BACKEND_PYTORCH = 'pytorch'
+BACKEND_ONNX = 'onnx'
+BACKEND_OPENVINO = 'openvino'
+BACKENDS = [BACKEND_AUTO, BACKEND_PYTORCH, BACKEND_ONNX, BACKEND_OPENVINO]
+
+# Environment variable for choosing the backend, defaults to auto
+BACKEND_ENV_VAR = 'CST_OBJECT_DETECTION_BACKEND'
+
+# Exported artifact suffix and the packages needed to export and run each CPU backend.
+# Packages are checked up front so exporting never tries to install anything
+EXPORT_BACKENDS = {
+    BACKEND_OPENVINO: ('_openvino_model', ['openvino']),
+    BACKEND_ONNX: ('.onnx', ['onnx', 'onnxruntime']),
+}
+
+
+def exported_model_path(weights_path: str, backend: str) -> str:
+    """
+    Path an exported model is cached at, next to the PyTorch weights
+    :param weights_path: path to the .pt weights
+    :param backend: export backend
+    :return: path of the exported file or directory
+    """
+    suffix, _ = EXPORT_BACKENDS[backend]
+    return os.path.splitext(weights_path)[0] + suffix
+
+
+def available_backends() -> [str]:
+    """
+    Backends whose packages are installed, in order of preference for CPU inference
+    :return: list of backends, always ending with pytorch
+    """
+    available = [backend for backend, (_, packages) in EXPORT_BACKENDS.items()
+                 if all(importlib.util.find_spec(package) is not None for package in packages)]
+    return available + [BACKEND_PYTORCH]
+
+
+def export_model(weights_path: str, backend: str) -> str:
+    """
+    Exports the YOLO model for a CPU backend, next to the PyTorch weights where load_model looks for it
+    :param weights_path: path to the .pt weights
+    :param backend: one of EXPORT_BACKENDS
+    :return: path of the exported file or directory
+    """
+    if backend not in EXPORT_BACKENDS:
+        raise ValueError(f"Object detection model can't be exported to '{backend}', expected one of "
+                         f"{', '.join(EXPORT_BACKENDS)}")
+    if backend not in available_backends():
+        raise ValueError(f"Object detection backend '{backend}' is not installed, install "
+                         f"{' and '.join(EXPORT_BACKENDS[backend][1])} to export to it")
+    logging.info(f"Exporting object detection model to {backend}")
+    # Dynamic input size so photos and video frames can be inferred at different sizes
+    return YOLO(weights_path).export(format=backend, dynamic=True)
+
+
+def load_model(weights_path: str, backend: str = None) -> (YOLO, str):
+    """
+    Loads the YOLO model with the requested backend if it has been exported, see export_model.
+    Falls back to the PyTorch weights if the backend isn't installed or exported, or loading fails
+    :param weights_path: path to the .pt weights
+    :param backend: one of BACKENDS, defaults to the CST_OBJECT_DETECTION_BACKEND environment variable or auto
+    :return: loaded model and the backend actually used
+    """
+    backend = backend or os.environ.get(BACKEND_ENV_VAR, BACKEND_AUTO)
+    if backend not in BACKENDS:
+        logging.warning(f"Unknown object detection backend '{backend}', using {BACKEND_AUTO}")
+        backend = BACKEND_AUTO
+
+    available = available_backends()
+    if backend == BACKEND_AUTO:
+        candidates = available[:-1]
+    elif backend == BACKEND_PYTORCH:
+        candidates = []
+    elif backend not in available:
+        logging.warning(f"Object detection backend '{backend}' is not installed, using {BACKEND_PYTORCH}")
+        candidates = []
+    else:
+        candidates = [backend]
+
+    for candidate in candidates:
+        exported_path = exported_model_path(weights_path, candidate)
+        if not os.path.exists(exported_path):
+            # Only exported on request, as exporting takes a while and writes next to the weights
+            logging.info(f"No {candidate} object detection model at {exported_path}, export it with "
+                         f"python -m src.ai.object_detection.backends --export {candidate}")
+            continue
+        try:
+            model = YOLO(exported_path, task='detect')
+            logging.info(f"Using {candidate} object detection backend from {exported_path}")
+            return model, candidate
+        except Exception as e:
+            logging.warning(f"Could not use {candidate} object detection backend: {str(e)}")
+
+    logging.info(f"Using {BACKEND_PYTORCH} object detection backend from {weights_path}")
+    return YOLO(weights_path), BACKEND_PYTORCH
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the object detection model for faster CPU inference")
+    parser.add_argument('--export', nargs='*', choices=list(EXPORT_BACKENDS), metavar='BACKEND',
+                        help=f"Backends to export to, one or more of {', '.join(EXPORT_BACKENDS)}, every installed "
+                             f"backend if none are given")
+    parser.add_argument('--weights', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models',
+                                                          'yolov8n.pt'),
+                        help="PyTorch weights to export")
+    args = parser.parse_args()
+    if args.export is None:
+        parser.error("nothing to do, pass --export")
+
+    for backend in args.export or available_backends()[:-1]:
+        print(f"Exported {backend} model to {export_model(args.weights, backend)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+import logging
+import queue
+import threading
+import cv2
+from src.ai.object_detection.framesampling import FrameSampler
+
+logging.basicConfig(level=logging.INFO)
+
+# Marks the end of the video in the frame queue
+_END_OF_VIDEO = object()
+
+
+class _DecoderError:
+    """
+    Carries an exception raised in the decoder thread over to the consumer
+    """
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class FramePipeline:
+    """
+    Decodes video frames on a background thread while the caller runs inference on the previous ones.
+    The frame queue is bounded so the decoder waits when inference falls behind rather than filling memory
+    """
+
+    def __init__(self, sampler: FrameSampler, queue_size: int = 32, max_side: int = None):
+        """
+        :param sampler: decides which frames are decoded
+        :param queue_size: most frames held between the decoder and inference
+        :param max_side: if set, frames are downscaled in the decoder so their longest side is at most this
+        """
+        self.sampler = sampler
+        self.queue_size = max(1, queue_size)
+        self.max_side = max_side
+
+    def iter_batches(self, video_path: str, batch_size: int = 8):
+        """
+        Yields the sampled frames of a video in mini-batches, in order
+        :param video_path: path to the video file
+        :param batch_size: most frames in each batch, the last batch may be smaller
+        :return: generator of lists of (frame index, timestamp in seconds, frame)
+        """
+        frames = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        decoder = threading.Thread(target=self._decode, args=(video_path, frames, stop),
+                                   name='frame-decoder', daemon=True)
+        decoder.start()
+
+        try:
+            batch = []
+            while True:
+                item = frames.get()
+                if item is _END_OF_VIDEO:
+                    break
+                if isinstance(item, _DecoderError):
+                    raise item.error
+                batch.append(item)
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+        finally:
+            # Stop the decoder if inference failed or the caller stopped early, emptying the queue so it isn't
+            # left blocked on a full queue
+            stop.set()
+            while decoder.is_alive():
+                try:
+                    frames.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            decoder.join()
+
+    def _decode(self, video_path: str, frames: queue.Queue, stop: threading.Event) -> None:
+        """
+        Decoder thread, puts sampled frames on the queue followed by an end marker
+        :param video_path: path to the video file
+        :param frames: bounded frame queue
+        :param stop: set when the consumer has finished
+        :return:
+        """
+        sampled_frames = self.sampler.iter_frames(video_path)
+        try:
+            for frame_index, timestamp, frame in sampled_frames:
+                if self.max_side is not None:
+                    frame = self.downscale(frame, self.max_side)
+                if not self._put(frames, (frame_index, timestamp, frame), stop):
+                    return
+            self._put(frames, _END_OF_VIDEO, stop)
+        except Exception as e:
+            logging.error(f"Failed to decode video {video_path}: {str(e)}")
+            self._put(frames, _DecoderError(e), stop)
+        finally:
+            # Releases the video capture if the consumer stopped early
+            sampled_frames.close()
+
+    @staticmethod
+    def _put(frames: queue.Queue, item, stop: threading.Event) -> bool:
+        """
+        Puts an item on the queue, waiting while it's full unless the consumer has stopped
+        :param frames: bounded frame queue
+        :param item: item to put
+        :param stop: set when the consumer has finished
+        :return: False if the consumer stopped before the item could be put
+        """
+        while not stop.is_set():
+            try:
+                frames.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    @staticmethod
+    def downscale(frame, max_side: int):
+        """
+        Shrinks a frame so its longest side is at most max_side, keeping the aspect ratio
+        :param frame: BGR frame
+        :param max_side: longest side in pixels
+        :return: downscaled frame, or the original if it's already small enough
+        """
+        height, width = frame.shape[:2]
+        scale = max_side / max(height, width)
+        if scale >= 1:
+            return frame
+        return cv2.resize(frame, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
@@ -0,0 +1,186 @@
+import logging
+import subprocess
+import cv2
+
+logging.basicConfig(level=logging.INFO)
+
+# Frame sampling strategies for video object detection
+SAMPLE_ALL = 'all'
+SAMPLE_EVERY_N = 'every_n'
+SAMPLE_FPS = 'fps'
+SAMPLE_KEYFRAMES = 'keyframes'
+SAMPLE_SCENE_CHANGE = 'scene_change'
+SAMPLING_STRATEGIES = [SAMPLE_ALL, SAMPLE_EVERY_N, SAMPLE_FPS, SAMPLE_KEYFRAMES, SAMPLE_SCENE_CHANGE]
+
+# Size frames are shrunk to before their histogram is taken for scene change detection
+HISTOGRAM_SIZE = (64, 36)
+
+
+class FrameSampler:
+    """
+    Selects which frames of a video are passed to object detection.
+    Every frame is still decoded, as grab() decodes for most codecs and later frames depend on earlier ones, but
+    frames that aren't selected skip conversion to an image and, by far the most costly part, inference
+    """
+
+    def __init__(self, strategy: str = SAMPLE_FPS, every_n: int = 10, target_fps: float = 5.0,
+                 scene_threshold: float = 0.3, max_gap_seconds: float = 2.0):
+        """
+        :param strategy: one of SAMPLING_STRATEGIES
+        :param every_n: frame interval for 'every_n'
+        :param target_fps: frames per second of video to sample for 'fps'
+        :param scene_threshold: Bhattacharyya histogram distance (0-1) that counts as a scene change
+        :param max_gap_seconds: longest time 'scene_change' goes without sampling a frame, so static scenes are
+        still looked at
+        """
+        if strategy not in SAMPLING_STRATEGIES:
+            raise ValueError(f"Unknown frame sampling strategy '{strategy}', expected one of {SAMPLING_STRATEGIES}")
+        self.strategy = strategy
+        self.every_n = max(1, int(every_n))
+        self.target_fps = target_fps
+        self.scene_threshold = scene_threshold
+        self.max_gap_seconds = max_gap_seconds
+        # Counters from the last video sampled
+        self.frames_read = 0
+        self.frames_sampled = 0
+
+    def iter_frames(self, video_path: str):
+        """
+        Reads a video and yields the sampled frames
+        :param video_path: path to the video file
+        :return: generator of (frame index, timestamp in seconds, frame)
+        """
+        self.frames_read = 0
+        self.frames_sampled = 0
+
+        cap = cv2.VideoCapture(video_path)
+        try:
+            video_fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+            is_selected = self._selector(video_path, video_fps)
+
+            frame_index = 0
+            # Grab each frame, only retrieving the ones that are selected as a BGR image
+            while cap.grab():
+                self.frames_read += 1
+                if self.strategy == SAMPLE_SCENE_CHANGE:
+                    # Scene change needs every frame's pixels but only looks at a tiny version of them
+                    ret, frame = cap.retrieve()
+                    if ret and is_selected(frame_index, frame):
+                        self.frames_sampled += 1
+                        yield frame_index, frame_index / video_fps, frame
+                elif is_selected(frame_index, None):
+                    ret, frame = cap.retrieve()
+                    if ret:
+                        self.frames_sampled += 1
+                        yield frame_index, frame_index / video_fps, frame
+                frame_index += 1
+        finally:
+            cap.release()
+
+        logging.info(f"Sampled {self.frames_sampled} of {self.frames_read} frames from {video_path} "
+                     f"using '{self.strategy}'")
+
+    def _selector(self, video_path: str, video_fps: float):
+        """
+        Builds the function deciding whether a frame is sampled
+        :param video_path: path to the video file
+        :param video_fps: frame rate of the video
+        :return: function taking (frame index, frame) and returning True if the frame should be sampled
+        """
+        if self.strategy == SAMPLE_ALL:
+            return lambda frame_index, frame: True
+
+        if self.strategy == SAMPLE_EVERY_N:
+            return lambda frame_index, frame: frame_index % self.every_n == 0
+
+        if self.strategy == SAMPLE_FPS:
+            return self._interval_selector(video_fps / self.target_fps)
+
+        if self.strategy == SAMPLE_KEYFRAMES:
+            keyframes = self.keyframe_indices(video_path, video_fps)
+            if not keyframes:
+                # Without ffprobe fall back to roughly one frame per second
+                logging.warning(f"No keyframes found for {video_path}, sampling one frame per second instead")
+                return self._interval_selector(video_fps)
+            return lambda frame_index, frame: frame_index in keyframes
+
+        return self._scene_change_selector(video_fps)
+
+    @staticmethod
+    def _interval_selector(step: float):
+        """
+        Selects frames at a fixed, possibly fractional, frame interval
+        :param step: frames between samples
+        :return: selector function
+        """
+        step = max(1.0, step)
+        next_sample = 0.0
+
+        def is_selected(frame_index, frame):
+            nonlocal next_sample
+            if frame_index >= next_sample:
+                next_sample += step
+                return True
+            return False
+
+        return is_selected
+
+    def _scene_change_selector(self, video_fps: float):
+        """
+        Selects frames whose colour histogram differs enough from the last selected frame
+        :param video_fps: frame rate of the video
+        :return: selector function
+        """
+        max_gap = max(1, int(video_fps * self.max_gap_seconds))
+        last_histogram = None
+        last_selected = 0
+
+        def is_selected(frame_index, frame):
+            nonlocal last_histogram, last_selected
+            histogram = self.frame_histogram(frame)
+            if (last_histogram is None or frame_index - last_selected >= max_gap
+                    or cv2.compareHist(last_histogram, histogram, cv2.HISTCMP_BHATTACHARYYA) > self.scene_threshold):
+                last_histogram = histogram
+                last_selected = frame_index
+                return True
+            return False
+
+        return is_selected
+
+    @staticmethod
+    def frame_histogram(frame):
+        """
+        Normalised hue/brightness histogram of a downscaled frame
+        :param frame: BGR frame
+        :return: histogram
+        """
+        small = cv2.resize(frame, HISTOGRAM_SIZE, interpolation=cv2.INTER_AREA)
+        hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+        histogram = cv2.calcHist([hsv], [0, 2], None, [16, 8], [0, 180, 0, 256])
+        return cv2.normalize(histogram, histogram)
+
+    @staticmethod
+    def keyframe_indices(video_path: str, video_fps: float) -> set:
+        """
+        Gets the frame indices of the video's keyframes using ffprobe
+        :param video_path: path to the video file
+        :param video_fps: frame rate of the video
+        :return: set of keyframe indices, empty if they couldn't be read
+        """
+        try:
+            cmd = ["ffprobe", "-v", "quiet", "-select_streams", "v:0", "-skip_frame", "nokey",
+                   "-show_entries", "frame=pts_time", "-of", "csv=p=0", video_path]
+            result = subprocess.run(cmd, capture_output=True, text=True)
+        except Exception as e:
+            # Exception occurred
+            logging.error(f"Failed to read keyframes from video: {str(e)}")
+            return set()
+
+        keyframes = set()
+        for line in result.stdout.splitlines():
+            try:
+                keyframes.add(int(round(float(line.strip(' ,')) * video_fps)))
+            except ValueError:
+                # Frames without a timestamp are reported as N/A
+                continue
+        return keyframes
@@ -1,12 +1,51 @@
+import logging
 import os
-from ultralytics import YOLO
+import time
 import cv2
+import numpy as np
+from PIL import Image
+from src.ai.object_detection.backends import load_model
+from src.ai.object_detection.framepipeline import FramePipeline
+from src.ai.object_detection.framesampling import FrameSampler, SAMPLE_FPS
+from src.ai.object_detection.tiling import choose_imgsz, merge_detections, tile_windows
+from src.ai.object_detection.trackaggregator import TrackAggregator
+from src.utility.utility import FileManager
+
+logging.basicConfig(level=logging.INFO)
 
 # Using a standard YOLOv8 model for object detection
 model_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'yolov8n.pt')
-model = YOLO(model_dir)
+# Loaded with an optimised CPU backend if one has been exported, falling back to PyTorch
+model, backend = load_model(model_dir)
 # Names of classes
 names = model.names
+# Videos are sampled at a few frames per second rather than running detection on every frame
+DEFAULT_SAMPLING_STRATEGY = SAMPLE_FPS
+# Inference size and confidence threshold used for photos and video frames
+PHOTO_IMGSZ = 1280
+PHOTO_CONF = 0.4
+VIDEO_IMGSZ = 640
+VIDEO_CONF = 0.5
+# Photo detection modes, see ObjectDetection.detect_objects_photo
+PHOTO_MODE_FIXED = 'fixed'
+PHOTO_MODE_ADAPTIVE = 'adaptive'
+PHOTO_MODE_TILED = 'tiled'
+PHOTO_MODES = [PHOTO_MODE_FIXED, PHOTO_MODE_ADAPTIVE, PHOTO_MODE_TILED]
+# Used for single photos and when detecting objects across all case media
+DEFAULT_PHOTO_MODE = os.environ.get('CST_PHOTO_MODE', PHOTO_MODE_ADAPTIVE)
+if DEFAULT_PHOTO_MODE not in PHOTO_MODES:
+    raise ValueError(f"Unknown photo detection mode {DEFAULT_PHOTO_MODE}, expected one of {', '.join(PHOTO_MODES)}")
+# Tiled mode is used on photos at least this many times the inference size, with tiles of the inference size
+TILE_MIN_SCALE = 1.5
+TILE_OVERLAP = 0.2
+TILE_BATCH_SIZE = 4
+TILE_NMS_IOU = 0.5
+# Milliseconds per photo after which no more tiles are started, None for no limit
+PHOTO_LATENCY_BUDGET_MS = float(os.environ['CST_PHOTO_LATENCY_BUDGET_MS']) \
+    if os.environ.get('CST_PHOTO_LATENCY_BUDGET_MS') else None
+# Identifies the weights, backend and settings stored detections were made with, so they're redone if any change
+model_version = (f"{os.path.splitext(os.path.basename(model_dir))[0]}-{FileManager.compute_md5_hash(model_dir)[:12]}"
+                 f"-{backend}-p{PHOTO_IMGSZ}@{PHOTO_CONF}-{DEFAULT_PHOTO_MODE}-v{VIDEO_IMGSZ}@{VIDEO_CONF}")
 
 
 class ObjectDetection:
@@ -29,92 +68,218 @@ class ObjectDetection:
     def __init__(self):
         pass
 
-    def detect_objects_photo(self, photo_path: str) -> str:
+    def detect_objects_photo(self, photo_path: str, mode: str = DEFAULT_PHOTO_MODE,
+                             latency_budget_ms: float = PHOTO_LATENCY_BUDGET_MS) -> str:
         """
         Detects objects in an image
         :param photo_path: photo to find objects in
+        :param mode: 'fixed' always infers at 1280, 'adaptive' picks the size from the photo's resolution and
+        'tiled' also runs overlapping tiles over very large photos
+        :param latency_budget_ms: time after which no more tiles are started, None for no limit
         :return: string with detected objects and confidence levels on their own lines
         """
 
         # Read image
-        image = cv2.imread(photo_path)
+        image = self.read_image(photo_path)
+        if image is None:
+            raise ValueError(f"Could not read image {os.path.basename(photo_path)}")
 
-        # Perform object detection on photo and get result
-        result = model.predict(image, imgsz=1280, conf=0.4)[0]
+        # Perform object detection on photo and get detections
+        detections = self.detect_photo(image, mode, latency_budget_ms)
 
         # Holds output string
         output = ''
 
-        # For each box get the object class and confidence
-        for box in result.boxes:
-            object_name = names[int(box.cls)]
-            conf_percentage = "{:.0%}".format(float(box.conf))
-            output += f"{object_name} - confidence {conf_percentage} \n"
+        # For each detection get the object class and confidence
+        for detection in detections:
+            conf_percentage = "{:.0%}".format(detection['confidence'])
+            output += f"{detection['class_name']} - confidence {conf_percentage} \n"
 
         return output
 
     @staticmethod
-    def detect_objects_video(video_path: str) -> str:
+    def read_image(photo_path: str):
         """
-        Detects objects in a video
-        :param video_path: path to the video file
-        :return: string with detected objects and confidence levels on their own lines
+        Reads an image for detection, through PIL for formats OpenCV can't read such as GIF
+        :param photo_path:
+        :return: BGR image, None if it can't be read
+        """
+        image = cv2.imread(photo_path)
+        if image is not None:
+            return image
+        try:
+            with Image.open(photo_path) as pil_image:
+                # Only the first frame of animated images
+                return cv2.cvtColor(np.asarray(pil_image.convert('RGB')), cv2.COLOR_RGB2BGR)
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            logging.error(f"Could not read image {photo_path} for object detection: {str(e)}")
+            return None
+
+    @staticmethod
+    def detect_photo(image, mode: str = DEFAULT_PHOTO_MODE,
+                     latency_budget_ms: float = PHOTO_LATENCY_BUDGET_MS) -> [dict]:
         """
+        Detects objects in a decoded image
+        :param image: BGR image
+        :param mode: one of PHOTO_MODES, see detect_objects_photo
+        :param latency_budget_ms: time after which no more tiles are started, None for no limit
+        :return: list of detection dictionaries, see detections_from_result
+        """
+        start = time.perf_counter()
+        height, width = image.shape[:2]
+
+        # Whole image pass, sized to the image unless the size is fixed
+        if mode == PHOTO_MODE_FIXED:
+            imgsz = PHOTO_IMGSZ
+        else:
+            imgsz = choose_imgsz(width, height, max_size=PHOTO_IMGSZ)
+        result = model.predict(image, imgsz=imgsz, conf=PHOTO_CONF, verbose=False)[0]
+
+        # Only tile images large enough that small objects are lost when shrunk to the inference size
+        if mode != PHOTO_MODE_TILED or max(width, height) <= PHOTO_IMGSZ * TILE_MIN_SCALE:
+            return ObjectDetection.detections_from_result(result)
+
+        # Boxes in full image pixels from the whole image and every tile
+        boxes = [tuple(box.xyxy[0].tolist()) for box in result.boxes]
+        scores = [float(box.conf) for box in result.boxes]
+        classes = [int(box.cls) for box in result.boxes]
+
+        windows = tile_windows(width, height, PHOTO_IMGSZ, TILE_OVERLAP)
+        for i in range(0, len(windows), TILE_BATCH_SIZE):
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if latency_budget_ms is not None and elapsed_ms >= latency_budget_ms:
+                logging.info(f"Latency budget of {latency_budget_ms}ms reached after {i} of {len(windows)} tiles")
+                break
+            batch = windows[i:i + TILE_BATCH_SIZE]
+            tiles = [image[y1:y2, x1:x2] for x1, y1, x2, y2 in batch]
+            for (x1, y1, _, _), tile_result in zip(batch, model.predict(tiles, imgsz=PHOTO_IMGSZ, conf=PHOTO_CONF,
+                                                                         verbose=False)):
+                for box in tile_result.boxes:
+                    bx1, by1, bx2, by2 = box.xyxy[0].tolist()
+                    boxes.append((bx1 + x1, by1 + y1, bx2 + x1, by2 + y1))
+                    scores.append(float(box.conf))
+                    classes.append(int(box.cls))
 
-        # Open the video file
-        cap = cv2.VideoCapture(video_path)
+        # Merge objects found in both the whole image and tiles, or in overlapping tiles
+        keep = merge_detections(boxes, scores, classes, TILE_NMS_IOU)
+        keep.sort(key=lambda index: scores[index], reverse=True)
+        return [{'class_name': names[classes[index]],
+                 'confidence': scores[index],
+                 'bbox': (boxes[index][0] / width, boxes[index][1] / height,
+                          boxes[index][2] / width, boxes[index][3] / height),
+                 'frame_index': None,
+                 'timestamp': None}
+                for index in keep]
+
+    @staticmethod
+    def detect_objects_video(video_path: str, strategy: str = DEFAULT_SAMPLING_STRATEGY, pipelined: bool = True,
+                             batch_size: int = 8, queue_size: int = 32, **sampling) -> [dict]:
+        """
+        Detects and tracks objects in a video
+        :param video_path: path to the video file
+        :param strategy: frame sampling strategy, one of framesampling.SAMPLING_STRATEGIES
+        :param pipelined: decode frames on a background thread while inference runs
+        :param batch_size: frames taken from the decode queue at a time when pipelined
+        :param queue_size: most decoded frames waiting for inference when pipelined
+        :param sampling: options passed to FrameSampler, e.g. every_n, target_fps, scene_threshold
+        :return: tracked object records, see TrackAggregator.records
+        """
+        sampler = FrameSampler(strategy, **sampling)
+        if pipelined:
+            # Frames are downscaled to the inference size by the decoder thread
+            batches = FramePipeline(sampler, queue_size, max_side=VIDEO_IMGSZ).iter_batches(video_path, batch_size)
+        else:
+            batches = ([sampled] for sampled in sampler.iter_frames(video_path))
 
-        # Will store results from the detection
-        all_results = []
-        ret = True
+        # Aggregates each tracked object as frames arrive
+        aggregator = TrackAggregator(names)
 
-        # Loop through each frame of the video
-        while ret:
-            # Read a frame from the video
-            ret, frame = cap.read()
-            # If frame reading successful then detect and track objects in frame
-            if ret:
+        # Loop through each batch of sampled frames of the video
+        for batch in batches:
+            # Tracking has to see frames one at a time and in order to keep IDs consistent
+            for frame_index, timestamp, frame in batch:
                 # Detect and track objects
-                results = model.track(frame, persist=True, imgsz=640, conf=0.5)
-                all_results.append(results)
-
-        # List of tuples (id, object name, confidence level)
-        inc_tuples = []
-        # Iterate through results from object detection across video frames
-        for results in all_results:
-            result = results[0]
-            # Iterate through each detection box in the frame
-            for box in result.boxes:
-                # Check if box.id is not None
-                if box.id is not None:
-                    # Format a string output for classes of object found and confidence
-                    object_name = names[int(box.cls)]
-                    object_tuple = (int(box.id), object_name, float(box.conf))
-                    inc_tuples.append(object_tuple)
-
-        # Accumulating confidence scores
-        accumulated_scores = {}
-
-        # Iterate through inc_tuples to accumulate confidence scores
-        for object_tuple in inc_tuples:
-            id_, object_name, conf_score = object_tuple
-            key = (id_, object_name)
-            if key in accumulated_scores:
-                accumulated_scores[key].append(conf_score)
+                result = model.track(frame, persist=True, imgsz=VIDEO_IMGSZ, conf=VIDEO_CONF, verbose=False)[0]
+                aggregator.update_result(result, timestamp, frame_index)
+
+        return aggregator.records()
+
+    @staticmethod
+    def detect_objects_batch(photo_paths: [str], mode: str = DEFAULT_PHOTO_MODE,
+                             latency_budget_ms: float = PHOTO_LATENCY_BUDGET_MS) -> dict:
+        """
+        Detects objects in a batch of images, passing photos inferred at the same size to the model together
+        :param photo_paths: photos to find objects in
+        :param mode: one of PHOTO_MODES, see detect_objects_photo
+        :param latency_budget_ms: time per tiled photo after which no more tiles are started, None for no limit
+        :return: dictionary of photo path to list of detection dictionaries, see detections_from_result, None for
+        photos that couldn't be read
+        """
+        # Read images, skipping any that can't be decoded
+        images = {}
+        detections = {}
+        for photo_path in photo_paths:
+            image = ObjectDetection.read_image(photo_path)
+            if image is None:
+                detections[photo_path] = None
+            else:
+                images[photo_path] = image
+
+        # Group photos by inference size, photos large enough to tile are detected on their own
+        groups = {}
+        for photo_path, image in images.items():
+            height, width = image.shape[:2]
+            if mode == PHOTO_MODE_TILED and max(width, height) > PHOTO_IMGSZ * TILE_MIN_SCALE:
+                detections[photo_path] = ObjectDetection.detect_photo(image, mode, latency_budget_ms)
+            elif mode == PHOTO_MODE_FIXED:
+                groups.setdefault(PHOTO_IMGSZ, []).append(photo_path)
             else:
-                accumulated_scores[key] = [conf_score]
+                groups.setdefault(choose_imgsz(width, height, max_size=PHOTO_IMGSZ), []).append(photo_path)
 
-        # Create a new list of tuples with (id, object name, average confidence score)
-        new_inc_tuples = []
-        for key, conf_scores in accumulated_scores.items():
-            id_, object_name = key
-            avg_conf_score = sum(conf_scores) / len(conf_scores)
-            new_inc_tuples.append((id_, object_name, avg_conf_score))
+        for imgsz, paths in groups.items():
+            results = model.predict([images[photo_path] for photo_path in paths], imgsz=imgsz, conf=PHOTO_CONF,
+                                    verbose=False)
+            for photo_path, result in zip(paths, results):
+                detections[photo_path] = ObjectDetection.detections_from_result(result)
 
-        # Create string of objects and confidences
-        output = ""
-        for obj_tuple in new_inc_tuples:
-            id_, object_name, avg_confidence = obj_tuple
-            output += f"{object_name} - average confidence {avg_confidence:.0%}\n"
+        return {photo_path: detections[photo_path] for photo_path in photo_paths}
 
-        return output
+    @staticmethod
+    def detect_objects_video_frames(video_path: str, strategy: str = DEFAULT_SAMPLING_STRATEGY, batch_size: int = 8,
+                                    **sampling) -> [dict]:
+        """
+        Detects objects in the sampled frames of a video, batching frames through the model.
+        Objects aren't tracked so every detection in every sampled frame is returned
+        :param video_path: path to the video file
+        :param strategy: frame sampling strategy, one of framesampling.SAMPLING_STRATEGIES
+        :param batch_size: frames passed to the model at a time
+        :param sampling: options passed to FrameSampler, e.g. every_n, target_fps, scene_threshold
+        :return: list of detection dictionaries, see detections_from_result
+        """
+        pipeline = FramePipeline(FrameSampler(strategy, **sampling), max_side=VIDEO_IMGSZ)
+        detections = []
+        for batch in pipeline.iter_batches(video_path, batch_size):
+            results = model.predict([frame for _, _, frame in batch], imgsz=VIDEO_IMGSZ, conf=VIDEO_CONF,
+                                    verbose=False)
+            for (frame_index, timestamp, _), result in zip(batch, results):
+                detections.extend(ObjectDetection.detections_from_result(result, frame_index, timestamp))
+        return detections
+
+    @staticmethod
+    def detections_from_result(result, frame_index: int = None, timestamp: float = None) -> [dict]:
+        """
+        Converts a YOLO result into detection dictionaries.
+        Bounding boxes are normalised to 0-1 so they don't depend on the size the frame was inferred at
+        :param result: YOLO result for one image
+        :param frame_index: video frame the result is from, None for photos
+        :param timestamp: seconds into the video the frame is from, None for photos
+        :return: list of dictionaries with class_name, confidence, bbox (x1, y1, x2, y2), frame_index and timestamp
+        """
+        detections = []
+        for box in result.boxes:
+            detections.append({'class_name': names[int(box.cls)],
+                               'confidence': float(box.conf),
+                               'bbox': tuple(float(value) for value in box.xyxyn[0]),
+                               'frame_index': frame_index,
+                               'timestamp': timestamp})
+        return detections
@@ -0,0 +1,67 @@
+import math
+import cv2
+import numpy as np
+
+
+def choose_imgsz(width: int, height: int, min_size: int = 320, max_size: int = 1280, stride: int = 32) -> int:
+    """
+    Picks an inference size from the source resolution, so small screenshots aren't upscaled and large photos
+    are capped
+    :param width: image width in pixels
+    :param height: image height in pixels
+    :param min_size: smallest inference size
+    :param max_size: largest inference size
+    :param stride: model stride the size must be a multiple of
+    :return: inference size
+    """
+    size = math.ceil(max(width, height) / stride) * stride
+    return max(min_size, min(max_size, size))
+
+
+def tile_windows(width: int, height: int, tile_size: int, overlap: float) -> [(int, int, int, int)]:
+    """
+    Splits an image into overlapping square tiles covering all of it
+    :param width: image width in pixels
+    :param height: image height in pixels
+    :param tile_size: tile side in pixels
+    :param overlap: fraction of a tile shared with its neighbour, so objects on a boundary are whole in one tile
+    :return: list of (x1, y1, x2, y2) tile windows
+    """
+    return [(x, y, min(x + tile_size, width), min(y + tile_size, height))
+            for y in _tile_starts(height, tile_size, overlap)
+            for x in _tile_starts(width, tile_size, overlap)]
+
+
+def _tile_starts(length: int, tile_size: int, overlap: float) -> [int]:
+    """
+    Start offsets of tiles along one side, the last tile is aligned to the edge
+    """
+    if length <= tile_size:
+        return [0]
+    step = max(1, int(tile_size * (1 - overlap)))
+    starts = list(range(0, length - tile_size, step))
+    starts.append(length - tile_size)
+    return starts
+
+
+def merge_detections(boxes: [(float, float, float, float)], scores: [float], classes: [int],
+                     iou_threshold: float = 0.5) -> [int]:
+    """
+    Class-wise non-maximum suppression over detections from the full image and its tiles
+    :param boxes: (x1, y1, x2, y2) boxes in full image pixels
+    :param scores: confidence for each box
+    :param classes: class for each box
+    :param iou_threshold: overlap above which the less confident box of the same class is dropped
+    :return: indices of the boxes to keep
+    """
+    keep = []
+    classes = np.asarray(classes)
+    for cls in np.unique(classes):
+        indices = np.flatnonzero(classes == cls)
+        # NMSBoxes takes (x, y, width, height)
+        class_boxes = [[boxes[i][0], boxes[i][1], boxes[i][2] - boxes[i][0], boxes[i][3] - boxes[i][1]]
+                       for i in indices]
+        class_scores = [float(scores[i]) for i in indices]
+        kept = cv2.dnn.NMSBoxes(class_boxes, class_scores, 0.0, iou_threshold)
+        keep.extend(int(indices[k]) for k in np.array(kept).flatten())
+    return sorted(keep)
@@ -0,0 +1,86 @@
+class _TrackStats:
+    """
+    Running statistics for one tracked object
+    """
+
+    __slots__ = ('count', 'total_confidence', 'max_confidence', 'first_seen', 'last_seen', 'first_frame',
+                 'last_frame')
+
+    def __init__(self, confidence: float, timestamp: float, frame_index: int):
+        self.count = 1
+        self.total_confidence = confidence
+        self.max_confidence = confidence
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.first_frame = frame_index
+        self.last_frame = frame_index
+
+
+class TrackAggregator:
+    """
+    Aggregates tracked object detections as video frames arrive, keeping one small record per (track ID, class)
+    so memory doesn't depend on video length
+    """
+
+    def __init__(self, names: dict):
+        """
+        :param names: model class index to class name
+        """
+        self.names = names
+        self.tracks = {}
+
+    def update(self, track_id: int, class_index: int, confidence: float, timestamp: float, frame_index: int) -> None:
+        """
+        Adds a single detection of a tracked object
+        :param track_id: tracker ID
+        :param class_index: model class index
+        :param confidence: detection confidence
+        :param timestamp: seconds into the video
+        :param frame_index: video frame the detection is in
+        :return:
+        """
+        key = (track_id, class_index)
+        stats = self.tracks.get(key)
+        if stats is None:
+            self.tracks[key] = _TrackStats(confidence, timestamp, frame_index)
+            return
+        stats.count += 1
+        stats.total_confidence += confidence
+        if confidence > stats.max_confidence:
+            stats.max_confidence = confidence
+        # Frames arrive in order so the latest detection is always the last seen
+        stats.last_seen = timestamp
+        stats.last_frame = frame_index
+
+    def update_result(self, result, timestamp: float, frame_index: int) -> None:
+        """
+        Adds every tracked detection in a YOLO tracking result, untracked boxes are ignored
+        :param result: YOLO result for one frame
+        :param timestamp: seconds into the video
+        :param frame_index: video frame of the result
+        :return:
+        """
+        boxes = result.boxes
+        if boxes.id is None:
+            return
+        # Convert each column once per frame rather than once per box
+        for track_id, class_index, confidence in zip(boxes.id.int().tolist(), boxes.cls.int().tolist(),
+                                                     boxes.conf.tolist()):
+            self.update(track_id, class_index, confidence, timestamp, frame_index)
+
+    def records(self) -> [dict]:
+        """
+        Aggregated tracked objects, in the order they first appeared
+        :return: list of dictionaries with track_id, class_name, count, mean_confidence, max_confidence,
+        first_seen, last_seen, first_frame and last_frame
+        """
+        return [{'track_id': track_id,
+                 'class_name': self.names[class_index],
+                 'count': stats.count,
+                 'mean_confidence': stats.total_confidence / stats.count,
+                 'max_confidence': stats.max_confidence,
+                 'first_seen': stats.first_seen,
+                 'last_seen': stats.last_seen,
+                 'first_frame': stats.first_frame,
+                 'last_frame': stats.last_frame}
+                for (track_id, class_index), stats in self.tracks.items()]
@@ -0,0 +1,304 @@
+import argparse
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from src.models.activitylog import ActivityLogModel
+from src.models.case import CaseModel
+from src.models.chatlog import ChatLogManager
+from src.models.incident import IncidentModel
+from src.models.ingest import IngestManager, INGESTED
+from src.models.victim_suspect import VictimModel, SuspectModel
+from src.utility.integrity import IntegrityVerifier, INTEGRITY_WORKERS, STATUS_PASSED
+from src.utility.progress import Progress
+from src.utility.utility import DatabaseManager, FileManager
+
+logging.basicConfig(level=logging.INFO)
+
+# Exit codes, the highest of all cases is returned
+EXIT_OK = 0
+EXIT_FINDINGS = 1  # finished, but found something needing attention e.g. failed integrity or skipped files
+EXIT_USAGE = 2     # bad arguments, as argparse exits with
+EXIT_ERROR = 3     # a case couldn't be opened or the command failed
+
+
+class CaseError(Exception):
+    """
+    Raised when a directory isn't a valid case
+    """
+
+
+def open_case(case_directory: str) -> None:
+    """
+    Opens a case without the UI, as opening one from the main window does
+    :param case_directory:
+    :return:
+    """
+    for folder in ['evidence', 'reports']:
+        if not os.path.isdir(os.path.join(case_directory, folder)):
+            raise CaseError(f"Missing {folder} folder in {case_directory}")
+    if not os.path.isfile(os.path.join(case_directory, 'cst.db')):
+        raise CaseError(f"Missing database file 'cst.db' in {case_directory}")
+
+    # Creates tables if they don't exist, else updates database file location in database manager
+    DatabaseManager().create_tables(case_directory)
+    FileManager().case_directory = case_directory
+    CaseModel().update()
+    VictimModel().update()
+    SuspectModel().update()
+    IncidentModel().update()
+
+
+def print_progress(event: dict) -> None:
+    """
+    Writes a progress event to stderr as a line of JSON, so a job scheduler can follow long running cases
+    :param event:
+    :return:
+    """
+    print(json.dumps(dict(event, case=FileManager().case_directory)), file=sys.stderr, flush=True)
+
+
+def set_workers(workers: int) -> None:
+    """
+    Sets the number of threads each stage uses within a case, read by the stages when they start
+    :param workers:
+    :return:
+    """
+    from src.models import metadata
+    from src.utility import pdfmanager, thumbnails
+    metadata.METADATA_WORKERS = workers
+    pdfmanager.REPORT_WORKERS = workers
+    thumbnails.THUMBNAIL_WORKERS = workers
+
+
+def ingest(options: dict) -> (dict, bool):
+    """
+    Adds files to the case as evidence
+    :param options: command line options
+    :return: result and whether any file was skipped
+    """
+    results = IngestManager().ingest_files(options['files'], copy=options['copy'], progress=options['progress'])
+    for result in results:
+        if result['status'] != INGESTED:
+            continue
+        if result['hash_set_matches']:
+            set_names = ', '.join(f"'{meta['name']}'" for meta in result['hash_set_matches'])
+            # Log activity
+            (ActivityLogModel().
+             insert(f"File '{result['file_name']}' matches hash sets {set_names}"))
+        # Log activity
+        (ActivityLogModel().
+         insert(f"New file uploaded '{result['path']}'"))
+
+    # Thumbnails are generated in the background, wait for them before exiting
+    from src.utility.thumbnails import ThumbnailCache
+    if ThumbnailCache().executor is not None:
+        ThumbnailCache().executor.shutdown(wait=True)
+        ThumbnailCache.executor = None
+
+    ingested = sum(result['status'] == INGESTED for result in results)
+    return {'ingested': ingested, 'skipped': len(results) - ingested, 'files': results}, ingested < len(results)
+
+
+def verify(options: dict) -> (dict, bool):
+    """
+    Checks every evidence file against its recorded hash
+    :param options: command line options
+    :return: result and whether any file didn't pass
+    """
+    report = IntegrityVerifier(workers=options['workers'] or INTEGRITY_WORKERS).verify(options['progress'])
+
+    # Log activity
+    (ActivityLogModel().
+     insert(IntegrityVerifier.summarise(report), action='integrity', derive_file=False))
+
+    files = [{'file_name': file_name, 'original_hash': original_hash, 'recomputed_hash': recomputed_hash,
+              'status': status} for file_name, original_hash, recomputed_hash, status in report['results']]
+    findings = report['counts'][STATUS_PASSED] < len(files)
+    return {'counts': report['counts'], 'seconds': report['seconds'], 'files': files}, findings
+
+
+def detect(options: dict) -> (dict, bool):
+    """
+    Runs object detection over case media and grooming detection over chat logs
+    :param options: command line options
+    :return: result and whether grooming was found or any file failed
+    """
+    run_all = not options['objects'] and not options['grooming']
+    result = {}
+    findings = False
+
+    if options['objects'] or run_all:
+        # Imported here so other commands don't need the detection model's dependencies
+        from src.models.detections import DetectionManager
+        summary = DetectionManager().detect_all_media(batch_size=options['batch_size'],
+                                                      progress=options['progress'])
+        result['objects'] = summary
+        findings = findings or summary['failed'] > 0
+
+        # Log activity
+        (ActivityLogModel().
+         insert(f"Detected objects in all media: {summary['processed']} processed, {summary['skipped']} skipped, "
+                f"{summary['duplicates']} duplicates, {summary['failed']} failed"))
+
+    if options['grooming'] or run_all:
+        chatlogs_dir = os.path.join(FileManager().case_directory, 'evidence', 'chatlogs')
+        grooming = {'detected': {}, 'unparsed': []}
+        for file_name in sorted(os.listdir(chatlogs_dir)) if os.path.isdir(chatlogs_dir) else []:
+            detected = ChatLogManager().detect_grooming(file_name, options['progress'])
+            if detected is None:
+                grooming['unparsed'].append(file_name)
+            elif detected:
+                grooming['detected'][file_name] = [message for message, _ in detected]
+        result['grooming'] = grooming
+        findings = findings or bool(grooming['detected'])
+
+        # Log activity
+        (ActivityLogModel().
+         insert(f"Detected grooming in {len(grooming['detected'])} chat logs from the command line"))
+
+    return result, findings
+
+
+def report(options: dict) -> (dict, bool):
+    """
+    Generates the PDF report of the case
+    :param options: command line options
+    :return: result, never any findings
+    """
+    from src.utility.pdfmanager import PDFManager, REPORT_IMAGE_DPI
+    result = PDFManager().create_pdf(options['dpi'] or REPORT_IMAGE_DPI)
+
+    # Log activity
+    (ActivityLogModel().
+     insert(f"Generated report '{result['path']}' in {result['seconds']:.1f}s, "
+            f"{result['size_bytes'] / 1e6:.1f} MB"))
+    return result, False
+
+
+COMMANDS = {
+    'ingest': ingest,
+    'verify': verify,
+    'detect': detect,
+    'report': report,
+}
+
+
+def run_case(command: str, case_directory: str, options: dict) -> dict:
+    """
+    Runs a command on one case, in its own process when cases run in parallel
+    :param command: ingest, verify, detect or report
+    :param case_directory:
+    :param options: command line options
+    :return: dictionary with the case, exit code, result and error
+    """
+    outcome = {'case': case_directory, 'exit_code': EXIT_OK, 'result': None, 'error': None}
+    # Progress is created here as it can't be passed to another process
+    options = dict(options, progress=Progress(print_progress) if options['progress'] else None)
+    try:
+        open_case(case_directory)
+        if options['workers']:
+            set_workers(options['workers'])
+        outcome['result'], findings = COMMANDS[command](options)
+        outcome['exit_code'] = EXIT_FINDINGS if findings else EXIT_OK
+    except CaseError as e:
+        logging.error(str(e))
+        outcome.update(exit_code=EXIT_ERROR, error=str(e))
+    except Exception as e:
+        logging.exception(f"{command} failed for {case_directory}")
+        outcome.update(exit_code=EXIT_ERROR, error=str(e))
+    finally:
+        if FileManager().case_directory is not None:
+            FileManager().flush_activity_log()
+    return outcome
+
+
+def summarise(command: str, outcome: dict) -> str:
+    """
+    Human readable summary of a case's outcome
+    :param command:
+    :param outcome: result of run_case
+    :return:
+    """
+    if outcome['error'] is not None:
+        return f"{outcome['case']}: {command} failed: {outcome['error']}"
+    result = outcome['result']
+    if command == 'ingest':
+        details = f"{result['ingested']} ingested, {result['skipped']} skipped"
+    elif command == 'verify':
+        details = ', '.join(f"{count} {status}" for status, count in result['counts'].items())
+    elif command == 'detect':
+        details = []
+        if 'objects' in result:
+            details.append(f"{result['objects']['processed']} media processed, "
+                           f"{result['objects']['detections']} detections")
+        if 'grooming' in result:
+            details.append(f"grooming in {len(result['grooming']['detected'])} chat logs")
+        details = ', '.join(details)
+    else:
+        details = f"{result['path']} in {result['seconds']:.1f}s"
+    return f"{outcome['case']}: {details}"
+
+
+def main(argv: [str] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m src.cli',
+                                     description="Process cases without the user interface, e.g. from a job scheduler")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    # Options shared by every command, given after the command e.g. verify --case DIR --json
+    case_parser = argparse.ArgumentParser(add_help=False)
+    case_parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    case_parser.add_argument('--progress', action='store_true', help="Write progress to stderr as lines of JSON")
+    case_parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                             help="Logging level, logs are written to stderr")
+    case_parser.add_argument('--case', action='append', required=True, dest='cases', metavar='DIR',
+                             help="Case directory, repeat to process several cases")
+    case_parser.add_argument('--jobs', type=int, default=1,
+                             help="Cases processed at once, each in its own process")
+    case_parser.add_argument('--workers', type=int, default=None,
+                             help="Threads used within each case for hashing, metadata, thumbnails and reports")
+
+    ingest_parser = subparsers.add_parser('ingest', parents=[case_parser], help="Add files to a case as evidence")
+    ingest_parser.add_argument('files', nargs='+', help="Chat logs and media to add")
+    ingest_parser.add_argument('--copy', action='store_true',
+                               help="Copy files into the case rather than moving them")
+
+    subparsers.add_parser('verify', parents=[case_parser], help="Check evidence against its recorded hashes")
+
+    detect_parser = subparsers.add_parser('detect', parents=[case_parser],
+                                          help="Detect objects in media and grooming in chat logs, both by default")
+    detect_parser.add_argument('--objects', action='store_true', help="Only detect objects")
+    detect_parser.add_argument('--grooming', action='store_true', help="Only detect grooming")
+    detect_parser.add_argument('--batch-size', type=int, default=8,
+                               help="Photos, or video frames, passed to the object detection model at a time")
+
+    report_parser = subparsers.add_parser('report', parents=[case_parser], help="Generate the PDF report")
+    report_parser.add_argument('--dpi', type=int, default=None, help="Resolution media is embedded at")
+
+    args = parser.parse_args(argv)
+    logging.getLogger().setLevel(args.log_level)
+    if args.command == 'ingest' and len(args.cases) > 1:
+        parser.error("ingest takes a single --case")
+    options = {key: value for key, value in vars(args).items() if key not in ['cases', 'command']}
+
+    # Each case runs in its own process when processing several at once, case state is per process
+    cases = [os.path.abspath(case) for case in args.cases]
+    if args.jobs > 1 and len(cases) > 1:
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            outcomes = list(executor.map(run_case, [args.command] * len(cases), cases, [options] * len(cases)))
+    else:
+        outcomes = [run_case(args.command, case, options) for case in cases]
+
+    exit_code = max(outcome['exit_code'] for outcome in outcomes)
+    if args.json:
+        print(json.dumps({'command': args.command, 'exit_code': exit_code, 'cases': outcomes}, indent=2,
+                         default=str))
+    else:
+        for outcome in outcomes:
+            print(summarise(args.command, outcome))
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,13 +1,30 @@
 import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from PIL import Image
+from src.controllers.task_runner import TaskRunner
 from src.models.activitylog import ActivityLogModel
 from src.models.flags import FlagManager
+from src.models.metadata import MetadataManager
 from src.utility.pdfmanager import PDFManager
-from src.utility.utility import DatabaseManager, FileManager
-from src.views.analysis_view import AnalysisView, FlaggedClogView, FlaggedMediaView
+from src.utility.perceptualhash import VIDEO_EXTENSIONS
+from src.utility.thumbnails import ThumbnailCache, DEFAULT_THUMBNAIL_SIZE
+from src.utility.utility import FileManager
+from src.views.analysis_view import AnalysisView, FlaggedClogView, FlaggedMediaView, PREVIEW_SIZE
 
 logging.basicConfig(level=logging.INFO)
 
+# Cards built each time the UI thread is free, so the tab stays responsive while rendering
+CARDS_PER_TICK = 5
+# Cards built straight away, the rest are built as the user scrolls down to them
+INITIAL_CARDS = 10
+# How often background results and the scroll position are checked
+POLL_INTERVAL_MS = 50
+# Worker threads loading media previews and metadata
+ANALYSIS_WORKERS = min(4, os.cpu_count() or 1)
+
 
 class AnalysisController:
     """
@@ -21,6 +38,19 @@ class AnalysisController:
         # Linking analysis controller to flag manager so flagged files can change as user flags/unflags
         FlagManager().controller = self
 
+        # Background loading of previews and metadata, results are applied to cards on the UI thread
+        self.executor = ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS, thread_name_prefix='analysis')
+        # Each render has an id so a render replaced by another, e.g. switching views, stops
+        self.render_id = 0
+        self.render_queue = []
+        self.render_started = None
+        self.render_timings = {}
+        # Cards waiting on background results, as (future, callback)
+        self.pending = []
+        # Metadata of all flagged media, loaded in the background
+        self.media_metadata = None
+        self.media_cards = {}
+
         # Bind selecting file in either
         self.view.clogs_button.configure(command=self.clogs_view)
         self.view.media_button.configure(command=self.media_view)
@@ -33,18 +63,7 @@ class AnalysisController:
         """
         self.view.highlight_button('clogs')
         self.view.clear_frame()
-        flagged_clogs = FlagManager().load_flagged_clogs()
-        for flagged_clog in flagged_clogs:
-            # File name
-            file_name = flagged_clog[0]
-            clogs_view = FlaggedClogView(self.view.frame, file_name=file_name)
-            # Flagged text from file
-            flagged_texts = FlagManager().load_flagged_text(file_name)
-            clogs_view.add_flagged_text(flagged_texts)
-            # Comments
-            clog_comments = DatabaseManager().fetch_evidence_desc_by_file_name(file_name)[0]
-            if clog_comments is not None:
-                clogs_view.add_comments(clog_comments)
+        self.start_render(FlagManager().load_flag_summaries('clog'), self.build_clog_card)
 
     def media_view(self):
         """
@@ -53,26 +72,153 @@ class AnalysisController:
         """
         self.view.highlight_button('media')
         self.view.clear_frame()
-        flagged_media = FlagManager().load_flagged_media_files()
-        for media_file in flagged_media:
-            file_path = os.path.join(FileManager().case_directory, 'evidence', 'media', media_file)
-            media_view = FlaggedMediaView(self.view.frame, file_name=media_file)
-            # Comments
-            media_comments = DatabaseManager().fetch_evidence_desc_by_file_name(media_file)[0]
-            if media_comments is not None:
-                media_view.add_comments(media_comments)
-            # EXIF / Metadata
-            exif = FileManager().extract_exif(file_path)
-            meta = FileManager().extract_metadata(file_path)
-            if exif == 'no exif found':
-                exif = ''
-            if meta == 'no metadata found':
-                meta = ''
+        summaries = FlagManager().load_flag_summaries('media')
+        self.media_metadata = None
+        self.media_cards = {}
+        self.start_render(summaries, self.build_media_card)
+
+        # Stored metadata of all flagged media in one query, extracted for any media without it
+        file_names = [summary['file_name'] for summary in summaries]
+        self.pending.append((self.executor.submit(MetadataManager().load_metadata, file_names), self.add_metadata))
+
+    def start_render(self, summaries: [dict], build_card: Callable[[dict], None]) -> None:
+        """
+        Starts building cards for flagged files a few at a time on the UI thread
+        :param summaries: flag summaries from FlagManager.load_flag_summaries
+        :param build_card: builds the card for a summary
+        :return:
+        """
+        self.render_id += 1
+        self.render_queue = list(summaries)
+        self.render_started = time.perf_counter()
+        self.render_timings = {'cards': len(summaries)}
+        self.pending = []
+        self.view.after(0, self.render_tick, self.render_id, build_card, 0)
+
+    def render_tick(self, render_id: int, build_card: Callable[[dict], None], built: int) -> None:
+        """
+        Builds the next few cards if they are near view and applies finished background results
+        :param render_id: render this tick belongs to
+        :param build_card: builds the card for a summary
+        :param built: number of cards built so far
+        :return:
+        """
+        if render_id != self.render_id:
+            return
+
+        # Build more cards if there are few or the user has scrolled near the bottom
+        if self.render_queue and (built < INITIAL_CARDS or self.view.near_bottom()):
+            for summary in self.render_queue[:CARDS_PER_TICK]:
+                build_card(summary)
+                built += 1
+            del self.render_queue[:CARDS_PER_TICK]
+            if 'first_card' not in self.render_timings:
+                self.render_timings['first_card'] = time.perf_counter() - self.render_started
+                logging.info(f"First flagged file card shown in {self.render_timings['first_card']:.3f}s")
+
+        # Apply background results that have finished
+        still_pending = []
+        for future, callback in self.pending:
+            if future.done():
+                try:
+                    callback(future.result())
+                except Exception as e:
+                    logging.error(f"Failed to load flagged file details: {str(e)}")
             else:
-                # Only add a newline if exif is not 'no exif found'
-                if exif != '':
-                    exif += '\n'
-            media_view.add_meta(exif + meta)
+                still_pending.append((future, callback))
+        self.pending = still_pending
+
+        # Cards in view are complete, the rest wait for the user to scroll
+        if not self.pending and 'visible_render' not in self.render_timings:
+            self.render_timings['visible_render'] = time.perf_counter() - self.render_started
+            logging.info(f"Rendered {built} of {self.render_timings['cards']} flagged file cards in "
+                         f"{self.render_timings['visible_render']:.3f}s")
+
+        if not self.pending and not self.render_queue:
+            self.render_timings['full_render'] = time.perf_counter() - self.render_started
+            logging.info(f"Rendered {built} flagged file cards in {self.render_timings['full_render']:.3f}s")
+            return
+        self.view.after(POLL_INTERVAL_MS, self.render_tick, render_id, build_card, built)
+
+    def build_clog_card(self, summary: dict) -> None:
+        """
+        Builds the card for a flagged chat log
+        :param summary: flag summary
+        :return:
+        """
+        clogs_view = FlaggedClogView(self.view.frame, file_name=summary['file_name'])
+        # Flagged text from file
+        clogs_view.add_flagged_text(summary['flagged_texts'])
+        # Comments
+        if summary['comments'] is not None:
+            clogs_view.add_comments(summary['comments'])
+
+    def build_media_card(self, summary: dict) -> None:
+        """
+        Builds the card for a flagged media file, its preview and metadata are filled in once loaded
+        :param summary: flag summary
+        :return:
+        """
+        file_name = summary['file_name']
+        media_view = FlaggedMediaView(self.view.frame, file_name=file_name)
+        self.media_cards[file_name] = media_view
+        # Comments
+        if summary['comments'] is not None:
+            media_view.add_comments(summary['comments'])
+        # Preview
+        self.pending.append((self.executor.submit(self.load_preview, file_name), media_view.add_preview))
+        # EXIF / Metadata, if already loaded
+        if self.media_metadata is not None:
+            media_view.add_meta(self.format_media_meta(self.media_metadata[file_name]))
+
+    def add_metadata(self, media_metadata: {str: dict}) -> None:
+        """
+        Fills in the metadata of the cards built so far, cards built later fill it in themselves
+        :param media_metadata: dictionary of file name to metadata
+        :return:
+        """
+        self.media_metadata = media_metadata
+        for file_name, media_view in self.media_cards.items():
+            media_view.add_meta(self.format_media_meta(media_metadata[file_name]))
+
+    @staticmethod
+    def load_preview(file_name: str) -> Image.Image:
+        """
+        Loads a media preview, run in the background
+        :param file_name: flagged media file name
+        :return: preview image, None if it couldn't be loaded
+        """
+        media_file_path = os.path.join(FileManager().case_directory, 'evidence', 'media', file_name)
+        try:
+            if os.path.splitext(file_name)[1].lower() in VIDEO_EXTENSIONS:
+                # Is video
+                return ThumbnailCache().get_thumbnail(media_file_path, *DEFAULT_THUMBNAIL_SIZE)
+            # Is photo, downscaled here so the UI thread never handles the full size image
+            with Image.open(media_file_path) as image:
+                image.thumbnail((PREVIEW_SIZE[0] * 2, PREVIEW_SIZE[1] * 2))
+                return image.copy()
+        except Exception as e:
+            logging.error(f"Failed to load preview of {file_name}: {str(e)}")
+            return None
+
+    @staticmethod
+    def format_media_meta(metadata: dict) -> str:
+        """
+        Formats the EXIF and metadata shown on a media card
+        :param metadata: stored metadata of the media file
+        :return:
+        """
+        exif = FileManager().format_exif(metadata.get('exif', {}))
+        meta = FileManager().format_metadata(metadata)
+        if exif == 'no exif found':
+            exif = ''
+        if meta == 'no metadata found':
+            meta = ''
+        else:
+            # Only add a newline if exif is not 'no exif found'
+            if exif != '':
+                exif += '\n'
+        return exif + meta
 
     def generate_report(self):
         """
@@ -80,16 +226,29 @@ class AnalysisController:
         :return:
         """
         self.view.highlight_button('report')
-        PDFManager().create_pdf()
+        TaskRunner().run_in_thread('report', "Generating report", lambda progress: PDFManager().create_pdf(),
+                                   on_done=self.log_report)
+
+    @staticmethod
+    def log_report(report: dict) -> None:
+        """
+        Logs a generated report
+        :param report: report details from PDFManager.create_pdf
+        :return:
+        """
         # Log activity
         (ActivityLogModel().
-         insert("Generated report"))
+         insert(f"Generated report '{report['path']}' in {report['seconds']:.1f}s, "
+                f"{report['size_bytes'] / 1e6:.1f} MB"))
 
     def load(self):
         """
         Logic for resetting the flag summaries when loaded
         :return:
         """
+        # Stop any render in progress
+        self.render_id += 1
+
         # Clear out the frame
         for frame in self.view.frame.winfo_children():
             frame.destroy()
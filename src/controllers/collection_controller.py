@@ -1,12 +1,14 @@
 import logging
-import mimetypes
 import os
 from asyncio import Event
 from tkinter import filedialog, messagebox
+import customtkinter
+from src.controllers.task_runner import TaskRunner
 from src.models.activitylog import ActivityLogModel
 from src.models.case import CaseModel
-from src.models.evidence import EvidenceModel
-from src.utility.utility import DatabaseManager, FileManager
+from src.models.ingest import IngestManager, INGESTED, SKIPPED_DUPLICATE_NAME, SKIPPED_MIME_MISMATCH
+from src.utility.hashsets import CATEGORY_ALERT, CATEGORY_KNOWN_BENIGN, HashSetManager
+from src.utility.utility import DatabaseManager
 from src.views.collection_view import CollectionView
 
 logging.basicConfig(level=logging.INFO)
@@ -24,6 +26,7 @@ class CollectionController:
         # Bindings to view
         self.view.file_upload_button.configure(command=self.upload_file)
         self.view.export_hashes_button.configure(command=self.export_hashes)
+        self.view.import_hash_set_button.configure(command=self.import_hash_set)
 
     def upload_file(self, event: Event = None) -> None:
         """
@@ -57,134 +60,61 @@ class CollectionController:
             filetypes=file_whitelist
         )
 
-        # Iterate through files and save
+        # Files are hashed, indexed and probed in the background
+        # Files added before cancelling are still reported so they are logged
         if file_paths:
-            for file_path in file_paths:
-                logging.info(f"Uploading file: {file_path}")
-
-                # Check no mismatch between expected MIME and true MIME types
-                if self.mime_extension_mismatch(file_path):
-                    messagebox.showerror('Error', 'Mismatch between file extension and MIME type detected for '
-                                                  'file: {}. Upload has been skipped for this file'.format(file_path))
-                    continue  # Skip to the next file if there's a MIME type mismatch
-
-                # Check if file with the same name already exists in the evidence table
-                existing_files = [entry['file_name'] for entry in DatabaseManager().fetch_evidence_filename_hash()]
-                if os.path.basename(file_path) in existing_files:
-                    logging.info(f"File '{file_path}' already exists, skipping upload")
-                    messagebox.showerror('Error',
-                                         'File with the same name already exists. Upload has been skipped '
-                                         'for this file. If you wish to add this file too then rename it and try '
-                                         'again.')
-                    continue  # Skip to the next file if the file already exists in the database
-
-                # Move file to appropriate evidence folder
-                destination_dir = self.move_file(file_path)
-
-                # Compute MD5 hash of file
-                new_file_path = f"{destination_dir}/{os.path.basename(file_path)}"
-                md5_hash = FileManager().compute_md5_hash(new_file_path)
-                logging.info("MD5 Hash computed for {}: {}".format(file_path, md5_hash))
-
-                # Store file details in db
-                self.save_evidence_to_db(os.path.basename(file_path), destination_dir, md5_hash)
-
-                # Update evidence viewer
-                self.update_evidence_view_box()
-
-                # Log activity
-                (ActivityLogModel().
-                 insert(f"New file uploaded '{new_file_path}'"))
+            TaskRunner().run_in_thread('ingest', f"Adding {len(file_paths)} files",
+                                       lambda progress: IngestManager().ingest_files(file_paths, progress=progress),
+                                       on_done=self.show_ingest_results, discard_cancelled=False)
 
-    @staticmethod
-    def mime_extension_mismatch(file_path: str) -> bool:
-        """
-        Compares file extension and MIME type to check for a mismatch
-        :param file_path: file path to check
-        :return: true if mismatch, false otherwise
-        """
-
-        # Get mime type of file
-        mime_type = mimetypes.guess_type(file_path)[0]
-        expected_mime_type, _ = mimetypes.guess_type(file_path, strict=False)
-
-        # Check if MIME type matches expected MIME type
-        if mime_type and expected_mime_type:
-            if mime_type != expected_mime_type:
-                logging.info(
-                    "Mismatch between true MIME type {} and expected MIME type {} for file: {}".
-                    format(mime_type, expected_mime_type, file_path))
-                return True
-            else:
-                logging.info("True MIME type matches expected MIME type for file: {}".format(file_path))
-                return False
-        else:
-            logging.info("Unable to determine MIME type or file extension for file: {}".format(file_path))
-            return True
-
-    @staticmethod
-    def move_file(file_path: str):
+    def show_ingest_results(self, results: [dict]) -> None:
         """
-        Logic for moving uploaded file to correct evidence folder
-        :param file_path:
+        Reports and logs the outcome of adding files
+        :param results: results of IngestManager.ingest_files
         :return:
         """
-
-        # Where case is stored
-        case_directory = FileManager().case_directory
-
-        # Define evidence folders
-        evidence_media_dir = os.path.join(case_directory, "evidence", "media")
-        evidence_chatlogs_dir = os.path.join(case_directory, "evidence", "chatlogs")
-
-        # Define which files are chatlogs and which are media
-        chatlog_filetypes = [".txt", ".json"]
-        # Images and videos
-        media_filetypes = [".jpg", ".jpeg", ".png", ".gif", ".bmp", ".mp4", ".mov", ".avi", ".mkv"]
-
-        # Check file extension
-        _, file_extension = os.path.splitext(file_path)
-
-        # Get destination directory based on extension
-        if file_extension.lower() in chatlog_filetypes:
-            # Move to evidence/chatlogs folder
-            FileManager().move_file(file_path, evidence_chatlogs_dir)
-            # Return evidence/chatlogs directory
-            return evidence_chatlogs_dir
-        elif file_extension.lower() in media_filetypes:
-            # Move to evidence/media folder
-            FileManager().move_file(file_path, evidence_media_dir)
-            # Return evidence/media directory
-            return evidence_media_dir
-        else:
-            # If the file type is not recognized, you may handle it accordingly.
-            logging.error("Unsupported file type:", file_extension)
-            # No directory to return, return nothing
-            return None
+        for result in results:
+            file_path = result['source']
+            if result['status'] == SKIPPED_MIME_MISMATCH:
+                messagebox.showerror('Error', 'Mismatch between file extension and MIME type detected for '
+                                              'file: {}. Upload has been skipped for this file'.format(file_path))
+                continue
+            if result['status'] == SKIPPED_DUPLICATE_NAME:
+                messagebox.showerror('Error',
+                                     'File with the same name already exists. Upload has been skipped '
+                                     'for this file. If you wish to add this file too then rename it and try '
+                                     'again.')
+                continue
+            if result['status'] != INGESTED:
+                messagebox.showerror('Error', f"Unsupported file type, upload has been skipped for file: "
+                                              f"{file_path}")
+                continue
+
+            if result['hash_set_matches']:
+                self.show_hash_set_matches(result['file_name'], result['hash_set_matches'])
+
+            # Log activity
+            (ActivityLogModel().
+             insert(f"New file uploaded '{result['path']}'"))
+
+        # Update evidence viewer
+        self.update_evidence_view_box()
 
     @staticmethod
-    def save_evidence_to_db(file_name, destination_dir, md5_hash) -> None:
+    def show_hash_set_matches(file_name: str, matches: [dict]) -> None:
         """
-        Save evidence info to the db
+        Warns about and logs a new file matching reference hash sets
         :param file_name: name of the file
-        :param destination_dir: evidence folder storing the file
-        :param md5_hash: hash of the file
+        :param matches: metadata of the matching hash sets
         :return:
         """
+        set_names = ', '.join(f"'{meta['name']}'" for meta in matches)
+        if any(meta['category'] == CATEGORY_ALERT for meta in matches):
+            messagebox.showwarning('Hash Set Match', f"File '{file_name}' matches alert hash set {set_names}")
 
-        # Get type (media/chatlog)
-        evidence_type = os.path.basename(destination_dir)
-
-        # Create evidence model instance
-        evidence = EvidenceModel(case_number=CaseModel().case_number,
-                                 file_name=file_name,
-                                 description=None,
-                                 evidence_type=evidence_type,
-                                 hash_value=md5_hash,
-                                 exif_data=None)
-
-        # Save instance to DB
-        evidence.save()
+        # Log activity
+        (ActivityLogModel().
+         insert(f"File '{file_name}' matches hash sets {set_names}"))
 
     def update_evidence_view_box(self) -> None:
         """
@@ -235,6 +165,67 @@ class CollectionController:
         (ActivityLogModel().
          insert(f"Media hashes exported to '{path}'"))
 
+    @staticmethod
+    def import_hash_set(event: Event = None) -> None:
+        """
+        Logic for importing a reference hash set, e.g. a known-benign or known-abuse-material list
+        :param event:
+        :return:
+        """
+
+        # Ask user for the hash list
+        source_path = filedialog.askopenfilename(
+            title="Select Hash Set",
+            filetypes=[("Hash lists", "*.txt *.csv *.md5"), ("All files", "*.*")]
+        )
+        if not source_path:
+            logging.info("Hash set import canceled by user.")
+            return
+
+        # Ask user for a name and what matches mean
+        input_dialog = customtkinter.CTkInputDialog(text="Enter a name for the hash set",
+                                                    title="Import Hash Set")
+        name = input_dialog.get_input()
+        if not name:
+            return
+        alert = messagebox.askyesno('Hash Set Category',
+                                    'Flag media matching this hash set?\n\n'
+                                    'Choose Yes for known-abuse-material sets, No for known-benign sets.')
+        category = CATEGORY_ALERT if alert else CATEGORY_KNOWN_BENIGN
+
+        # Parsed and its Bloom filter built in the background as reference lists can have millions of hashes
+        TaskRunner().run_in_thread('import_hash_set', f"Importing hash set '{name}'",
+                                   lambda progress: HashSetManager().import_hash_set(source_path, name, category,
+                                                                                     progress),
+                                   on_done=lambda meta: CollectionController.show_imported_hash_set(meta, source_path),
+                                   on_error=lambda e: CollectionController.show_hash_set_error(source_path, e))
+
+    @staticmethod
+    def show_imported_hash_set(meta: dict, source_path: str) -> None:
+        """
+        Reports and logs an imported hash set
+        :param meta: hash set metadata
+        :param source_path: hash list it was imported from
+        :return:
+        """
+        messagebox.showinfo('Hash Set Imported', f"Imported {meta['count']} hashes into '{meta['name']}'")
+
+        # Log activity
+        (ActivityLogModel().
+         insert(f"Imported {meta['category']} hash set '{meta['name']}' of {meta['count']} hashes from "
+                f"'{source_path}'"))
+
+    @staticmethod
+    def show_hash_set_error(source_path: str, error: Exception) -> None:
+        """
+        Reports a hash set that couldn't be imported
+        :param source_path: hash list being imported
+        :param error:
+        :return:
+        """
+        logging.error(f"Failed to import hash set from {source_path}: {str(error)}")
+        messagebox.showerror('Error', f"Failed to import hash set: {str(error)}")
+
     def load(self) -> None:
         """
         Logic for loading collection tab for the current case
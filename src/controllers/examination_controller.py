@@ -8,16 +8,19 @@ from tkinter import messagebox
 import customtkinter
 import cv2
 from PIL import Image
-from urlextract import URLExtract
 
-from src.ai.grooming_detection.groomingdetector import GroomingDetector
-from src.ai.object_detection.objectdetection import ObjectDetection
+from src.controllers.task_runner import TaskRunner
 from src.models.activitylog import ActivityLogModel
+from src.models.chatlog import ChatLogManager, detect_grooming_in_file
+from src.models.detections import DetectionManager
+from src.models.duplicates import DuplicateManager
 from src.models.flags import FlagManager
+from src.models.metadata import MetadataManager
+from src.utility.hexviewer import HexViewer
 from src.utility.utility import FileManager, DatabaseManager
 from src.views.examination_view import ExaminationView
 from src.views.ui_components.popups import EXIFPopup, ObjectsPopup, URLsPopup, UnflagTextPopup, MetaPopup, HexPopup, \
-    DetectedGroomingPopup
+    DetectedGroomingPopup, ObjectSearchPopup, DuplicatesPopup
 
 logging.basicConfig(level=logging.INFO)
 
@@ -40,6 +43,10 @@ class ExaminationController:
         self.view.exif_button.configure(command=self.extract_exif)
         self.view.metadata_button.configure(command=self.extract_meta)
         self.view.od_button.configure(command=self.detect_objects)
+        self.view.od_all_button.configure(command=self.detect_objects_all_media)
+        self.view.od_search_button.configure(command=self.find_media_with_object)
+        self.view.duplicates_button.configure(command=self.find_near_duplicates)
+        self.view.cluster_button.configure(command=self.cluster_near_duplicates)
         self.view.gd_button.configure(command=self.detect_grooming)
         self.view.search_button.configure(command=self.search_regex)
         self.view.find_urls.configure(command=self.extract_urls)
@@ -180,9 +187,18 @@ class ExaminationController:
 
         logging.info(f"Extracting EXIF models from {file_path}")
 
-        # Extract EXIF data
-        exif_data = FileManager().extract_exif(file_path)
+        # Stored EXIF data, extracted in the background for media added before metadata was stored
+        TaskRunner().run_in_thread(('exif', media_name), f"Extracting EXIF data from {media_name}",
+                                   lambda progress: MetadataManager().get_exif(media_name),
+                                   on_done=lambda exif_data: self.show_exif(media_name, exif_data))
 
+    def show_exif(self, media_name: str, exif_data: str) -> None:
+        """
+        Shows the EXIF data of a media file
+        :param media_name:
+        :param exif_data:
+        :return:
+        """
         # Popup to show EXIF models of image
         popup = EXIFPopup(media_name, self.view)
 
@@ -200,11 +216,19 @@ class ExaminationController:
         :return:
         """
         media_name = self.view.media_select.get()
-        file_path = self.get_current_media()
 
-        # Extract metadata from file
-        meta_data = FileManager().extract_metadata(file_path)
+        # Stored metadata of file, probed in the background for media added before metadata was stored
+        TaskRunner().run_in_thread(('metadata', media_name), f"Extracting metadata from {media_name}",
+                                   lambda progress: MetadataManager().get_metadata(media_name),
+                                   on_done=lambda meta_data: self.show_meta(media_name, meta_data))
 
+    def show_meta(self, media_name: str, meta_data: str) -> None:
+        """
+        Shows the metadata of a media file
+        :param media_name:
+        :param meta_data:
+        :return:
+        """
         # Show popup
         popup = MetaPopup(media_name, self.view)
 
@@ -224,14 +248,11 @@ class ExaminationController:
         media_name = self.view.media_select.get()
         file_path = self.get_current_media()
 
-        # Extract hex data from file
-        hex_string = FileManager().extract_hex(file_path)
+        # Memory-map the file, the popup only reads and formats the page being shown
+        viewer = HexViewer(file_path)
 
         # Show popup
-        popup = HexPopup(media_name, self.view)
-
-        # Display EXIF data
-        popup.data_dump.insert(tk.END, hex_string)
+        HexPopup(media_name, viewer, self.view)
 
         # Log activity
         (ActivityLogModel().
@@ -307,31 +328,154 @@ class ExaminationController:
         :return:
         """
         media = self.get_current_media()
-        _, file_extension = os.path.splitext(media)
-
-        # Call object detection function for appropriate media type
-        results = None
-        if file_extension.lower() in ['.jpg', '.jpeg', '.png', '.gif']:
-            results = ObjectDetection().detect_objects_photo(media)
-        elif file_extension.lower() in ['.mp4', '.avi', '.mov']:
-            results = ObjectDetection().detect_objects_video(media)
-        else:
-            logging.error(f"Invalid file extension: {file_extension}")
 
+        # Call object detection function for appropriate media type, in the background as videos take a while
+        TaskRunner().run_in_thread(('detect_objects', media), f"Detecting objects in {os.path.basename(media)}",
+                                   lambda progress: DetectionManager().detect_objects(media),
+                                   on_done=lambda results: self.show_objects(media, results))
+
+    def show_objects(self, media: str, results) -> None:
+        """
+        Shows objects detected in media
+        :param media: media file path
+        :param results: objects found in a photo as a string, or objects tracked through a video
+        :return:
+        """
         # Only show results if object(s) were found
-        if results == '' or results is None:
+        if not results:
             # No objects were found
             logging.info(f"No objects could be detected in media {media}")
             messagebox.showinfo("No objects found", f"No objects could be detected in {os.path.basename(media)}")
-        else:
-            # Objects were found
+        elif isinstance(results, str):
+            # Objects were found in photo
             popup = ObjectsPopup(os.path.basename(media), self.view)
             popup.objects_box.insert(tk.END, results)
+        else:
+            # Objects were tracked through video
+            popup = ObjectsPopup(os.path.basename(media), self.view)
+            popup.add_tracked_objects(results)
 
         # Log activity
         (ActivityLogModel().
          insert(f"Detected objects in '{media}'"))
 
+    def detect_objects_all_media(self, event: Event = None) -> None:
+        """
+        Logic for running object detection over all case media and storing the results
+        :param event:
+        :return:
+        """
+        TaskRunner().run_in_thread('detect_objects_all_media', "Detecting objects in all media",
+                                   lambda progress: DetectionManager().detect_all_media(progress=progress),
+                                   on_done=self.show_detect_all_summary)
+
+    def show_detect_all_summary(self, summary: dict) -> None:
+        """
+        Shows the outcome of object detection over all case media
+        :param summary: summary from DetectionManager.detect_all_media
+        :return:
+        """
+        messagebox.showinfo("Object detection complete",
+                            f"Processed {summary['processed']} media files with {summary['detections']} detections "
+                            f"in {summary['seconds']:.0f}s.\n"
+                            f"Skipped {summary['skipped']} already processed and {summary['duplicates']} duplicate "
+                            f"files, {summary['failed']} failed.")
+
+        # Log activity
+        (ActivityLogModel().
+         insert(f"Detected objects in all media: {summary['processed']} processed, {summary['skipped']} skipped, "
+                f"{summary['duplicates']} duplicates, {summary['failed']} failed"))
+
+    def find_media_with_object(self, event: Event = None) -> None:
+        """
+        Logic for searching media by objects found with object detection
+        :param event:
+        :return:
+        """
+        # Show which objects have been found to choose from
+        detected_classes = DetectionManager().load_detected_classes()
+        if len(detected_classes) == 0:
+            messagebox.showinfo("No objects found", "No stored objects, run object detection on all media first")
+            return
+        class_list = ', '.join(class_name for class_name, _ in detected_classes)
+        input_dialog = customtkinter.CTkInputDialog(text=f"Enter object to search for\n\nFound: {class_list}",
+                                                    title="Find Media Containing Object")
+        class_name = input_dialog.get_input()
+        if not class_name:
+            return
+
+        results = DetectionManager().find_media_with_object(class_name)
+        if len(results) == 0:
+            messagebox.showinfo("No media found", f"No media contains '{class_name}'")
+        else:
+            popup = ObjectSearchPopup(class_name, self.view)
+            for file_name, count, max_confidence in results:
+                popup.results_box.insert(tk.END, f"{file_name} - {count} detections, "
+                                                 f"highest confidence {max_confidence:.0%}\n")
+
+        # Log activity
+        (ActivityLogModel().
+         insert(f"Searched media for object '{class_name}', found in {len(results)} files"))
+
+    def find_near_duplicates(self, event: Event = None) -> None:
+        """
+        Logic for finding media that looks like the selected media file
+        :param event:
+        :return:
+        """
+        media_name = self.view.media_select.get()
+
+        # Searched in the background as the index is built, and unhashed media hashed, on the first search
+        TaskRunner().run_in_thread(('near_duplicates', media_name), f"Finding near-duplicates of {media_name}",
+                                   lambda progress: DuplicateManager().find_near_duplicates(media_name,
+                                                                                            progress=progress),
+                                   on_done=lambda duplicates: self.show_near_duplicates(media_name, duplicates))
+
+    def show_near_duplicates(self, media_name: str, duplicates: [(str, int)]) -> None:
+        """
+        Shows media that looks like a media file
+        :param media_name: media file searched for
+        :param duplicates: list of (file name, Hamming distance) from DuplicateManager.find_near_duplicates
+        :return:
+        """
+        if len(duplicates) == 0:
+            messagebox.showinfo("No near-duplicates", f"No media looks like {media_name}")
+        else:
+            popup = DuplicatesPopup(f"Near-duplicates of {media_name}", self.view)
+            for file_name, distance in duplicates:
+                popup.duplicates_box.insert(tk.END, f"{file_name} - {64 - distance}/64 hash bits match\n")
+
+        # Log activity
+        (ActivityLogModel().
+         insert(f"Searched for near-duplicates of '{media_name}', found {len(duplicates)}"))
+
+    def cluster_near_duplicates(self, event: Event = None) -> None:
+        """
+        Logic for grouping all case media into near-duplicate clusters
+        :param event:
+        :return:
+        """
+        TaskRunner().run_in_thread('cluster_near_duplicates', "Grouping near-duplicate media",
+                                   lambda progress: DuplicateManager().cluster_duplicates(progress=progress),
+                                   on_done=self.show_duplicate_clusters)
+
+    def show_duplicate_clusters(self, clusters: [[str]]) -> None:
+        """
+        Shows groups of near-duplicate media
+        :param clusters: file name clusters from DuplicateManager.cluster_duplicates
+        :return:
+        """
+        if len(clusters) == 0:
+            messagebox.showinfo("No near-duplicates", "No near-duplicate media found in this case")
+        else:
+            popup = DuplicatesPopup(f"{len(clusters)} Groups of Near-Duplicate Media", self.view)
+            for number, cluster in enumerate(clusters, start=1):
+                popup.duplicates_box.insert(tk.END, f"Group {number}:\n" + '\n'.join(cluster) + '\n\n')
+
+        # Log activity
+        (ActivityLogModel().
+         insert(f"Grouped near-duplicate media, found {len(clusters)} groups"))
+
     def get_current_media(self) -> str:
         """
         Get the filepath for the current selected media
@@ -343,68 +487,23 @@ class ExaminationController:
         file_path = os.path.join(media_dir, media_name)
         return file_path
 
-    def get_current_clog(self) -> str:
+    def parse_clog(self):
         """
-        Get the filepath for the current selected CLog
+        Logic for displaying Instagram JSON, Snapchat JSON and plaintext chat logs
         :return:
         """
-        # Get the selected clog name and directory
-        clog_name = self.view.clog_select.get()
-        clog_dir = os.path.join(FileManager().case_directory, "evidence", "chatlogs")
-        file_path = os.path.join(clog_dir, clog_name)
-        return file_path
-
-    def parse_clog(self):
-        """
-        Logic for parsing Instagram JSON, Snapchat JSON and plaintext chat logs
-        :return:
-        """
-        # Get filepath of currently select CLog
-        clog_dir = self.get_current_clog()
-
-        clog_type = FileManager().validate_clog(clog_dir)
-
-        if clog_type == 'instagram-json':
-            # Valid Instagram JSON chatlog
-            # Contains a single conversation with one user
-            df = FileManager().parse_insta_json(clog_dir)
-            self.view.reset_clog_view_box()
-            for _, row in df.iterrows():
-                timestamp = row['timestamp']
-                sender = row['sender']
-                message = row['message']
-                self.view.display_clog_line(f"[{timestamp}] {sender}: {message}")
-        elif clog_type == 'snapchat-json':
-            # Valid Snapchat JSON chatlog
-            # May contain multiple converstions with different users in the one file
-            sender_df_tuples = FileManager().parse_snap_json(clog_dir)
-            self.view.reset_clog_view_box()
-            for sender, df in sender_df_tuples:
-                self.view.display_clog_line('-' * 50)
-                self.view.display_clog_line(sender)
-                self.view.display_clog_line('-' * 50)
-                for _, row in df.iterrows():
-                    timestamp = row['timestamp']
-                    sender = row['sender']
-                    message = row['message']
-                    self.view.display_clog_line(f"[{timestamp}] {sender}: {message}")
-        elif clog_type == 'plaintext':
-            # Plaintext chat log, could be in any format
-            # Read as a string
-            text = FileManager().parse_txt_file(clog_dir)
-            self.view.reset_clog_view_box()
-            self.view.display_clog_line(text)
-        else:
-            # Invalid CLog
-            # May be an invalid file type or was invalid when compared with the schemas
-            logging.error(f"Unsupported chat log {os.path.basename(clog_dir)}")
+        chat_log = ChatLogManager().load_chat_log(self.view.clog_select.get())
+        if chat_log is None:
             messagebox.showerror("Error", "Unsupported chat log: this chat log format is currently not supported.")
             return
 
-        # Get stored flags and highlight in the clog viewer
-        flagged_text = FlagManager().load_flagged_text(clog_file=self.view.clog_select.get())
-        if len(flagged_text) > 0:
-            self.tag_flagged_text(flagged_text)
+        self.view.reset_clog_view_box()
+        for line in chat_log['lines']:
+            self.view.display_clog_line(line)
+
+        # Highlight stored flags in the clog viewer
+        if len(chat_log['flagged_text']) > 0:
+            self.tag_flagged_text(chat_log['flagged_text'])
 
     def search_regex(self, event: Event = None) -> None:
         """
@@ -440,18 +539,19 @@ class ExaminationController:
         clog_viewer.tag_remove("highlight", "1.0", "end")
 
         # Perform regex search
-        matches = list(re.finditer(search_pattern, clog_viewer.get("1.0", "end")))
+        try:
+            matches = ChatLogManager.search(clog_viewer.get("1.0", "end"), search_pattern)
+        except re.error as e:
+            messagebox.showerror("Invalid Search", f"Invalid regular expression: {str(e)}")
+            return
 
         # Highlight matches
-        for match in matches:
-            start_index = "1.0 + {} chars".format(match.start())
-            end_index = "1.0 + {} chars".format(match.end())
-            clog_viewer.tag_add("highlight", start_index, end_index)
+        for start, end in matches:
+            clog_viewer.tag_add("highlight", "1.0 + {} chars".format(start), "1.0 + {} chars".format(end))
 
         # Jump to the first highlighted match
         if matches:
-            first_match_start_index = "1.0 + {} chars".format(matches[0].start())
-            clog_viewer.see(first_match_start_index)
+            clog_viewer.see("1.0 + {} chars".format(matches[0][0]))
 
     def extract_urls(self, event: Event = None) -> None:
         """
@@ -462,15 +562,8 @@ class ExaminationController:
         file_name = self.view.clog_select.get()
         logging.info(f"Finding URLs in {file_name}")
 
-        # View box for CLogs
-        clogs_view = self.view.clog_viewer
-
-        # Get content of the CLogs view
-        clogs_text = clogs_view.get("1.0", "end")
-
-        # Extract URLs
-        extractor = URLExtract()
-        urls = extractor.find_urls(clogs_text)
+        # Extract URLs from the content of the CLogs view
+        urls = ChatLogManager().extract_urls(self.view.clog_viewer.get("1.0", "end"))
 
         # Create popup
         popup = URLsPopup(urls, self.view)
@@ -568,49 +661,30 @@ class ExaminationController:
          insert(f"Unflagged text '{flag_text}' in '{clog_file}'"))
 
     def detect_grooming(self, event: Event = None) -> None:
-        # Get filepath of currently select CLog to detect grooming in
-        clog_dir = self.get_current_clog()
-
-        clog_type = FileManager().validate_clog(clog_dir)
-        results = []
-        results_text = []
-
-
-        if clog_type == 'instagram-json':
-            # Valid Instagram JSON chatlog
-            df = FileManager().parse_insta_json(clog_dir)
-            for _, row in df.iterrows():
-                message = row['message']
-                result = GroomingDetector().detect_grooming(message)
-                if result is not None:
-                    results.append(result)
-                    results_text.append(message)
-        elif clog_type == 'snapchat-json':
-            # Valid Snapchat JSON chatlog
-            sender_df_tuples = FileManager().parse_snap_json(clog_dir)
-            for sender, df in sender_df_tuples:
-                for _, row in df.iterrows():
-                    message = row['message']
-                    result = GroomingDetector().detect_grooming(message)
-                    if result is not None:
-                        results.append(result)
-                        results_text.append(message)
-        elif clog_type == 'plaintext':
-            # Plaintext chat log
-            text = FileManager().parse_txt_file(clog_dir)
-            for line in text.splitlines():
-                result = GroomingDetector().detect_grooming(line)
-                if result is not None:
-                    results.append(result)
-                    results_text.append(line)
-        else:
+        # Currently selected CLog to detect grooming in
+        clog_name = self.view.clog_select.get()
+
+        # Classifying every message is CPU bound Python, so runs in a worker process
+        TaskRunner().run_in_process(('detect_grooming', clog_name), f"Detecting grooming in {clog_name}",
+                                    detect_grooming_in_file, (ChatLogManager.chat_log_path(clog_name),),
+                                    on_done=lambda detected: self.show_grooming(clog_name, detected))
+
+    def show_grooming(self, clog_name: str, detected: [(str, str)]) -> None:
+        """
+        Shows messages where grooming was detected
+        :param clog_name: chat log file name
+        :param detected: list of (message, result), None if the chat log couldn't be parsed
+        :return:
+        """
+        if detected is None:
             # Invalid format can't parse it
-            logging.error(f"Unable to detect grooming in {os.path.basename(clog_dir)}")
+            logging.error(f"Unable to detect grooming in {clog_name}")
             messagebox.showerror("Error", f"Unable to detect grooming, please select a chat log to detect grooming in")
             return
+        results_text = [message for message, _ in detected]
+        results = [result for _, result in detected]
 
         # Display popup with detected instances of grooming
-        clog_name = self.view.clog_select.get()
         if len(results) == 0:
             logging.info(f"No instances of grooming to display in '{clog_name}'")
             messagebox.showinfo("NO GROOMING DETECTED", "No instances of grooming were found")
@@ -8,6 +8,7 @@ from src.controllers.collection_controller import CollectionController
 from src.controllers.examination_controller import ExaminationController
 from src.controllers.identification_controller import IdentificationController
 from src.controllers.preservation_controller import PreservationController
+from src.controllers.task_runner import TaskRunner
 from src.models.activitylog import ActivityLogModel
 from src.models.case import CaseModel
 from src.models.investigator import InvestigatorModel
@@ -33,6 +34,9 @@ class MainController:
         # MainView
         self.view = view
 
+        # Heavy actions of every tab run in the background, polled for by the main window
+        TaskRunner().attach(self.view)
+
         # Other case manager bindings
         self.view.button_open.configure(command=self.open_case)
         self.view.button_new.configure(command=self.new_case)
@@ -1,12 +1,22 @@
+import datetime
 import logging
-import os
+import queue
 import tkinter as tk
 from asyncio import Event
+from src.controllers.task_runner import TaskRunner
 from src.models.activitylog import ActivityLogModel
-from src.utility.utility import DatabaseManager, FileManager
+from src.utility.activitystore import format_entry
+from src.utility.integrity import IntegrityVerifier, STATUS_PASSED
+from src.utility.integritymonitor import IntegrityMonitor, INTEGRITY_MONITOR_ENABLED
+from src.utility.utility import FileManager
 from src.views.preservation_view import PreservationView
 logging.basicConfig(level=logging.INFO)
 
+# Integrity results added to the view each time the UI is free
+INTEGRITY_ROWS_PER_TICK = 500
+# How often alerts from the background integrity monitor are checked for
+MONITOR_POLL_INTERVAL_MS = 1000
+
 
 class PreservationController:
     """
@@ -23,6 +33,12 @@ class PreservationController:
         # Bind updating log view to log model
         ActivityLogModel().insert_callback = self.update_activity_log_view
         ActivityLogModel().controller = self
+        # Whether an update of the log view is already waiting for the UI to be idle
+        self.log_update_scheduled = False
+        # Each integrity check has an id so rows of an earlier check stop being added
+        self.integrity_insert_id = 0
+        # Background integrity monitor of the open case
+        self.integrity_monitor = None
 
     def check_integrity_all(self, event: Event = None) -> None:
         """
@@ -32,86 +48,133 @@ class PreservationController:
         """
         logging.info("Checking integrity of ALL files")
 
-        # Log activity
-        (ActivityLogModel().
-         insert(f"File integrity check started on all files"))
+        # Hashes are recomputed in the background, the view is cleared once they are ready
+        TaskRunner().run_in_thread('integrity', "Checking integrity of all files",
+                                   lambda progress: IntegrityVerifier().verify(progress),
+                                   on_done=self.show_integrity_report)
 
+    def show_integrity_report(self, report: dict) -> None:
+        """
+        Shows and logs the outcome of an integrity check
+        :param report: report from IntegrityVerifier.verify
+        :return:
+        """
         # Clear the file/hash view
         self.view.integrity_view_box.clear()
 
-        # Original filenames and their hashes computed when uploaded fetched from db
-        original_file_hashes = DatabaseManager().fetch_evidence_filename_hash()
-
-        # Get the directories with files to re-hash
-        case_directory = FileManager().case_directory
-        media_dir = os.path.join(case_directory, "evidence", "media")
-        chatlogs_dir = os.path.join(case_directory, "evidence", "chatlogs")
-
-        # Get all the recomputed hashes for each file
-        new_chatlog_file_hashes = FileManager().compute_md5_hashes_in_directory(chatlogs_dir)
-        new_media_file_hashes = FileManager().compute_md5_hashes_in_directory(media_dir)
-        new_file_hashes = new_chatlog_file_hashes + new_media_file_hashes
-
-        # Holds file hashes that don't match original
-        failed_hashes = []
-
-        # Iterate through all recomputed hashes and compare to original hashes
-        for new_file_hash in new_file_hashes:
-            filename = new_file_hash["file_name"]
-            recomputed_hash_value = new_file_hash["hash_value"]
-            original_hash = next((item for item in original_file_hashes if item["file_name"] == filename), None)
-            logging.info("File {} original hash {} recomputed hash {}".format(filename, original_hash["hash_value"],
-                                                                              recomputed_hash_value))
-            if original_hash is not None and original_hash["hash_value"] != recomputed_hash_value:
-                # Filename and new hash for each failed hash
-                failed_hashes.append({"file_name": filename, "new_hash": recomputed_hash_value})
-                # Log to system
-                logging.warning("{} failed integrity check".format(filename))
-                # Log to activity log
-                (ActivityLogModel().
-                 insert(f"File {filename} failed integrity check: original MD5 Hash '{original_hash["hash_value"]}' "
-                        f"did not match recomputed MD5 hash '{recomputed_hash_value}' "))
-            elif original_hash is not None and original_hash["hash_value"] == recomputed_hash_value:
-                # Log to system
-                logging.info("{} passed integrity check".format(filename))
-                # Log to activity log
-                (ActivityLogModel().
-                 insert(f"File {filename} passed integrity check: original MD5 Hash '{original_hash["hash_value"]}' "
-                        f"matched recomputed MD5 hash '{recomputed_hash_value}' "))
-
-        # Display on view table
-        for new_file_hash in new_file_hashes:
-            filename = new_file_hash["file_name"]
-            recomputed_hash_value = new_file_hash["hash_value"]
-            original_hash = next((item for item in original_file_hashes if item["file_name"] == filename), None)
-            if original_hash is not None:
-                if {"file_name": filename, "new_hash": recomputed_hash_value} in failed_hashes:
-                    self.view.integrity_view_box.insert('', 'end', values=(
-                        filename, original_hash["hash_value"], recomputed_hash_value), tags='failed')
+        # Rows are added in batches between UI updates so large cases don't freeze the view
+        self.integrity_insert_id += 1
+        self.view.after(0, self.insert_integrity_rows, self.integrity_insert_id, report['results'], 0)
+
+        # Log activity
+        (ActivityLogModel().
+         insert(IntegrityVerifier.summarise(report), action='integrity', derive_file=False))
+
+    def insert_integrity_rows(self, insert_id: int, results: [tuple], start: int) -> None:
+        """
+        Adds the next batch of integrity results to the file/hash view
+        :param insert_id: check the results belong to, a newer check stops this one
+        :param results: list of (file name, original hash, recomputed hash, status)
+        :param start: index of the first result in the batch
+        :return:
+        """
+        if insert_id != self.integrity_insert_id:
+            return
+        for file_name, original_hash, recomputed_hash, status in results[start:start + INTEGRITY_ROWS_PER_TICK]:
+            self.view.integrity_view_box.insert('', 'end', values=(file_name, original_hash, recomputed_hash),
+                                                tags=status)
+        if start + INTEGRITY_ROWS_PER_TICK < len(results):
+            self.view.after(1, self.insert_integrity_rows, insert_id, results, start + INTEGRITY_ROWS_PER_TICK)
+
+    def start_integrity_monitor(self) -> None:
+        """
+        Starts the background integrity monitor for the open case, stopping any monitor of the previous case
+        :return:
+        """
+        first_start = self.integrity_monitor is None
+        if self.integrity_monitor is not None:
+            self.integrity_monitor.stop()
+        self.view.clear_integrity_alerts()
+        if not INTEGRITY_MONITOR_ENABLED or FileManager().case_directory is None:
+            self.integrity_monitor = None
+            self.view.monitor_label.configure(text="Integrity monitor not running")
+            return
+
+        self.integrity_monitor = IntegrityMonitor(FileManager().case_directory)
+        self.integrity_monitor.start()
+        if first_start:
+            self.view.after(MONITOR_POLL_INTERVAL_MS, self.poll_integrity_monitor)
+
+    def poll_integrity_monitor(self) -> None:
+        """
+        Shows and logs alerts raised by the background integrity monitor, alerts are raised off the UI thread
+        :return:
+        """
+        monitor = self.integrity_monitor
+        if monitor is not None:
+            while True:
+                try:
+                    alert = monitor.alerts.get_nowait()
+                except queue.Empty:
+                    break
+                time_raised = datetime.datetime.fromtimestamp(alert['time']).strftime("%H:%M:%S")
+                if alert['status'] == STATUS_PASSED:
+                    message = f"File '{alert['file_name']}' passed integrity check again"
                 else:
-                    self.view.integrity_view_box.insert('', 'end', values=(
-                        filename, original_hash["hash_value"], recomputed_hash_value), tags='passed')
+                    message = (f"File '{alert['file_name']}' {alert['status']}: original MD5 Hash "
+                               f"'{alert['original_hash']}' recomputed MD5 hash '{alert['recomputed_hash']}'")
+                self.view.add_integrity_alert(f"{time_raised} {message}")
+                # Log activity
+                (ActivityLogModel().
+                 insert(f"Integrity monitor: {message}", action='integrity', file_name=alert['file_name']))
+
+            last_deep_check = (datetime.datetime.fromtimestamp(monitor.last_deep_check).strftime("%H:%M")
+                               if monitor.last_deep_check else 'pending')
+            self.view.monitor_label.configure(
+                text=f"Integrity monitor {monitor.mode} for changes, last deep check {last_deep_check}")
+        self.view.after(MONITOR_POLL_INTERVAL_MS, self.poll_integrity_monitor)
+
+    def schedule_activity_log_update(self) -> None:
+        """
+        Adds new entries to the activity view once the UI is idle, so a bulk operation logging many lines updates
+        the view once at the end rather than once per line
+        :return:
+        """
+        if not self.log_update_scheduled:
+            self.log_update_scheduled = True
+            self.view.after_idle(self.append_activity_log_view)
+
+    def append_activity_log_view(self) -> None:
+        """
+        Logic for adding new entries to the end of the activity view textbox
+        :return:
+        """
+        self.log_update_scheduled = False
+        entries = ActivityLogModel().take_new_entries()
+        if not entries:
+            return
+
+        self.view.coc_view_box.insert(tk.END, ''.join(f"{entry}\n" for entry in entries))
+
+        # Always scroll to bottom
+        self.view.coc_view_box.yview_moveto(1.0)
 
     def update_activity_log_view(self):
         """
-        Logic for updating the activity view textbox from the activity log file
+        Logic for updating the activity view textbox from the activity log store
         :return:
         """
         logging.info("Updating activity log view")
 
-        # Location of the log file
-        log_dir = os.path.join(FileManager().case_directory, "reports", "ActivityLog.txt")
+        # The whole log is shown so entries waiting for the view are already included
+        store = FileManager().activity_log(ActivityLogModel.classify)
+        ActivityLogModel().take_new_entries()
 
         # Clear the log textbox
         self.view.coc_view_box.delete(1.0, tk.END)
 
-        # Attempt to get the file contents and update log view box
-        try:
-            with open(log_dir, 'r') as file:
-                self.view.coc_view_box.delete(1.0, tk.END)
-                self.view.coc_view_box.insert(1.0, file.read())
-        except FileNotFoundError:
-            self.view.coc_view_box.insert(tk.END, 'end')
+        # Stream the entries into the log view box in one insert
+        self.view.coc_view_box.insert(1.0, ''.join(f"{format_entry(entry)}\n" for entry in store.iter_entries()))
 
         # Always scroll to bottom
         self.view.coc_view_box.yview_moveto(1.0)
@@ -122,3 +185,4 @@ class PreservationController:
         :return:
         """
         self.update_activity_log_view()
+        self.start_integrity_monitor()
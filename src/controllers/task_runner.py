@@ -0,0 +1,266 @@
+import logging
+import multiprocessing
+import os
+import queue
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from tkinter import messagebox
+from typing import Callable
+from src.utility.progress import Cancelled, Progress
+from src.views.ui_components.popups import TaskPopup
+
+logging.basicConfig(level=logging.INFO)
+
+# Worker threads for background tasks, most wait on disk, subprocesses or native code that releases the GIL
+TASK_THREADS = min(4, os.cpu_count() or 1)
+# Worker processes for CPU bound Python, created on first use
+TASK_PROCESSES = max(1, min(4, (os.cpu_count() or 1) - 1))
+# How often finished tasks and progress are checked for while tasks are running
+TASK_POLL_INTERVAL_MS = 50
+# Seconds before a progress popup is shown, so quick tasks never flash one up
+TASK_POPUP_DELAY = 0.3
+
+
+class TaskRunner:
+    """
+    Runs heavy work off the UI thread so the window stays responsive. Results, errors and progress are passed back
+    through a queue the UI thread polls with after(), so callbacks always run on the UI thread. Only one task runs
+    per key at a time
+    """
+
+    __instance = None
+    # Widget whose event loop polls for results
+    widget = None
+    thread_executor = None
+    process_executor = None
+    # Running tasks by key
+    tasks = {}
+    # Progress and finished tasks, as (task, kind, value), put by worker threads and taken by the UI thread
+    events = queue.Queue()
+    polling = False
+
+    def __new__(cls):
+        """
+        For Singleton design pattern
+        """
+
+        if cls.__instance is None:
+            cls.__instance = super(TaskRunner, cls).__new__(cls)
+        return cls.__instance
+
+    def __init__(self):
+        pass
+
+    def attach(self, widget) -> None:
+        """
+        Sets the widget whose event loop polls for results, running tasks are cancelled when it is destroyed
+        :param widget: application root window
+        :return:
+        """
+        TaskRunner.widget = widget
+        widget.bind('<Destroy>', lambda event: self.shutdown() if event.widget is widget else None, add='+')
+
+    def is_running(self, key) -> bool:
+        """
+        Whether a task is running
+        :param key:
+        :return:
+        """
+        return key in self.tasks
+
+    def run_in_thread(self, key, title: str, function: Callable[[Progress], object],
+                      on_done: Callable[[object], None] = None, on_error: Callable[[Exception], None] = None,
+                      on_cancel: Callable[[], None] = None, discard_cancelled: bool = True) -> bool:
+        """
+        Runs a task on a worker thread
+        :param key: identifies the task, e.g. ('detect_objects', file name), a task already running isn't started again
+        :param title: shown on the progress popup
+        :param function: called with a Progress to report to and check for cancelling
+        :param on_done: called on the UI thread with the result
+        :param on_error: called on the UI thread with the exception, an error dialog is shown if not given
+        :param on_cancel: called on the UI thread once the task has stopped after being cancelled
+        :param discard_cancelled: ignore the result of a task that returns after being cancelled, False for tasks
+        returning early with what they finished, which is passed to on_done
+        :return: whether the task was started
+        """
+        if self.already_running(key):
+            return False
+        if self.thread_executor is None:
+            TaskRunner.thread_executor = ThreadPoolExecutor(max_workers=TASK_THREADS, thread_name_prefix='task')
+
+        task = self.new_task(key, title, on_done, on_error, on_cancel)
+        task['progress'] = Progress(lambda event: self.events.put((task, 'progress', event)))
+        task['discard_cancelled'] = discard_cancelled
+        self.start(task, self.thread_executor.submit(function, task['progress']))
+        return True
+
+    def run_in_process(self, key, title: str, function: Callable, args: tuple = (),
+                       on_done: Callable[[object], None] = None, on_error: Callable[[Exception], None] = None,
+                       on_cancel: Callable[[], None] = None) -> bool:
+        """
+        Runs a CPU bound task in a worker process, which doesn't share the open case so is given everything it needs
+        :param key: identifies the task, a task already running isn't started again
+        :param title: shown on the progress popup
+        :param function: module level function, called with args
+        :param args: picklable arguments
+        :param on_done: called on the UI thread with the result
+        :param on_error: called on the UI thread with the exception, an error dialog is shown if not given
+        :param on_cancel: called on the UI thread once cancelled, a task already started runs on but its result is
+        discarded
+        :return: whether the task was started
+        """
+        if self.already_running(key):
+            return False
+        if self.process_executor is None:
+            # Spawned rather than forked, forking a process running Tk and threads isn't safe
+            TaskRunner.process_executor = ProcessPoolExecutor(max_workers=TASK_PROCESSES,
+                                                              mp_context=multiprocessing.get_context('spawn'))
+
+        task = self.new_task(key, title, on_done, on_error, on_cancel)
+        task['progress'] = Progress()
+        self.start(task, self.process_executor.submit(function, *args))
+        return True
+
+    def already_running(self, key) -> bool:
+        """
+        Checks for a task already running with a key, bringing its progress popup to the front if so
+        :param key:
+        :return:
+        """
+        task = self.tasks.get(key)
+        if task is None:
+            return False
+        logging.info(f"{task['title']} is already running")
+        if task['popup'] is None:
+            self.show_popup(task)
+        task['popup'].lift()
+        task['popup'].focus()
+        return True
+
+    @staticmethod
+    def new_task(key, title: str, on_done, on_error, on_cancel) -> dict:
+        """
+        State of a task
+        :return:
+        """
+        return {'key': key, 'title': title, 'on_done': on_done, 'on_error': on_error, 'on_cancel': on_cancel,
+                'started': time.perf_counter(), 'future': None, 'progress': None, 'popup': None, 'event': None,
+                'cancelled': False, 'discard_cancelled': True}
+
+    def start(self, task: dict, future: Future) -> None:
+        """
+        Tracks a submitted task and starts polling for it
+        :param task:
+        :param future:
+        :return:
+        """
+        task['future'] = future
+        self.tasks[task['key']] = task
+        future.add_done_callback(lambda done: self.events.put((task, 'done', done)))
+        logging.info(f"Started {task['title']}")
+        if not self.polling:
+            TaskRunner.polling = True
+            self.widget.after(TASK_POLL_INTERVAL_MS, self.poll)
+
+    def poll(self) -> None:
+        """
+        Applies progress and finished tasks on the UI thread, polling until no tasks are running
+        :return:
+        """
+        while True:
+            try:
+                task, kind, value = self.events.get_nowait()
+            except queue.Empty:
+                break
+            # Events of a task replaced by a newer one with the same key are stale
+            if self.tasks.get(task['key']) is not task:
+                continue
+            try:
+                if kind == 'progress':
+                    task['event'] = value
+                    if task['popup'] is not None:
+                        task['popup'].update_progress(value)
+                else:
+                    self.finish(task, value)
+            except Exception as e:
+                # A failing callback mustn't stop polling for the other tasks
+                logging.exception(f"Failed to handle {task['title']}: {str(e)}")
+
+        # Tasks taking a while get a progress popup
+        now = time.perf_counter()
+        for task in list(self.tasks.values()):
+            if task['popup'] is None and now - task['started'] >= TASK_POPUP_DELAY:
+                self.show_popup(task)
+
+        if self.tasks:
+            self.widget.after(TASK_POLL_INTERVAL_MS, self.poll)
+        else:
+            TaskRunner.polling = False
+
+    def show_popup(self, task: dict) -> None:
+        """
+        Shows the progress popup of a task
+        :param task:
+        :return:
+        """
+        task['popup'] = TaskPopup(task['title'], self.widget)
+        task['popup'].bind_cancel(lambda: self.cancel(task['key']))
+        if task['event'] is not None:
+            task['popup'].update_progress(task['event'])
+
+    def cancel(self, key) -> None:
+        """
+        Cancels a task, it stops at its next progress update
+        :param key:
+        :return:
+        """
+        task = self.tasks.get(key)
+        if task is None or task['cancelled']:
+            return
+        logging.info(f"Cancelling {task['title']}")
+        task['cancelled'] = True
+        task['progress'].cancel()
+        task['future'].cancel()
+        if task['popup'] is not None:
+            task['popup'].show_cancelling()
+
+    def finish(self, task: dict, future: Future) -> None:
+        """
+        Closes a finished task's popup and passes on its result
+        :param task:
+        :param future:
+        :return:
+        """
+        del self.tasks[task['key']]
+        if task['popup'] is not None:
+            task['popup'].destroy()
+        seconds = time.perf_counter() - task['started']
+
+        exception = None if future.cancelled() else future.exception()
+        if future.cancelled() or isinstance(exception, Cancelled) or (task['cancelled'] and task['discard_cancelled']):
+            logging.info(f"Cancelled {task['title']} after {seconds:.1f}s")
+            if task['on_cancel'] is not None:
+                task['on_cancel']()
+        elif exception is not None:
+            logging.error(f"{task['title']} failed after {seconds:.1f}s: {str(exception)}")
+            if task['on_error'] is not None:
+                task['on_error'](exception)
+            else:
+                messagebox.showerror("Error", f"{task['title']} failed: {str(exception)}")
+        else:
+            logging.info(f"Finished {task['title']} in {seconds:.1f}s")
+            if task['on_done'] is not None:
+                task['on_done'](future.result())
+
+    def shutdown(self) -> None:
+        """
+        Cancels running tasks and stops the workers without waiting, e.g. when the application closes
+        :return:
+        """
+        for key in list(self.tasks):
+            self.cancel(key)
+        for executor in [self.thread_executor, self.process_executor]:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+        TaskRunner.thread_executor = None
+        TaskRunner.process_executor = None
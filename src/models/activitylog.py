@@ -1,6 +1,31 @@
 import datetime
+import os
+import re
+import threading
 from src.utility.utility import FileManager
 
+# Kinds of activity recognised from entry text, the first matching pattern is used
+ACTION_PATTERNS = [
+    ('upload', re.compile(r'^New file uploaded')),
+    ('integrity', re.compile(r'integrity check')),
+    ('unflag', re.compile(r'^Unflagged')),
+    ('flag', re.compile(r'^Flagged|^Comment ')),
+    ('hash_set', re.compile(r'hash set')),
+    ('detection', re.compile(r'^Detected|^Searched media for object')),
+    ('search', re.compile(r'^Searched')),
+    ('extract', re.compile(r'^Extracted|^Viewed hex')),
+    ('view', re.compile(r'^Viewed')),
+    ('report', re.compile(r'^Generated report|exported')),
+    ('identification', re.compile(r'suspect|victim')),
+    ('incident', re.compile(r'^Incident|^Demand|^Threat|^Sextortion type')),
+    ('case', re.compile(r'^Case |^Current investigator|^Toolkit')),
+]
+# Evidence file an entry concerns, a quoted name with an extension or the unquoted name in the old integrity entries
+FILE_NAME_PATTERNS = [
+    re.compile(r"'([^']+\.[A-Za-z0-9]{1,5})'"),
+    re.compile(r'^File (\S+) (?:passed|failed) integrity check'),
+]
+
 
 class ActivityLogModel:
     """
@@ -9,6 +34,9 @@ class ActivityLogModel:
 
     __instance = None
     controller = None
+    # Entries not yet shown in the activity log view
+    new_entries = []
+    new_entries_lock = threading.Lock()
 
     def __new__(cls):
         """
@@ -23,10 +51,30 @@ class ActivityLogModel:
     def __init__(self):
         pass
 
-    def insert(self, activity: str) -> None:
+    @staticmethod
+    def classify(activity: str) -> (str, str):
+        """
+        Works out the kind of activity and the file it concerns from the entry text
+        :param activity:
+        :return: (action, file name or None)
+        """
+        action = next((name for name, pattern in ACTION_PATTERNS if pattern.search(activity)), 'activity')
+        file_name = None
+        for pattern in FILE_NAME_PATTERNS:
+            match = pattern.search(activity)
+            if match:
+                file_name = os.path.basename(match.group(1))
+                break
+        return action, file_name
+
+    def insert(self, activity: str, action: str = None, file_name: str = None, derive_file: bool = True) -> None:
         """
         Inserts entry into log
         :param activity:
+        :param action: kind of activity, worked out from the text if not given
+        :param file_name: evidence file the activity concerns, worked out from the text if not given
+        :param derive_file: False for entries about no one file, e.g. summaries naming several, so they aren't indexed
+        under a file named in the text
         :return:
         """
 
@@ -39,8 +87,27 @@ class ActivityLogModel:
         # String timestamp in format HH:MM YYYY-MM-DD
         timestamp = current_time.strftime("%H:%M %Y-%m-%d")
 
-        # Write to the file
-        FileManager().write_to_activity_log(f"{timestamp} {activity}")
+        # Write to the store, indexed by action and file
+        if action is None or file_name is None:
+            derived_action, derived_file_name = self.classify(activity)
+            action = action or derived_action
+            file_name = file_name or (derived_file_name if derive_file else None)
+        FileManager().write_to_activity_log(activity, action, file_name, current_time, self.classify)
+        entry = f"{timestamp} {activity}"
+
+        # Updates preservation view via preservation controller, only the new entries are added
+        with self.new_entries_lock:
+            self.new_entries.append(entry)
+        # No controller when running from the command line
+        if self.controller is not None:
+            self.controller.schedule_activity_log_update()
 
-        # Updates preservation view via preservation controller
-        self.controller.update_activity_log_view()
+    def take_new_entries(self) -> [str]:
+        """
+        Takes the entries added since the view was last updated
+        :return: list of entries, oldest first
+        """
+        with self.new_entries_lock:
+            entries = list(self.new_entries)
+            self.new_entries.clear()
+        return entries
@@ -0,0 +1,120 @@
+import logging
+import os
+import re
+from src.models.flags import FlagManager
+from src.utility.progress import Progress
+from src.utility.utility import FileManager
+
+logging.basicConfig(level=logging.INFO)
+
+
+def detect_grooming_in_file(clog_path: str) -> [(str, str)]:
+    """
+    Detects grooming in a chat log by path, for running in a worker process where no case is open
+    :param clog_path: chat log path
+    :return: list of (message, result) for messages where grooming was detected, None if the chat log format isn't
+    recognised
+    """
+    # Imported here as loading the model is slow, each worker process loads it once
+    from src.ai.grooming_detection.groomingdetector import GroomingDetector
+    return GroomingDetector().detect_grooming_in_clog(clog_path)
+
+
+class ChatLogManager:
+    """
+    Model for reading, searching and detecting grooming in chat logs, independent of how they are displayed
+    """
+
+    __instance = None
+    # Created on first use as loading its list of top level domains is slow
+    url_extractor = None
+
+    def __new__(cls):
+        """
+        For Singleton design pattern
+        """
+
+        if cls.__instance is None:
+            cls.__instance = super(ChatLogManager, cls).__new__(cls)
+
+        return cls.__instance
+
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def chat_log_path(file_name: str) -> str:
+        """
+        Path of a chat log in the case
+        :param file_name:
+        :return:
+        """
+        return os.path.join(FileManager().case_directory, "evidence", "chatlogs", file_name)
+
+    def load_chat_log(self, file_name: str) -> dict:
+        """
+        Parses Instagram JSON, Snapchat JSON and plaintext chat logs into lines for display
+        :param file_name: chat log file name
+        :return: dictionary with the chat log type, lines and flagged text, None if the format isn't supported
+        """
+        clog_path = self.chat_log_path(file_name)
+        clog_type = FileManager().validate_clog(clog_path)
+
+        if clog_type == 'instagram-json':
+            # Valid Instagram JSON chatlog
+            # Contains a single conversation with one user
+            df = FileManager().parse_insta_json(clog_path)
+            lines = [f"[{row['timestamp']}] {row['sender']}: {row['message']}" for _, row in df.iterrows()]
+        elif clog_type == 'snapchat-json':
+            # Valid Snapchat JSON chatlog
+            # May contain multiple converstions with different users in the one file
+            lines = []
+            for sender, df in FileManager().parse_snap_json(clog_path):
+                lines += ['-' * 50, sender, '-' * 50]
+                lines += [f"[{row['timestamp']}] {row['sender']}: {row['message']}" for _, row in df.iterrows()]
+        elif clog_type == 'plaintext':
+            # Plaintext chat log, could be in any format
+            # Read as a string
+            lines = [FileManager().parse_txt_file(clog_path)]
+        else:
+            # Invalid CLog
+            # May be an invalid file type or was invalid when compared with the schemas
+            logging.error(f"Unsupported chat log {file_name}")
+            return None
+
+        return {'type': clog_type, 'lines': lines, 'flagged_text': FlagManager().load_flagged_text(clog_file=file_name)}
+
+    @staticmethod
+    def search(text: str, search_pattern: str) -> [(int, int)]:
+        """
+        Finds matches of a regular expression in chat log text
+        :param text:
+        :param search_pattern: regular expression
+        :return: list of (start, end) character offsets of each match
+        :raises re.error: if the pattern isn't a valid regular expression
+        """
+        return [match.span() for match in re.finditer(search_pattern, text)]
+
+    def extract_urls(self, text: str) -> [str]:
+        """
+        Extracts URLs from chat log text
+        :param text:
+        :return: URLs in the order they appear
+        """
+        if self.url_extractor is None:
+            # Imported here so reading and searching chat logs don't need it
+            from urlextract import URLExtract
+            ChatLogManager.url_extractor = URLExtract()
+        return self.url_extractor.find_urls(text)
+
+    def detect_grooming(self, file_name: str, progress: Progress = None) -> [(str, str)]:
+        """
+        Detects grooming in every message of a chat log
+        :param file_name: chat log file name
+        :param progress: reports messages checked and allows cancelling
+        :return: list of (message, result) for messages where grooming was detected, None if the chat log format
+        isn't recognised
+        """
+        # Imported here as loading the model is slow and only needed for detection
+        from src.ai.grooming_detection.groomingdetector import GroomingDetector
+        return GroomingDetector().detect_grooming_in_clog(self.chat_log_path(file_name), progress)
@@ -0,0 +1,203 @@
+import logging
+import os
+import time
+from src.ai.object_detection.objectdetection import ObjectDetection, model_version, DEFAULT_PHOTO_MODE, \
+    PHOTO_LATENCY_BUDGET_MS
+from src.utility.progress import Progress
+from src.utility.utility import DatabaseManager, FileManager
+logging.basicConfig(level=logging.INFO)
+
+# Media file types object detection is run on
+PHOTO_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif']
+VIDEO_EXTENSIONS = ['.mp4', '.avi', '.mov']
+
+
+class DetectionManager:
+    """
+    Model for running object detection across all case media and searching the stored detections
+    """
+
+    __instance = None
+
+    def __new__(cls):
+        """
+        For Singleton design pattern
+        """
+
+        if cls.__instance is None:
+            cls.__instance = super(DetectionManager, cls).__new__(cls)
+
+        return cls.__instance
+
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def detect_objects(media_path: str):
+        """
+        Detects objects in a single photo or video without storing them
+        :param media_path:
+        :return: string of detected objects for photos, tracked object records for videos, None if the file type
+        isn't supported
+        """
+        extension = os.path.splitext(media_path)[1].lower()
+        if extension in PHOTO_EXTENSIONS:
+            return ObjectDetection().detect_objects_photo(media_path)
+        elif extension in VIDEO_EXTENSIONS:
+            return ObjectDetection().detect_objects_video(media_path)
+        logging.error(f"Invalid file extension: {extension}")
+        return None
+
+    @staticmethod
+    def detect_all_media(batch_size: int = 8, progress: Progress = None) -> dict:
+        """
+        Runs object detection over every media file in the case and stores the detections.
+        Files whose contents were already processed with the current model version are skipped.
+        Photos are detected in the mode set by CST_PHOTO_MODE, which is part of the model version
+        :param batch_size: number of photos, or video frames, passed to the model at a time
+        :param progress: reports files processed and allows cancelling between batches, detections already stored
+        are kept so a later run carries on where a cancelled one stopped
+        :return: summary dictionary with processed, duplicates, skipped, failed and detections counts and seconds taken
+        """
+        start = time.perf_counter()
+        progress = progress or Progress()
+        progress.start("Listing media")
+        media_dir = os.path.join(FileManager().case_directory, 'evidence', 'media')
+        summary = {'processed': 0, 'duplicates': 0, 'skipped': 0, 'failed': 0, 'detections': 0}
+
+        # File names that each file content hash has already been processed under
+        processed = {}
+        for hash_value, file_name in DatabaseManager().fetch_detection_runs(model_version):
+            processed.setdefault(hash_value, set()).add(file_name)
+        # Files with the same contents as a file to be processed in this run, recorded once it has succeeded
+        duplicates = {}
+
+        # Digests recorded at ingest, so media isn't hashed again on every run, only files missing from the evidence
+        # table are hashed
+        recorded = {entry['file_name']: entry['hash_value']
+                    for entry in DatabaseManager().fetch_evidence_filename_hash()}
+        file_names = sorted(file_name for file_name in os.listdir(media_dir)
+                            if not file_name.startswith('.') and os.path.isfile(os.path.join(media_dir, file_name))) \
+            if os.path.isdir(media_dir) else []
+
+        photos = []
+        videos = []
+        for file_name in file_names:
+            extension = os.path.splitext(file_name)[1].lower()
+            if extension not in PHOTO_EXTENSIONS + VIDEO_EXTENSIONS:
+                continue
+            hash_value = recorded.get(file_name) or FileManager.compute_md5_hash(os.path.join(media_dir, file_name))
+            if hash_value in processed:
+                if file_name in processed[hash_value]:
+                    summary['skipped'] += 1
+                else:
+                    # Same contents as a file already processed, only record it against this file name
+                    DatabaseManager().insert_detection_run(file_name, hash_value, model_version)
+                    processed[hash_value].add(file_name)
+                    summary['duplicates'] += 1
+                continue
+            if hash_value in duplicates:
+                duplicates[hash_value].append(file_name)
+                continue
+            duplicates[hash_value] = []
+            if extension in PHOTO_EXTENSIONS:
+                photos.append((file_name, hash_value))
+            else:
+                videos.append((file_name, hash_value))
+
+        progress.start("Detecting objects", len(photos) + len(videos))
+
+        # Photos are detected in batches
+        for i in range(0, len(photos), batch_size):
+            batch = photos[i:i + batch_size]
+            paths = {os.path.join(media_dir, file_name): (file_name, hash_value) for file_name, hash_value in batch}
+            try:
+                results = ObjectDetection.detect_objects_batch(list(paths), DEFAULT_PHOTO_MODE, PHOTO_LATENCY_BUDGET_MS)
+            except Exception as e:
+                # One bad photo shouldn't fail the rest of its batch, or stop the rest of the media being processed
+                logging.error(f"Object detection failed for a batch of photos, detecting them one at a time: {str(e)}")
+                results = {}
+                for path in paths:
+                    try:
+                        results.update(ObjectDetection.detect_objects_batch([path], DEFAULT_PHOTO_MODE,
+                                                                            PHOTO_LATENCY_BUDGET_MS))
+                    except Exception as e:
+                        logging.error(f"Object detection failed for photo {paths[path][0]}: {str(e)}")
+                        results[path] = None
+            for path, detections in results.items():
+                file_name, hash_value = paths[path]
+                if detections is None:
+                    # Failed photos aren't recorded as processed so they are tried again next run
+                    DetectionManager.record_failure(file_name, duplicates[hash_value], summary)
+                else:
+                    DetectionManager.store_detections(file_name, hash_value, detections, duplicates[hash_value],
+                                                      summary)
+            progress.advance(len(batch), message=batch[-1][0])
+
+        # Videos have their sampled frames batched
+        for file_name, hash_value in videos:
+            try:
+                detections = ObjectDetection.detect_objects_video_frames(os.path.join(media_dir, file_name),
+                                                                         batch_size=batch_size)
+            except Exception as e:
+                # A corrupt video shouldn't stop the rest of the media being processed
+                logging.error(f"Object detection failed for video {file_name}: {str(e)}")
+                DetectionManager.record_failure(file_name, duplicates[hash_value], summary)
+                progress.advance(message=file_name)
+                continue
+            DetectionManager.store_detections(file_name, hash_value, detections, duplicates[hash_value], summary)
+            progress.advance(message=file_name)
+
+        summary['seconds'] = time.perf_counter() - start
+        logging.info(f"Object detection over case media finished: {summary}")
+        return summary
+
+    @staticmethod
+    def store_detections(file_name: str, hash_value: str, detections: [dict], duplicates: [str],
+                         summary: dict) -> None:
+        """
+        Stores the detections of a processed file, then records its duplicates in this run as processed too
+        :param file_name: file detection was run on
+        :param hash_value: MD5 hash of the file
+        :param detections: detection dictionaries
+        :param duplicates: other file names with the same contents
+        :param summary: summary counts to update
+        :return:
+        """
+        DatabaseManager().insert_detections(file_name, hash_value, model_version, detections)
+        summary['processed'] += 1
+        summary['detections'] += len(detections)
+        for duplicate in duplicates:
+            DatabaseManager().insert_detection_run(duplicate, hash_value, model_version)
+            summary['duplicates'] += 1
+
+    @staticmethod
+    def record_failure(file_name: str, duplicates: [str], summary: dict) -> None:
+        """
+        Counts a file detection failed on, with its duplicates in this run as they weren't processed either
+        :param file_name: file detection failed on
+        :param duplicates: other file names with the same contents
+        :param summary: summary counts to update
+        :return:
+        """
+        logging.error(f"Object detection failed for {file_name}, it will be tried again next run")
+        summary['failed'] += 1 + len(duplicates)
+
+    @staticmethod
+    def find_media_with_object(class_name: str, min_confidence: float = 0.0) -> [(str, int, float)]:
+        """
+        Finds media files an object class was detected in
+        :param class_name: object class e.g. person, bed, cell phone
+        :param min_confidence: lowest detection confidence to count
+        :return: list of (file name, number of detections, highest confidence), most confident first
+        """
+        return DatabaseManager().fetch_media_by_detected_class(class_name.strip().lower(), model_version,
+                                                               min_confidence)
+
+    @staticmethod
+    def load_detected_classes() -> [(str, int)]:
+        """
+        Loads every object class detected in the case's media
+        :return: list of (class name, number of files it was detected in)
+        """
+        return DatabaseManager().fetch_detected_classes(model_version)
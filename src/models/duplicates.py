@@ -0,0 +1,165 @@
+import logging
+import os
+import threading
+from src.utility.perceptualhash import BKTree, hash_media_file, IMAGE_EXTENSIONS, VIDEO_EXTENSIONS
+from src.utility.progress import Progress
+from src.utility.utility import DatabaseManager, FileManager
+logging.basicConfig(level=logging.INFO)
+
+# Hash type used for near-duplicate searches, pHash copes best with recompression and resizing
+DEFAULT_HASH_TYPE = 'phash'
+# Greatest number of differing bits, out of 64, for two media files to count as near-duplicates
+DEFAULT_MAX_DISTANCE = 10
+
+
+class DuplicateManager:
+    """
+    Model for finding near-duplicate media using perceptual hashes, e.g. the same image re-sent, cropped or
+    recompressed on another platform
+    """
+
+    __instance = None
+    # BK-trees keyed by (case database, hash type), built on first search and kept up to date as media is added
+    trees = {}
+    # Guards the trees, which are built, searched and added to from background tasks
+    lock = threading.RLock()
+
+    def __new__(cls):
+        """
+        For Singleton design pattern
+        """
+
+        if cls.__instance is None:
+            cls.__instance = super(DuplicateManager, cls).__new__(cls)
+
+        return cls.__instance
+
+    def __init__(self):
+        pass
+
+    def index_file(self, file_name: str, hash_value: str) -> None:
+        """
+        Computes and stores perceptual hashes for a media file, called at ingest
+        :param file_name: evidence file name in the media folder
+        :param hash_value: MD5 hash of the file
+        :return:
+        """
+        if os.path.splitext(file_name)[1].lower() not in IMAGE_EXTENSIONS + VIDEO_EXTENSIONS:
+            return
+        file_path = os.path.join(FileManager().case_directory, 'evidence', 'media', file_name)
+        frame_hashes = hash_media_file(file_path)
+        DatabaseManager().insert_perceptual_hashes(file_name, hash_value, frame_hashes)
+
+        # Add to any trees already built for this case rather than rebuilding them
+        with self.lock:
+            for (database, hash_type), tree in self.trees.items():
+                if database == DatabaseManager().database_directory:
+                    for frame_index, hashes in frame_hashes:
+                        tree.add(hashes[hash_type], (file_name, frame_index))
+
+    def index_missing(self, progress: Progress = None) -> int:
+        """
+        Hashes media added before perceptual hashing was done at ingest
+        :param progress: reports files hashed and allows cancelling between files
+        :return: number of files hashed
+        """
+        hashed_files = set(DatabaseManager().fetch_perceptual_hashed_files())
+        missing = [entry for entry in DatabaseManager().fetch_evidence_filename_hash()
+                   if entry['file_name'] not in hashed_files
+                   and os.path.splitext(entry['file_name'])[1].lower() in IMAGE_EXTENSIONS + VIDEO_EXTENSIONS]
+        progress = progress or Progress()
+        progress.start("Hashing media", len(missing))
+        for entry in missing:
+            self.index_file(entry['file_name'], entry['hash_value'])
+            progress.advance(message=entry['file_name'])
+        if missing:
+            logging.info(f"Computed perceptual hashes for {len(missing)} previously added media files")
+        return len(missing)
+
+    def get_tree(self, hash_type: str = DEFAULT_HASH_TYPE, progress: Progress = None) -> BKTree:
+        """
+        Gets the BK-tree for a hash type, building it from the database the first time
+        :param hash_type: ahash, dhash or phash
+        :param progress: reports media hashed and allows cancelling while the tree is built
+        :return: BK-tree with (file name, frame index) items
+        """
+        key = (DatabaseManager().database_directory, hash_type)
+        with self.lock:
+            if key not in self.trees:
+                self.index_missing(progress)
+                hashes = DatabaseManager().fetch_perceptual_hashes(hash_type)
+                progress = progress or Progress()
+                progress.start("Building near-duplicate index", len(hashes))
+                tree = BKTree()
+                for file_name, frame_index, hash_int in hashes:
+                    tree.add(hash_int, (file_name, frame_index))
+                    progress.advance()
+                self.trees[key] = tree
+                logging.info(f"Built {hash_type} BK-tree of {tree.size} media hashes")
+            return self.trees[key]
+
+    def find_near_duplicates(self, file_name: str, max_distance: int = DEFAULT_MAX_DISTANCE,
+                             hash_type: str = DEFAULT_HASH_TYPE, progress: Progress = None) -> [(str, int)]:
+        """
+        Finds media files that look like a media file. For videos any matching sampled frame counts
+        :param file_name: evidence file name in the media folder
+        :param max_distance: greatest Hamming distance to count as a near-duplicate
+        :param hash_type: ahash, dhash or phash
+        :param progress: reports hashes searched and allows cancelling
+        :return: list of (file name, closest distance), closest first
+        """
+        progress = progress or Progress()
+        tree = self.get_tree(hash_type, progress)
+        own_hashes = [hash_int for _, _, hash_int in DatabaseManager().fetch_perceptual_hashes(hash_type, file_name)]
+
+        progress.start(f"Searching for near-duplicates of {file_name}", len(own_hashes))
+        closest = {}
+        for hash_int in own_hashes:
+            with self.lock:
+                matches = tree.search(hash_int, max_distance)
+            for distance, (other_name, _) in matches:
+                if other_name != file_name and distance < closest.get(other_name, max_distance + 1):
+                    closest[other_name] = distance
+            progress.advance()
+        return sorted(closest.items(), key=lambda item: (item[1], item[0]))
+
+    def cluster_duplicates(self, max_distance: int = DEFAULT_MAX_DISTANCE,
+                           hash_type: str = DEFAULT_HASH_TYPE, progress: Progress = None) -> [[str]]:
+        """
+        Groups all case media into clusters of near-duplicates, each hash is searched once in the tree rather than
+        compared against every other hash
+        :param max_distance: greatest Hamming distance to count as a near-duplicate
+        :param hash_type: ahash, dhash or phash
+        :param progress: reports hashes searched and allows cancelling
+        :return: list of clusters with more than one file, each a sorted list of file names, largest first
+        """
+        progress = progress or Progress()
+        tree = self.get_tree(hash_type, progress)
+
+        # Union-find over file names
+        parents = {}
+
+        def find(name):
+            parents.setdefault(name, name)
+            while parents[name] != name:
+                parents[name] = parents[parents[name]]
+                name = parents[name]
+            return name
+
+        hashes = DatabaseManager().fetch_perceptual_hashes(hash_type)
+        progress.start("Grouping near-duplicate media", len(hashes))
+        for file_name, _, hash_int in hashes:
+            root = find(file_name)
+            with self.lock:
+                matches = tree.search(hash_int, max_distance)
+            for _, (other_name, _) in matches:
+                other_root = find(other_name)
+                if other_root != root:
+                    parents[other_root] = root
+            progress.advance(message=file_name)
+
+        clusters = {}
+        for name in parents:
+            clusters.setdefault(find(name), []).append(name)
+        return sorted((sorted(names) for names in clusters.values() if len(names) > 1),
+                      key=lambda names: (-len(names), names[0]))
@@ -82,6 +82,21 @@ class FlagManager:
         logging.info(f"Loaded flagged media files: {flagged_media_files}")
         return flagged_media_files
 
+    @staticmethod
+    def load_flag_summaries(file_type: str) -> [dict]:
+        """
+        Load every flagged file of a type with its flagged text and comments in one query
+        :param file_type: clog or media
+        :return: list of dictionaries with file_name, flagged_texts and comments, in the order files were flagged
+        """
+        summaries = {}
+        for file_name, flagged_text, comments in DatabaseManager().fetch_flag_summaries(file_type):
+            summary = summaries.setdefault(file_name, {'file_name': file_name, 'flagged_texts': [],
+                                                       'comments': comments})
+            if flagged_text is not None:
+                summary['flagged_texts'].append(flagged_text)
+        return list(summaries.values())
+
     @staticmethod
     def delete_media_file_flag(media_file_name: str) -> None:
         """
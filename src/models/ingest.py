@@ -0,0 +1,226 @@
+import logging
+import mimetypes
+import os
+from src.models.case import CaseModel
+from src.models.duplicates import DuplicateManager
+from src.models.evidence import EvidenceModel
+from src.models.flags import FlagManager
+from src.models.metadata import MetadataManager
+from src.utility.hashsets import CATEGORY_ALERT, HashSetManager
+from src.utility.progress import Cancelled, Progress
+from src.utility.thumbnails import ThumbnailCache
+from src.utility.utility import DatabaseManager, FileManager
+
+logging.basicConfig(level=logging.INFO)
+
+# Which files are chat logs and which are media
+CHATLOG_FILETYPES = [".txt", ".json"]
+# Images and videos
+MEDIA_FILETYPES = [".jpg", ".jpeg", ".png", ".gif", ".bmp", ".mp4", ".mov", ".avi", ".mkv"]
+
+# Outcome of ingesting a file
+INGESTED = 'ingested'
+SKIPPED_MIME_MISMATCH = 'mime_mismatch'
+SKIPPED_DUPLICATE_NAME = 'duplicate_name'
+SKIPPED_UNSUPPORTED = 'unsupported'
+
+
+class IngestManager:
+    """
+    Model for adding files to a case as evidence, shared by the Collection tab and the command line
+    """
+
+    __instance = None
+
+    def __new__(cls):
+        """
+        For Singleton design pattern
+        """
+
+        if cls.__instance is None:
+            cls.__instance = super(IngestManager, cls).__new__(cls)
+
+        return cls.__instance
+
+    def __init__(self):
+        pass
+
+    def ingest_files(self, file_paths: [str], copy: bool = False, progress: Progress = None) -> [dict]:
+        """
+        Adds files to the case as evidence, then extracts metadata and generates thumbnails of the new media
+        :param file_paths: files to add
+        :param copy: copy files into the case rather than moving them
+        :param progress: reports files added and allows cancelling between files, files already added stay added and
+        are returned
+        :return: list of results from ingest_file, in order
+        """
+        progress = progress or Progress()
+        progress.start("Adding evidence", len(file_paths))
+        # Existing evidence names fetched once rather than per file
+        existing_files = {entry['file_name'] for entry in DatabaseManager().fetch_evidence_filename_hash()}
+
+        results = []
+        uploaded_media = []
+        try:
+            for file_path in file_paths:
+                result = self.ingest_file(file_path, existing_files, copy)
+                results.append(result)
+                if result['status'] == INGESTED:
+                    existing_files.add(result['file_name'])
+                    if result['evidence_type'] == 'media':
+                        uploaded_media.append((result['path'], result['md5']))
+                progress.advance(message=result['file_name'])
+
+            # Extract and store metadata of the new media so it is never extracted again
+            MetadataManager().index_files([os.path.basename(file_path) for file_path, _ in uploaded_media], progress)
+        except Cancelled:
+            # Added files are still returned so they are logged, metadata not stored yet is extracted when first viewed
+            logging.info(f"Adding evidence cancelled after {len(results)} of {len(file_paths)} files")
+
+        # Generate video thumbnails in the background for views and reports
+        ThumbnailCache().pregenerate(uploaded_media)
+        return results
+
+    def ingest_file(self, file_path: str, existing_files: {str}, copy: bool = False) -> dict:
+        """
+        Adds a file to the case as evidence
+        :param file_path: file to add
+        :param existing_files: names of evidence already in the case
+        :param copy: copy the file into the case rather than moving it
+        :return: dictionary with the file name, status, and once ingested its evidence type, path, MD5 hash and any
+        hash set matches
+        """
+        file_name = os.path.basename(file_path)
+        result = {'file_name': file_name, 'source': file_path, 'status': INGESTED}
+        logging.info(f"Uploading file: {file_path}")
+
+        # Check no mismatch between expected MIME and true MIME types
+        if self.mime_extension_mismatch(file_path):
+            result['status'] = SKIPPED_MIME_MISMATCH
+            return result
+
+        # Check if file with the same name already exists in the evidence table
+        if file_name in existing_files:
+            logging.info(f"File '{file_path}' already exists, skipping upload")
+            result['status'] = SKIPPED_DUPLICATE_NAME
+            return result
+
+        # Move file to appropriate evidence folder
+        destination_dir = self.evidence_directory(file_path)
+        if destination_dir is None:
+            result['status'] = SKIPPED_UNSUPPORTED
+            return result
+        if copy:
+            FileManager().copy_file(file_path, destination_dir)
+        else:
+            FileManager().move_file(file_path, destination_dir)
+
+        # Compute MD5 hash of file
+        new_file_path = f"{destination_dir}/{file_name}"
+        md5_hash = FileManager().compute_md5_hash(new_file_path)
+        logging.info("MD5 Hash computed for {}: {}".format(file_path, md5_hash))
+
+        # Store file details in db
+        evidence_type = os.path.basename(destination_dir)
+        self.save_evidence_to_db(file_name, evidence_type, md5_hash)
+
+        # Compute perceptual hashes so near-duplicates of media can be found
+        if evidence_type == 'media':
+            DuplicateManager().index_file(file_name, md5_hash)
+
+        # Check the hash against the reference hash sets
+        result.update(evidence_type=evidence_type, path=new_file_path, md5=md5_hash,
+                      hash_set_matches=self.check_hash_sets(file_name, evidence_type, md5_hash))
+        return result
+
+    @staticmethod
+    def check_hash_sets(file_name: str, evidence_type: str, md5_hash: str) -> [dict]:
+        """
+        Checks a new file's hash against the reference hash sets, media matching an alert set is flagged
+        :param file_name: name of the file
+        :param evidence_type: media or chatlogs
+        :param md5_hash: hash of the file
+        :return: metadata of the matching hash sets
+        """
+        matches = HashSetManager().lookup(md5_hash)
+        if not matches:
+            return []
+
+        set_names = ', '.join(f"'{meta['name']}'" for meta in matches)
+        logging.info(f"File '{file_name}' matches hash sets {set_names}")
+
+        # Known-benign matches are only noted, alerts are flagged for examination
+        # Chat logs are not flagged as chat log flags are for messages
+        if any(meta['category'] == CATEGORY_ALERT for meta in matches) and evidence_type == 'media':
+            FlagManager().flag_media(file_name)
+        return matches
+
+    @staticmethod
+    def mime_extension_mismatch(file_path: str) -> bool:
+        """
+        Compares file extension and MIME type to check for a mismatch
+        :param file_path: file path to check
+        :return: true if mismatch, false otherwise
+        """
+
+        # Get mime type of file
+        mime_type = mimetypes.guess_type(file_path)[0]
+        expected_mime_type, _ = mimetypes.guess_type(file_path, strict=False)
+
+        # Check if MIME type matches expected MIME type
+        if mime_type and expected_mime_type:
+            if mime_type != expected_mime_type:
+                logging.info(
+                    "Mismatch between true MIME type {} and expected MIME type {} for file: {}".
+                    format(mime_type, expected_mime_type, file_path))
+                return True
+            else:
+                logging.info("True MIME type matches expected MIME type for file: {}".format(file_path))
+                return False
+        else:
+            logging.info("Unable to determine MIME type or file extension for file: {}".format(file_path))
+            return True
+
+    @staticmethod
+    def evidence_directory(file_path: str) -> str:
+        """
+        Evidence folder a file belongs in
+        :param file_path:
+        :return: evidence/chatlogs or evidence/media directory of the case, None if the file type isn't supported
+        """
+
+        # Where case is stored
+        case_directory = FileManager().case_directory
+
+        # Check file extension
+        _, file_extension = os.path.splitext(file_path)
+
+        # Get destination directory based on extension
+        if file_extension.lower() in CHATLOG_FILETYPES:
+            return os.path.join(case_directory, "evidence", "chatlogs")
+        elif file_extension.lower() in MEDIA_FILETYPES:
+            return os.path.join(case_directory, "evidence", "media")
+        else:
+            logging.error(f"Unsupported file type: {file_extension}")
+            return None
+
+    @staticmethod
+    def save_evidence_to_db(file_name: str, evidence_type: str, md5_hash: str) -> None:
+        """
+        Save evidence info to the db
+        :param file_name: name of the file
+        :param evidence_type: media or chatlogs
+        :param md5_hash: hash of the file
+        :return:
+        """
+
+        # Create evidence model instance
+        evidence = EvidenceModel(case_number=CaseModel().case_number,
+                                 file_name=file_name,
+                                 description=None,
+                                 evidence_type=evidence_type,
+                                 hash_value=md5_hash,
+                                 exif_data=None)
+
+        # Save instance to DB
+        evidence.save()
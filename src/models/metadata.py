@@ -0,0 +1,103 @@
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from src.utility.progress import Progress
+from src.utility.utility import DatabaseManager, FileManager, IMAGE_METADATA_EXTENSIONS
+logging.basicConfig(level=logging.INFO)
+
+# Worker threads extracting metadata, ffprobe runs as a subprocess so threads run in parallel
+METADATA_WORKERS = min(8, os.cpu_count() or 1)
+
+
+class MetadataManager:
+    """
+    Model for media EXIF and container metadata, extracted once at ingest and stored as JSON in the evidence table
+    rather than re-extracted every time it is shown
+    """
+
+    __instance = None
+
+    def __new__(cls):
+        """
+        For Singleton design pattern
+        """
+
+        if cls.__instance is None:
+            cls.__instance = super(MetadataManager, cls).__new__(cls)
+
+        return cls.__instance
+
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def extract(file_name: str) -> dict:
+        """
+        Extracts EXIF and container metadata from a media file
+        :param file_name: evidence file name in the media folder
+        :return: dictionary with 'exif', 'streams' and 'format'
+        """
+        file_path = os.path.join(FileManager().case_directory, 'evidence', 'media', file_name)
+        metadata = {'exif': {}}
+        # Only images carry EXIF
+        if os.path.splitext(file_name)[1].lower() in IMAGE_METADATA_EXTENSIONS:
+            metadata['exif'] = FileManager().read_exif(file_path)
+        metadata.update(FileManager().probe_metadata(file_path))
+        return metadata
+
+    def index_files(self, file_names: [str], progress: Progress = None) -> {str: dict}:
+        """
+        Extracts and stores metadata for media files, in parallel and stored in one transaction
+        :param file_names: evidence file names in the media folder
+        :param progress: reports files extracted
+        :return: dictionary of file name to metadata
+        """
+        if not file_names:
+            return {}
+        progress = progress or Progress()
+        progress.start("Extracting metadata", len(file_names))
+        extracted = {}
+        with ThreadPoolExecutor(max_workers=METADATA_WORKERS) as executor:
+            for file_name, metadata in zip(file_names, executor.map(self.extract, file_names)):
+                extracted[file_name] = metadata
+                progress.advance(message=file_name)
+        # Files that couldn't be probed aren't stored so they are tried again next time
+        stored = [(file_name, json.dumps(metadata)) for file_name, metadata in extracted.items()
+                  if 'streams' in metadata]
+        DatabaseManager().update_evidence_metadata(stored)
+        logging.info(f"Stored metadata for {len(stored)} of {len(extracted)} media files")
+        return extracted
+
+    def load_metadata(self, file_names: [str]) -> {str: dict}:
+        """
+        Loads stored metadata for media files, extracting it for any added before metadata was stored at ingest
+        :param file_names: evidence file names in the media folder
+        :return: dictionary of file name to metadata
+        """
+        stored = DatabaseManager().fetch_evidence_metadata('media')
+        metadata = {}
+        missing = []
+        for file_name in file_names:
+            try:
+                metadata[file_name] = json.loads(stored[file_name])
+            except (KeyError, TypeError, ValueError):
+                missing.append(file_name)
+        metadata.update(self.index_files(missing))
+        return metadata
+
+    def get_exif(self, file_name: str) -> str:
+        """
+        Gets the EXIF data of a media file
+        :param file_name: evidence file name in the media folder
+        :return: String containing EXIF data or 'no exif found'.
+        """
+        return FileManager().format_exif(self.load_metadata([file_name])[file_name].get('exif', {}))
+
+    def get_metadata(self, file_name: str) -> str:
+        """
+        Gets the container and stream metadata of a media file
+        :param file_name: evidence file name in the media folder
+        :return: metadata string or 'no metadata found'
+        """
+        return FileManager().format_metadata(self.load_metadata([file_name])[file_name])
@@ -0,0 +1,443 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+from src.utility.logwriter import BufferedLogWriter, FSYNC_ON_FLUSH
+
+logging.basicConfig(level=logging.INFO)
+
+# Segments are rotated once they reach this size, older segments are never written again
+SEGMENT_MAX_BYTES = 8 * 1024 * 1024
+# Previous hash of the first entry in the chain
+GENESIS_HASH = '0' * 64
+# Timestamp format shown in the activity log view, the same as the old text log
+DISPLAY_FORMAT = "%H:%M %Y-%m-%d"
+LEGACY_LINE_PATTERN = re.compile(r'^(\d{2}:\d{2} \d{4}-\d{2}-\d{2}) (.*)$')
+
+
+def entry_hash(previous_hash: str, record: dict) -> str:
+    """
+    Hash of an entry chained to the entry before it, so editing, removing or reordering any entry breaks every
+    hash after it
+    :param previous_hash: hash of the previous entry
+    :param record: entry without its hash
+    :return: SHA-256 hex digest
+    """
+    canonical = json.dumps(record, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256((previous_hash + canonical).encode('utf-8')).hexdigest()
+
+
+def format_entry(entry: dict) -> str:
+    """
+    Formats an entry as a line of the activity log view
+    :param entry: stored entry
+    :return: timestamp and message
+    """
+    timestamp = datetime.datetime.fromisoformat(entry['timestamp'])
+    return f"{timestamp.strftime(DISPLAY_FORMAT)} {entry['message']}"
+
+
+class ActivityLogStore(BufferedLogWriter):
+    """
+    Append-only activity log stored as hash-chained JSONL segments, with a SQLite index on time, action and file
+    for filtered queries. Entries are buffered and appended in batches
+    """
+
+    def __init__(self, directory: str, fsync_policy: str = FSYNC_ON_FLUSH, segment_max_bytes: int = SEGMENT_MAX_BYTES):
+        """
+        :param directory: directory holding the segments and index
+        :param fsync_policy: always, on_flush or never
+        :param segment_max_bytes: size a segment is rotated at
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.index_path = os.path.join(directory, 'index.sqlite')
+        self.segment_max_bytes = segment_max_bytes
+        # Set when indexing written entries failed, the index is rebuilt from the segments before it is next used
+        self.index_stale = False
+        self.create_index()
+
+        # The segments are the record, the index is rebuilt from them if it has fallen behind or been lost
+        self.segment = max(self.segment_numbers(), default=1)
+        recovered = self.truncate_partial_line()
+        self.seq, self.last_hash = self.read_head()
+        if self.index_head() != self.seq:
+            self.rebuild_index()
+
+        super().__init__(directory, fsync_policy)
+
+        # Record the recovery in the chain itself
+        if recovered is not None:
+            self.append(f"Recovered activity log after an incomplete write: removed {recovered['bytes']} bytes of a "
+                        f"partly written entry from the end of segment {recovered['segment']} "
+                        f"(SHA-256 {recovered['sha256']}), kept in '{os.path.basename(recovered['path'])}'",
+                        'recovery')
+            self.flush()
+
+    def segment_path(self, segment: int) -> str:
+        """
+        Path of a segment file
+        :param segment: segment number
+        :return:
+        """
+        return os.path.join(self.directory, f"segment-{segment:06d}.jsonl")
+
+    def segment_numbers(self) -> [int]:
+        """
+        Numbers of the segments on disk, in order
+        :return:
+        """
+        return sorted(int(name[8:14]) for name in os.listdir(self.directory)
+                      if re.fullmatch(r'segment-\d{6}\.jsonl', name))
+
+    def truncate_partial_line(self) -> dict:
+        """
+        Cuts a partly written last line, left by a crash during a write, off the end of the current segment so the
+        next entry starts on a line of its own. The cut bytes are kept in a file next to the segments
+        :return: dictionary with the segment, bytes removed, their SHA-256 and the file they were kept in, None if the
+        segment ends in a complete line
+        """
+        path = self.segment_path(self.segment)
+        if not os.path.exists(path):
+            return None
+        size = os.path.getsize(path)
+        with open(path, 'rb+') as f:
+            # Find the end of the last complete line, reading back from the end a block at a time
+            end = size
+            while end > 0:
+                start = max(0, end - 65536)
+                f.seek(start)
+                newline = f.read(end - start).rfind(b'\n')
+                if newline != -1:
+                    end = start + newline + 1
+                    break
+                end = start
+            if end == size:
+                return None
+
+            # Keep the partial line before removing it from the segment
+            f.seek(end)
+            partial = f.read()
+            kept_path = f"{path}.partial-{end}"
+            with open(kept_path, 'wb') as kept_file:
+                kept_file.write(partial)
+                kept_file.flush()
+                os.fsync(kept_file.fileno())
+            f.truncate(end)
+            f.flush()
+            os.fsync(f.fileno())
+
+        logging.warning(f"Removed {len(partial)} bytes of a partly written entry from the end of {path}")
+        return {'segment': self.segment, 'bytes': len(partial), 'sha256': hashlib.sha256(partial).hexdigest(),
+                'path': kept_path}
+
+    def read_head(self) -> (int, str):
+        """
+        Reads the sequence number and hash of the last entry from the end of the last segment
+        :return: (sequence number, hash), (0, genesis hash) if the log is empty
+        """
+        for segment in reversed(self.segment_numbers()):
+            with open(self.segment_path(segment), 'rb') as f:
+                # Only the end of the file is read, the last line is shorter than this
+                f.seek(max(0, os.path.getsize(self.segment_path(segment)) - 65536))
+                lines = f.read().splitlines()
+            for line in reversed(lines):
+                try:
+                    entry = json.loads(line)
+                    return entry['seq'], entry['hash']
+                except ValueError:
+                    # A partly written last line from a crash, the entry before it is the head
+                    continue
+        return 0, GENESIS_HASH
+
+    def append(self, message: str, action: str, file_name: str = None, timestamp: datetime.datetime = None) -> None:
+        """
+        Adds an entry, it is chained and written with the next batch
+        :param message: activity description
+        :param action: kind of activity e.g. upload, flag, integrity
+        :param file_name: evidence file the activity concerns, if any
+        :param timestamp: when the activity happened, now if not given
+        :return:
+        """
+        timestamp = timestamp or datetime.datetime.now()
+        self.write({'timestamp': timestamp.isoformat(timespec='seconds'), 'action': action, 'file': file_name,
+                    'message': message})
+
+    def _write_batch(self, entries: [dict]) -> None:
+        """
+        Chains a batch of entries, appends them to the current segment and indexes them in one transaction
+        :param entries: buffered entries
+        :return:
+        """
+        # Rotating only starts a new file, so it never slows appends down
+        path = self.segment_path(self.segment)
+        if os.path.exists(path) and os.path.getsize(path) >= self.segment_max_bytes:
+            self.segment += 1
+            path = self.segment_path(self.segment)
+            logging.info(f"Rotated activity log to segment {self.segment}")
+
+        offset = offset_before = os.path.getsize(path) if os.path.exists(path) else 0
+        seq, previous_hash = self.seq, self.last_hash
+        lines = []
+        rows = []
+        for entry in entries:
+            seq += 1
+            record = dict(entry, seq=seq, prev_hash=previous_hash)
+            record['hash'] = previous_hash = entry_hash(previous_hash, record)
+            line = json.dumps(record, sort_keys=True, separators=(',', ':')) + '\n'
+            lines.append(line)
+            rows.append((seq, record['timestamp'], record['action'], record['file'], self.segment, offset,
+                         record['hash']))
+            offset += len(line.encode('utf-8'))
+
+        try:
+            with open(path, 'a', encoding='utf-8') as segment_file:
+                segment_file.write(''.join(lines))
+                self._sync(segment_file)
+        except OSError:
+            # Remove any part of the batch that was written, so the retry doesn't follow a partial line
+            if os.path.exists(path) and os.path.getsize(path) > offset_before:
+                os.truncate(path, offset_before)
+            raise
+        self.seq, self.last_hash = seq, previous_hash
+        # The entries are chained and on disk now, so a failure to index them mustn't leave them to be written again
+        self.update_index(rows)
+
+    def update_index(self, rows: [tuple]) -> None:
+        """
+        Indexes newly written entries, rebuilding the index from the segments instead if an earlier update failed.
+        Errors are logged rather than raised, the index is marked stale and rebuilt next time
+        :param rows: list of (seq, timestamp, action, file name, segment, offset, hash)
+        :return:
+        """
+        try:
+            if self.index_stale:
+                self.rebuild_index()
+                self.index_stale = False
+            else:
+                self.insert_index_rows(rows)
+        except sqlite3.Error as e:
+            logging.error(f"Failed to index activity log entries, the index will be rebuilt from the segments: "
+                          f"{str(e)}")
+            self.index_stale = True
+
+    def create_index(self) -> None:
+        """
+        Creates the index tables if they don't exist
+        :return:
+        """
+        connection = sqlite3.connect(self.index_path)
+        cursor = connection.cursor()
+        cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS entries (
+                        seq INTEGER PRIMARY KEY,
+                        timestamp TEXT,
+                        action TEXT,
+                        file_name TEXT,
+                        segment INTEGER,
+                        offset INTEGER,
+                        hash TEXT
+                    )
+                ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_entries_timestamp ON entries (timestamp)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_entries_action ON entries (action, timestamp)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_entries_file ON entries (file_name, timestamp)')
+        connection.commit()
+        connection.close()
+
+    def insert_index_rows(self, rows: [tuple]) -> None:
+        """
+        Indexes entries in one transaction
+        :param rows: list of (seq, timestamp, action, file name, segment, offset, hash)
+        :return:
+        """
+        connection = sqlite3.connect(self.index_path)
+        cursor = connection.cursor()
+
+        # Construct the SQL query
+        query = ''' INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?) '''
+
+        cursor.executemany(query, rows)
+        connection.commit()
+        connection.close()
+
+    def index_head(self) -> int:
+        """
+        Sequence number of the last indexed entry
+        :return: 0 if nothing is indexed
+        """
+        connection = sqlite3.connect(self.index_path)
+        result = connection.execute('SELECT MAX(seq) FROM entries').fetchone()[0]
+        connection.close()
+        return result or 0
+
+    def rebuild_index(self) -> None:
+        """
+        Rebuilds the index from the segments
+        :return:
+        """
+        rows = [(entry['seq'], entry['timestamp'], entry['action'], entry['file'], segment, offset, entry['hash'])
+                for segment, offset, entry in self.iter_segment_entries()]
+        connection = sqlite3.connect(self.index_path)
+        connection.execute('DELETE FROM entries')
+        connection.commit()
+        connection.close()
+        self.insert_index_rows(rows)
+        logging.info(f"Rebuilt activity log index of {len(rows)} entries")
+
+    def iter_segment_entries(self):
+        """
+        Streams every entry from the segments in order
+        :return: generator of (segment, offset, entry)
+        """
+        for segment in self.segment_numbers():
+            offset = 0
+            with open(self.segment_path(segment), 'rb') as f:
+                for line in f:
+                    try:
+                        yield segment, offset, json.loads(line)
+                    except ValueError:
+                        # Partly written line from a crash, verification reports it
+                        pass
+                    offset += len(line)
+
+    def iter_entries(self):
+        """
+        Streams every entry, flushing buffered entries first
+        :return: generator of entries, oldest first
+        """
+        self.flush()
+        for _, _, entry in self.iter_segment_entries():
+            yield entry
+
+    def query(self, file_name: str = None, action: str = None, start: datetime.datetime = None,
+              end: datetime.datetime = None, limit: int = None) -> [dict]:
+        """
+        Finds entries using the index, only the matching entries are read from the segments
+        :param file_name: only entries about this file
+        :param action: only entries of this kind
+        :param start: only entries at or after this time
+        :param end: only entries at or before this time
+        :param limit: most recent entries to return
+        :return: list of entries, oldest first
+        """
+        self.flush()
+        if self.index_stale:
+            with self.lock:
+                self.update_index([])
+
+        # Construct the SQL query
+        conditions = []
+        values = []
+        for column, operator, value in [('file_name', '=', file_name), ('action', '=', action),
+                                        ('timestamp', '>=', start and start.isoformat(timespec='seconds')),
+                                        ('timestamp', '<=', end and end.isoformat(timespec='seconds'))]:
+            if value is not None:
+                conditions.append(f"{column} {operator} ?")
+                values.append(value)
+        query = 'SELECT segment, offset FROM entries'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY seq DESC'
+        if limit is not None:
+            query += f' LIMIT {int(limit)}'
+
+        connection = sqlite3.connect(self.index_path)
+        locations = connection.execute(query, values).fetchall()
+        connection.close()
+
+        # Read each entry straight from its offset, opening each segment once
+        entries = []
+        files = {}
+        try:
+            for segment, offset in reversed(locations):
+                if segment not in files:
+                    files[segment] = open(self.segment_path(segment), 'rb')
+                files[segment].seek(offset)
+                try:
+                    entries.append(json.loads(files[segment].readline()))
+                except ValueError:
+                    # The segment no longer matches the index, verify reports where it was altered
+                    logging.error(f"Activity log entry at segment {segment} offset {offset} is unreadable")
+        finally:
+            for f in files.values():
+                f.close()
+        return entries
+
+    def verify(self) -> dict:
+        """
+        Verifies the hash chain in a single streaming pass over the segments
+        :return: dictionary with valid, entries checked, and the sequence number and reason of the first failure
+        """
+        self.flush()
+        previous_hash = GENESIS_HASH
+        expected_seq = 1
+        checked = 0
+        for segment in self.segment_numbers():
+            with open(self.segment_path(segment), 'rb') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        stored_hash = record.pop('hash')
+                    except (ValueError, KeyError):
+                        return {'valid': False, 'entries': checked, 'seq': expected_seq,
+                                'reason': f"unreadable entry in segment {segment}"}
+                    if record.get('seq') != expected_seq:
+                        return {'valid': False, 'entries': checked, 'seq': expected_seq,
+                                'reason': f"expected entry {expected_seq}, found {record.get('seq')}"}
+                    if record.get('prev_hash') != previous_hash or entry_hash(previous_hash, record) != stored_hash:
+                        return {'valid': False, 'entries': checked, 'seq': expected_seq,
+                                'reason': "hash does not match, the entry or one before it has been altered"}
+                    previous_hash = stored_hash
+                    expected_seq += 1
+                    checked += 1
+        return {'valid': True, 'entries': checked, 'seq': None, 'reason': None}
+
+    def rotate(self) -> None:
+        """
+        Starts a new segment, e.g. so a closed-off segment can be archived
+        :return:
+        """
+        with self.lock:
+            self._flush_locked()
+            if os.path.exists(self.segment_path(self.segment)):
+                self.segment += 1
+
+    def migrate_legacy_log(self, legacy_path: str, classify) -> int:
+        """
+        Imports the old plain text activity log into an empty store. The text file is left in place
+        :param legacy_path: path to ActivityLog.txt
+        :param classify: function of message to (action, file name)
+        :return: number of entries imported
+        """
+        if self.seq > 0 or self.buffer or not os.path.exists(legacy_path):
+            return 0
+        with open(legacy_path, 'rb') as f:
+            legacy_digest = hashlib.sha256(f.read()).hexdigest()
+        imported = 0
+        # An entry is only chained once its continuation lines have been read, as messages can span lines
+        timestamp = message = None
+        with open(legacy_path, 'r') as legacy_file:
+            for line in legacy_file:
+                line = line[:-1] if line.endswith('\n') else line
+                match = LEGACY_LINE_PATTERN.match(line)
+                if not match:
+                    # Lines before the first timestamp are kept too, timed as migrated
+                    message = line if message is None else f"{message}\n{line}"
+                    continue
+                if message is not None:
+                    self.append(message, *classify(message), timestamp)
+                    imported += 1
+                timestamp = datetime.datetime.strptime(match.group(1), DISPLAY_FORMAT)
+                message = match.group(2)
+        if message is not None:
+            self.append(message, *classify(message), timestamp)
+            imported += 1
+        self.append(f"Migrated {imported} entries from legacy activity log '{legacy_path}' "
+                    f"(SHA-256 {legacy_digest})", 'migration')
+        self.flush()
+        logging.info(f"Migrated {imported} entries from {legacy_path}")
+        return imported
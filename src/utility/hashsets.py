@@ -0,0 +1,281 @@
+import argparse
+import bisect
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import numpy as np
+from src.utility.progress import Progress
+
+logging.basicConfig(level=logging.INFO)
+
+# Reference hash sets are shared between cases so live outside the case directory
+HASH_SETS_DIR = os.environ.get('CST_HASH_SETS_DIR', os.path.join(os.path.expanduser('~'), '.cst', 'hashsets'))
+
+# Categories of hash set, matches against alert sets are flagged
+CATEGORY_KNOWN_BENIGN = 'known-benign'
+CATEGORY_ALERT = 'alert'
+CATEGORIES = [CATEGORY_KNOWN_BENIGN, CATEGORY_ALERT]
+
+# MD5 digests, the same as the evidence table stores
+DIGEST_SIZE = 16
+# Bloom filter false positive rate, only false positives go on to the binary search
+BLOOM_FALSE_POSITIVE_RATE = 0.001
+# Lines parsed at a time when importing
+IMPORT_CHUNK_LINES = 1000000
+
+MD5_PATTERN = re.compile(r'\b[0-9a-fA-F]{32}\b')
+UINT64_MASK = (1 << 64) - 1
+
+
+def _bloom_positions(h1, h2, bloom_hashes: int, bloom_bits: int):
+    """
+    Bloom filter bit positions using double hashing of the two halves of a digest.
+    Works on Python ints or numpy uint64 arrays, wrapping at 64 bits in both cases
+    """
+    if isinstance(h1, int):
+        return [((h1 + i * h2) & UINT64_MASK) % bloom_bits for i in range(bloom_hashes)]
+    with np.errstate(over='ignore'):
+        return [(h1 + np.uint64(i) * h2) % np.uint64(bloom_bits) for i in range(bloom_hashes)]
+
+
+class _Digests:
+    """
+    Sequence view over a memory-mapped file of sorted fixed-width digests, for bisect
+    """
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def __len__(self):
+        return len(self.buffer) // DIGEST_SIZE
+
+    def __getitem__(self, index):
+        return self.buffer[index * DIGEST_SIZE:(index + 1) * DIGEST_SIZE]
+
+
+class HashSet:
+    """
+    A reference hash set stored as a sorted binary file of digests with a Bloom filter in front.
+    Both files are memory-mapped so opening a set doesn't read it into memory
+    """
+
+    def __init__(self, directory: str, name: str):
+        """
+        :param directory: hash sets directory
+        :param name: hash set name
+        """
+        with open(os.path.join(directory, f"{name}.json")) as f:
+            self.meta = json.load(f)
+        self.name = name
+        self._files = []
+        self.digests = _Digests(self._map(os.path.join(directory, f"{name}.bin")))
+        self.bloom = self._map(os.path.join(directory, f"{name}.bloom"))
+
+    def _map(self, path: str):
+        """
+        Memory-maps a file read only, empty files can't be mapped so get an empty buffer
+        """
+        f = open(path, 'rb')
+        self._files.append(f)
+        if os.path.getsize(path) == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __contains__(self, digest: bytes) -> bool:
+        """
+        Checks if a digest is in the set, the Bloom filter rules out most misses without touching the digests
+        :param digest: 16 byte MD5 digest
+        :return: True if the digest is in the set
+        """
+        bloom_bits = self.meta['bloom_bits']
+        if bloom_bits:
+            h1 = int.from_bytes(digest[:8], 'little')
+            h2 = int.from_bytes(digest[8:], 'little')
+            for position in _bloom_positions(h1, h2, self.meta['bloom_hashes'], bloom_bits):
+                if not self.bloom[position >> 3] & (1 << (position & 7)):
+                    return False
+        index = bisect.bisect_left(self.digests, digest)
+        return index < len(self.digests) and self.digests[index] == digest
+
+    def close(self) -> None:
+        """
+        Closes the memory-mapped files
+        :return:
+        """
+        for buffer in [self.digests.buffer, self.bloom]:
+            if isinstance(buffer, mmap.mmap):
+                buffer.close()
+        for f in self._files:
+            f.close()
+
+
+def _parse_digests(lines: [str]) -> np.ndarray:
+    """
+    Extracts the first MD5 in each line, so plain lists and CSV exports such as NSRL both import
+    :param lines: lines of a hash list
+    :return: array of 16 byte digests
+    """
+    digests = bytearray()
+    for line in lines:
+        match = MD5_PATTERN.search(line)
+        if match:
+            digests += bytes.fromhex(match.group(0))
+    return np.frombuffer(bytes(digests), dtype=f'S{DIGEST_SIZE}')
+
+
+def import_hash_set(source_path: str, name: str, category: str, directory: str = HASH_SETS_DIR,
+                    progress: Progress = None) -> dict:
+    """
+    Imports a text list of MD5 hashes into a sorted, deduplicated binary file and builds its Bloom filter
+    :param source_path: text file with an MD5 on each line, other columns are ignored
+    :param name: name to store the hash set under
+    :param category: known-benign or alert
+    :param directory: hash sets directory
+    :param progress: reports characters parsed and digests added to the Bloom filter, and allows cancelling
+    before the files are written
+    :return: hash set metadata
+    """
+    if category not in CATEGORIES:
+        raise ValueError(f"Unknown hash set category '{category}', expected one of {CATEGORIES}")
+    if not re.fullmatch(r'[\w\-]+', name):
+        raise ValueError(f"Hash set name '{name}' may only contain letters, numbers, underscores and hyphens")
+    os.makedirs(directory, exist_ok=True)
+    logging.info(f"Importing hash set '{name}' from {source_path}")
+
+    # Parse in chunks so the text is never all in memory at once, only the digests
+    progress = progress or Progress()
+    progress.start(f"Reading {os.path.basename(source_path)}", os.path.getsize(source_path))
+    chunks = []
+    with open(source_path, 'r', errors='ignore') as f:
+        lines = []
+        for line in f:
+            lines.append(line)
+            if len(lines) == IMPORT_CHUNK_LINES:
+                chunks.append(_parse_digests(lines))
+                progress.advance(sum(len(line) for line in lines))
+                lines = []
+        chunks.append(_parse_digests(lines))
+        progress.advance(sum(len(line) for line in lines))
+    # Sorts bytewise and removes duplicates
+    digests = np.unique(np.concatenate(chunks))
+
+    # Size the Bloom filter for the false positive rate
+    count = len(digests)
+    bloom_bits = max(64, math.ceil(-count * math.log(BLOOM_FALSE_POSITIVE_RATE) / math.log(2) ** 2))
+    bloom_hashes = max(1, round(bloom_bits / max(count, 1) * math.log(2)))
+    bloom = np.zeros((bloom_bits + 7) // 8, dtype=np.uint8)
+    progress.start("Building Bloom filter", count)
+    for start in range(0, count, IMPORT_CHUNK_LINES):
+        halves = np.frombuffer(digests[start:start + IMPORT_CHUNK_LINES].tobytes(), dtype='<u8').reshape(-1, 2)
+        for positions in _bloom_positions(halves[:, 0], halves[:, 1], bloom_hashes, bloom_bits):
+            np.bitwise_or.at(bloom, positions >> np.uint64(3),
+                             np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+        progress.advance(len(halves))
+
+    meta = {'name': name, 'category': category, 'count': count, 'digest_size': DIGEST_SIZE,
+            'bloom_bits': bloom_bits, 'bloom_hashes': bloom_hashes, 'source': os.path.basename(source_path)}
+
+    # Write to temporary files first so an interrupted import never leaves a partial set behind
+    progress.start(f"Writing hash set '{name}'")
+    for extension, data in [('bin', digests.tobytes()), ('bloom', bloom.tobytes()),
+                            ('json', json.dumps(meta, indent=2).encode())]:
+        path = os.path.join(directory, f"{name}.{extension}")
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+
+    logging.info(f"Imported {count} unique hashes into hash set '{name}' ({category})")
+    return meta
+
+
+class HashSetManager:
+    """
+    Utility class for checking evidence digests against the imported reference hash sets
+    """
+
+    __instance = None
+    # Open hash sets by name, opened on first lookup
+    hash_sets = None
+
+    def __new__(cls):
+        """
+        For Singleton design pattern
+        """
+
+        if cls.__instance is None:
+            cls.__instance = super(HashSetManager, cls).__new__(cls)
+        return cls.__instance
+
+    def __init__(self):
+        pass
+
+    def load_hash_sets(self) -> dict:
+        """
+        Opens every hash set in the hash sets directory
+        :return: dictionary of name to HashSet
+        """
+        if self.hash_sets is None:
+            # Only set once all are open, as lookups can come from other threads
+            hash_sets = {}
+            if os.path.isdir(HASH_SETS_DIR):
+                for file_name in sorted(os.listdir(HASH_SETS_DIR)):
+                    name, extension = os.path.splitext(file_name)
+                    if extension == '.json':
+                        try:
+                            hash_sets[name] = HashSet(HASH_SETS_DIR, name)
+                        except Exception as e:
+                            logging.error(f"Could not open hash set '{name}': {str(e)}")
+            self.hash_sets = hash_sets
+            logging.info(f"Loaded {len(self.hash_sets)} hash sets from {HASH_SETS_DIR}")
+        return self.hash_sets
+
+    def import_hash_set(self, source_path: str, name: str, category: str, progress: Progress = None) -> dict:
+        """
+        Imports a hash list and makes it available for lookups
+        :param source_path: text file with an MD5 on each line
+        :param name: name to store the hash set under
+        :param category: known-benign or alert
+        :param progress: reports the import and allows cancelling, see import_hash_set
+        :return: hash set metadata
+        """
+        # Close any open set of the same name before its files are replaced
+        # The open sets are replaced rather than changed, as files being ingested are looked up from other threads
+        hash_sets = self.load_hash_sets()
+        if name in hash_sets:
+            self.hash_sets = {other: hash_set for other, hash_set in hash_sets.items() if other != name}
+            hash_sets[name].close()
+        try:
+            meta = import_hash_set(source_path, name, category, progress=progress)
+        finally:
+            # Reopened even if the import failed or was cancelled, a set it was replacing is left as it was
+            if os.path.exists(os.path.join(HASH_SETS_DIR, f"{name}.json")):
+                self.hash_sets = {**self.hash_sets, name: HashSet(HASH_SETS_DIR, name)}
+        return meta
+
+    def lookup(self, md5_hash: str) -> [dict]:
+        """
+        Finds the hash sets containing a digest
+        :param md5_hash: hex MD5 hash
+        :return: list of metadata of matching hash sets
+        """
+        digest = bytes.fromhex(md5_hash)
+        return [hash_set.meta for hash_set in self.load_hash_sets().values() if digest in hash_set]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a reference hash set for checking evidence at ingest")
+    parser.add_argument('source', help="Text file with an MD5 hash on each line, other columns are ignored")
+    parser.add_argument('--name', required=True, help="Name to store the hash set under")
+    parser.add_argument('--category', choices=CATEGORIES, required=True,
+                        help="known-benign sets are noted, matches against alert sets are flagged")
+    args = parser.parse_args()
+
+    meta = import_hash_set(args.source, args.name, args.category)
+    print(json.dumps(meta, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+import logging
+import mmap
+import os
+import re
+
+logging.basicConfig(level=logging.INFO)
+
+# Rows shown at a time in the hex popup
+PAGE_ROWS = 256
+# Printable ASCII is shown as is, everything else as '.'
+ASCII_TABLE = bytes(byte if 32 <= byte <= 126 else ord('.') for byte in range(256))
+# Hex search terms are either 0x prefixed or space separated pairs, so words like 'cafe' are searched as text
+HEX_PATTERN = re.compile(r'0x(?:[0-9a-fA-F]{2})+|[0-9a-fA-F]{2}(?:\s+[0-9a-fA-F]{2})+')
+
+
+def format_rows(data: bytes, bytes_per_line: int = 16, start_offset: int = None) -> str:
+    """
+    Formats bytes as rows of hex beside the plaintext. Each row is converted in one call rather than byte by byte
+    :param data: bytes to format
+    :param bytes_per_line: bytes in each row
+    :param start_offset: file offset of the first byte, shown at the start of each row. Not shown if None
+    :return: formatted rows
+    """
+    hex_width = bytes_per_line * 3
+    ascii_data = data.translate(ASCII_TABLE).decode('ascii')
+    lines = []
+    for start in range(0, len(data), bytes_per_line):
+        row = data[start:start + bytes_per_line]
+        line = f"{row.hex(' ').upper():{hex_width}} {ascii_data[start:start + bytes_per_line]}"
+        if start_offset is not None:
+            line = f"{start_offset + start:08X}  {line}"
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def parse_search(text: str) -> bytes:
+    """
+    Parses a search term, hex such as 'FF D8 FF' or '0xFFD8FF' is searched for as bytes, anything else as text
+    :param text: search term
+    :return: bytes to search for
+    """
+    text = text.strip()
+    if HEX_PATTERN.fullmatch(text):
+        return bytes.fromhex(text[2:] if text.startswith('0x') else text)
+    return text.encode('utf-8')
+
+
+def parse_offset(text: str) -> int:
+    """
+    Parses an offset, hex if it starts with 0x otherwise decimal
+    :param text: offset
+    :return: offset in bytes
+    """
+    text = text.strip()
+    return int(text, 16) if text.lower().startswith('0x') else int(text)
+
+
+class HexViewer:
+    """
+    Hex view over a memory-mapped file, only the rows being looked at are read and formatted so files of any size
+    open instantly
+    """
+
+    def __init__(self, file_path: str, bytes_per_line: int = 16):
+        """
+        :param file_path: file to view
+        :param bytes_per_line: bytes in each row
+        """
+        self.file_path = file_path
+        self.bytes_per_line = bytes_per_line
+        self.size = os.path.getsize(file_path)
+        self.file = open(file_path, 'rb')
+        # Empty files can't be memory-mapped
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b''
+
+    @property
+    def row_count(self) -> int:
+        """
+        Number of rows in the whole file
+        """
+        return -(-self.size // self.bytes_per_line)
+
+    def row_of(self, offset: int) -> int:
+        """
+        Row containing a file offset
+        :param offset: offset in bytes
+        :return: row index
+        """
+        return max(0, min(offset, self.size - 1)) // self.bytes_per_line
+
+    def page(self, first_row: int, rows: int = PAGE_ROWS) -> str:
+        """
+        Formats a page of rows
+        :param first_row: index of the first row
+        :param rows: number of rows
+        :return: formatted rows with their offsets
+        """
+        start = first_row * self.bytes_per_line
+        return format_rows(self.data[start:start + rows * self.bytes_per_line], self.bytes_per_line, start)
+
+    def find(self, pattern: bytes, start: int = 0, wrap: bool = True) -> int:
+        """
+        Searches the file for bytes, mmap.find searches in C without reading the file into memory
+        :param pattern: bytes to search for
+        :param start: offset to search from
+        :param wrap: whether to continue from the start of the file if not found after start
+        :return: offset of the match, or -1 if not found
+        """
+        if not pattern or not self.size:
+            return -1
+        offset = self.data.find(pattern, start)
+        if offset == -1 and wrap and start > 0:
+            offset = self.data.find(pattern, 0, start + len(pattern) - 1)
+        return offset
+
+    def close(self) -> None:
+        """
+        Closes the memory-mapped file
+        :return:
+        """
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
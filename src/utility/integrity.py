@@ -0,0 +1,145 @@
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from src.utility.progress import Progress
+from src.utility.utility import DatabaseManager, FileManager
+
+logging.basicConfig(level=logging.INFO)
+
+# Outcome of checking a file
+STATUS_PASSED = 'passed'
+STATUS_FAILED = 'failed'
+STATUS_MISSING = 'missing'      # recorded in the evidence table but not on disk
+STATUS_UNTRACKED = 'untracked'  # on disk but not recorded in the evidence table
+STATUSES = [STATUS_PASSED, STATUS_FAILED, STATUS_MISSING, STATUS_UNTRACKED]
+
+# Evidence directories checked, relative to the case directory
+EVIDENCE_DIRECTORIES = [os.path.join('evidence', 'chatlogs'), os.path.join('evidence', 'media')]
+# Worker threads hashing files, hashlib releases the GIL so large files hash in parallel
+INTEGRITY_WORKERS = min(4, os.cpu_count() or 1)
+HASH_CHUNK_SIZE = 1024 * 1024
+# Failed file names listed in the activity log summary, the rest are counted
+SUMMARY_MAX_FILES = 20
+
+
+def md5_file(file_path: str) -> str:
+    """
+    Computes the MD5 hash of a file in large chunks
+    :param file_path:
+    :return: MD5 hash
+    """
+    md5_hash = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            md5_hash.update(chunk)
+    return md5_hash.hexdigest()
+
+
+def integrity_status(original_hash: str, recomputed_hash: str) -> str:
+    """
+    Outcome of checking a file
+    :param original_hash: hash recorded at upload, None if the file isn't in the evidence table
+    :param recomputed_hash: hash of the file now, None if it isn't on disk
+    :return: passed, failed, missing or untracked
+    """
+    if recomputed_hash is None:
+        return STATUS_MISSING
+    if original_hash is None:
+        return STATUS_UNTRACKED
+    return STATUS_PASSED if original_hash == recomputed_hash else STATUS_FAILED
+
+
+class IntegrityVerifier:
+    """
+    Recomputes the hashes of a case's evidence files and compares them with the hashes recorded at upload
+    """
+
+    def __init__(self, case_directory: str = None, workers: int = INTEGRITY_WORKERS):
+        """
+        :param case_directory: case to check, the open case if not given
+        :param workers: threads hashing files
+        """
+        self.case_directory = case_directory or FileManager().case_directory
+        self.workers = workers
+
+    def evidence_files(self) -> {str: str}:
+        """
+        Finds the evidence files on disk
+        :return: dictionary of file name to path
+        """
+        files = {}
+        for directory in EVIDENCE_DIRECTORIES:
+            directory = os.path.join(self.case_directory, directory)
+            if not os.path.isdir(directory):
+                logging.error(f"Directory was not found: {directory}")
+                continue
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    # Skip hidden files and directories
+                    if not entry.name.startswith('.') and entry.is_file():
+                        files[entry.name] = entry.path
+        return files
+
+    def verify(self, progress: Progress = None) -> dict:
+        """
+        Checks every evidence file against its recorded hash
+        :param progress: reports files hashed and allows cancelling
+        :return: dictionary with results, a list of (file name, original hash, recomputed hash, status) sorted by
+        file name, counts of each status and seconds taken
+        """
+        started = time.perf_counter()
+
+        # Recorded hashes keyed by file name, so each file is looked up once
+        original_hashes = {row['file_name']: row['hash_value']
+                           for row in DatabaseManager().fetch_evidence_filename_hash()}
+        files = self.evidence_files()
+
+        progress = progress or Progress()
+        progress.start("Hashing evidence", len(files))
+        recomputed_hashes = {}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='integrity') as executor:
+            futures = {file_name: executor.submit(md5_file, path) for file_name, path in files.items()}
+            try:
+                for file_name, future in futures.items():
+                    recomputed_hashes[file_name] = future.result()
+                    progress.advance(message=file_name)
+            except BaseException:
+                # Files not started yet aren't hashed once cancelled
+                for future in futures.values():
+                    future.cancel()
+                raise
+
+        results = []
+        for file_name in sorted(original_hashes.keys() | files.keys()):
+            original_hash = original_hashes.get(file_name)
+            recomputed_hash = recomputed_hashes.get(file_name)
+            status = integrity_status(original_hash, recomputed_hash)
+            results.append((file_name, original_hash or '', recomputed_hash or '', status))
+
+        counts = {status: 0 for status in STATUSES}
+        for result in results:
+            counts[result[3]] += 1
+        seconds = time.perf_counter() - started
+        logging.info(f"Checked integrity of {len(results)} files in {seconds:.2f}s: {counts}")
+        return {'results': results, 'counts': counts, 'seconds': seconds}
+
+    @staticmethod
+    def summarise(report: dict) -> str:
+        """
+        Summarises a check in one activity log entry, naming the files that didn't pass
+        :param report: result of verify
+        :return:
+        """
+        counts = report['counts']
+        summary = (f"File integrity check of {len(report['results'])} files: {counts[STATUS_PASSED]} passed, "
+                   f"{counts[STATUS_FAILED]} failed, {counts[STATUS_MISSING]} missing, "
+                   f"{counts[STATUS_UNTRACKED]} untracked")
+        for status in [STATUS_FAILED, STATUS_MISSING, STATUS_UNTRACKED]:
+            names = [file_name for file_name, _, _, result_status in report['results'] if result_status == status]
+            if names:
+                listed = ', '.join(f"'{name}'" for name in names[:SUMMARY_MAX_FILES])
+                more = f" and {len(names) - SUMMARY_MAX_FILES} more" if len(names) > SUMMARY_MAX_FILES else ''
+                summary += f"; {status}: {listed}{more}"
+        return summary
@@ -0,0 +1,341 @@
+import hashlib
+import importlib.util
+import logging
+import math
+import os
+import queue
+import sys
+import threading
+import time
+from src.utility.integrity import (EVIDENCE_DIRECTORIES, HASH_CHUNK_SIZE, IntegrityVerifier, STATUS_MISSING,
+                                   STATUS_PASSED, STATUS_UNTRACKED, integrity_status)
+from src.utility.utility import DatabaseManager
+
+logging.basicConfig(level=logging.INFO)
+
+# Set to 0 to turn the background monitor off
+INTEGRITY_MONITOR_ENABLED = os.environ.get('CST_INTEGRITY_MONITOR', '1') != '0'
+# Most the monitor reads from disk, in MB per second, so it never competes with the investigator's own work
+INTEGRITY_MONITOR_MBPS = float(os.environ.get('CST_INTEGRITY_MONITOR_MBPS', '20'))
+# How often touched files are checked, and the evidence tree scanned for changes when it can't be watched
+POLL_INTERVAL = 5.0
+# Seconds between deep checks, each re-hashing the next slice of all evidence whether touched or not
+DEEP_CHECK_INTERVAL = float(os.environ.get('CST_INTEGRITY_DEEP_CHECK_INTERVAL', '900'))
+# Fraction of the evidence in each slice, so all evidence is deep checked every 1 / fraction intervals
+DEEP_CHECK_FRACTION = 0.05
+DEEP_CHECK_MIN_FILES = 10
+# Files not yet in the evidence table are only reported as untracked after this long, uploads add them shortly
+UNTRACKED_GRACE = 60.0
+# Niceness of the monitor thread where threads can be given their own priority
+MONITOR_NICENESS = 10
+
+
+class MonitorStopped(Exception):
+    """
+    Raised inside the monitor thread when it is stopped part way through hashing a file
+    """
+
+
+class Throttle:
+    """
+    Limits the rate bytes are read at by sleeping once reads get ahead of the budget
+    """
+
+    def __init__(self, bytes_per_second: float, stopped: threading.Event):
+        """
+        :param bytes_per_second: read budget
+        :param stopped: event ending any wait early
+        """
+        self.bytes_per_second = bytes_per_second
+        self.stopped = stopped
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Starts a new budget window, so time spent idle doesn't allow a burst of reads
+        :return:
+        """
+        self.started = time.monotonic()
+        self.consumed = 0
+
+    def consume(self, byte_count: int) -> None:
+        """
+        Records bytes read, waiting if they are over budget
+        :param byte_count:
+        :return:
+        """
+        self.consumed += byte_count
+        ahead = self.consumed / self.bytes_per_second - (time.monotonic() - self.started)
+        if ahead > 0 and self.stopped.wait(ahead):
+            raise MonitorStopped()
+
+
+class IntegrityMonitor:
+    """
+    Watches a case's evidence directories in a low priority background thread, re-hashing files as they are
+    touched plus a slice of all evidence on a schedule, and queues an alert whenever a file's status changes.
+    Uses watchdog to be told of changes where it is installed, otherwise scans the directories for changes
+    """
+
+    def __init__(self, case_directory: str, mbps: float = INTEGRITY_MONITOR_MBPS, poll_interval: float = POLL_INTERVAL,
+                 deep_check_interval: float = DEEP_CHECK_INTERVAL):
+        """
+        :param case_directory: case whose evidence is monitored
+        :param mbps: read budget in MB per second
+        :param poll_interval: seconds between checks of touched files
+        :param deep_check_interval: seconds between deep checks
+        """
+        self.case_directory = case_directory
+        self.directories = [os.path.join(case_directory, directory) for directory in EVIDENCE_DIRECTORIES]
+        self.poll_interval = poll_interval
+        self.deep_check_interval = deep_check_interval
+        self.stopped = threading.Event()
+        self.throttle = Throttle(mbps * 1e6, self.stopped)
+
+        # Alerts for the UI thread to show, as dictionaries of file name, status, original hash and recomputed hash
+        self.alerts = queue.Queue()
+        # Last status reported for each file, so each change is alerted once
+        self.statuses = {}
+        # Files touched since they were last checked, file name to path
+        self.touched = {}
+        self.touched_lock = threading.Lock()
+        # Files waiting out the untracked grace period, file name to (path, time first seen)
+        self.untracked = {}
+        # Size and modification time of each file from the last scan, when polling
+        self.snapshot = {}
+        self.deep_check_cursor = 0
+        self.last_deep_check = None
+        self.observer = None
+        self.thread = threading.Thread(target=self.run, name='integrity-monitor', daemon=True)
+
+    @property
+    def mode(self) -> str:
+        """
+        How changes are detected
+        :return: watching or polling
+        """
+        return 'watching' if self.observer is not None else 'polling'
+
+    def start(self) -> None:
+        """
+        Starts monitoring
+        :return:
+        """
+        self.observer = self.start_observer()
+        if self.observer is None:
+            self.snapshot = self.scan()
+        self.thread.start()
+        logging.info(f"Integrity monitor started for {self.case_directory}, {self.mode} for changes")
+
+    def stop(self) -> None:
+        """
+        Stops monitoring, a file being hashed is abandoned rather than waited for
+        :return:
+        """
+        self.stopped.set()
+        if self.observer is not None:
+            self.observer.stop()
+        logging.info(f"Integrity monitor stopped for {self.case_directory}")
+
+    def start_observer(self):
+        """
+        Watches the evidence directories with watchdog if it is installed
+        :return: running observer, None to fall back to polling
+        """
+        if importlib.util.find_spec('watchdog') is None:
+            return None
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+
+        monitor = self
+
+        class EvidenceEventHandler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if not event.is_directory:
+                    for path in [event.src_path, getattr(event, 'dest_path', None)]:
+                        if path:
+                            monitor.touch(os.fsdecode(path))
+
+        try:
+            observer = Observer()
+            for directory in self.directories:
+                if os.path.isdir(directory):
+                    observer.schedule(EvidenceEventHandler(), directory, recursive=False)
+            observer.daemon = True
+            observer.start()
+            return observer
+        except Exception as e:
+            # e.g. out of inotify watches
+            logging.warning(f"Can't watch evidence for changes, polling instead: {str(e)}")
+            return None
+
+    def touch(self, path: str) -> None:
+        """
+        Marks a file as needing to be checked
+        :param path:
+        :return:
+        """
+        file_name = os.path.basename(path)
+        if not file_name.startswith('.'):
+            with self.touched_lock:
+                self.touched[file_name] = path
+
+    def scan(self) -> {str: (int, int)}:
+        """
+        Reads the size and modification time of every evidence file
+        :return: dictionary of path to (size, modification time)
+        """
+        snapshot = {}
+        for directory in self.directories:
+            if not os.path.isdir(directory):
+                continue
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if not entry.name.startswith('.') and entry.is_file():
+                        stat = entry.stat()
+                        snapshot[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def poll(self) -> None:
+        """
+        Marks files added, changed or removed since the last scan as touched
+        :return:
+        """
+        snapshot = self.scan()
+        for path in snapshot.keys() | self.snapshot.keys():
+            if snapshot.get(path) != self.snapshot.get(path):
+                self.touch(path)
+        self.snapshot = snapshot
+
+    def run(self) -> None:
+        """
+        Monitor thread, checks touched files every poll interval and runs deep checks on schedule
+        :return:
+        """
+        self.lower_priority()
+        next_deep_check = time.monotonic() + self.deep_check_interval
+        try:
+            while not self.stopped.wait(self.poll_interval):
+                self.throttle.reset()
+                if self.observer is None:
+                    self.poll()
+                with self.touched_lock:
+                    touched, self.touched = self.touched, {}
+                for file_name, path in sorted(touched.items()):
+                    self.check_file(file_name, path, DatabaseManager().fetch_evidence_hash_by_file_name(file_name))
+                self.check_untracked()
+                if time.monotonic() >= next_deep_check:
+                    self.deep_check()
+                    next_deep_check = time.monotonic() + self.deep_check_interval
+        except MonitorStopped:
+            pass
+        except Exception as e:
+            logging.error(f"Integrity monitor stopped unexpectedly: {str(e)}")
+
+    @staticmethod
+    def lower_priority() -> None:
+        """
+        Lowers the CPU priority of the calling thread, only Linux gives threads their own priority
+        :return:
+        """
+        if sys.platform.startswith('linux'):
+            try:
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), MONITOR_NICENESS)
+            except OSError as e:
+                logging.warning(f"Couldn't lower integrity monitor priority: {str(e)}")
+
+    def hash_file(self, path: str) -> str:
+        """
+        Computes the MD5 hash of a file within the read budget
+        :param path:
+        :return: MD5 hash, None if the file is gone
+        """
+        md5_hash = hashlib.md5()
+        try:
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                    md5_hash.update(chunk)
+                    self.throttle.consume(len(chunk))
+        except FileNotFoundError:
+            return None
+        return md5_hash.hexdigest()
+
+    def check_file(self, file_name: str, path: str, original_hash: str) -> None:
+        """
+        Re-hashes a file and reports its status
+        :param file_name:
+        :param path: where the file is, or was
+        :param original_hash: hash recorded at upload, None if the file isn't in the evidence table
+        :return:
+        """
+        if original_hash is None:
+            # Not evidence yet, possibly still being uploaded
+            if os.path.isfile(path):
+                self.untracked.setdefault(file_name, (path, time.monotonic()))
+            else:
+                self.untracked.pop(file_name, None)
+                self.statuses.pop(file_name, None)
+            return
+        self.untracked.pop(file_name, None)
+        recomputed_hash = self.hash_file(path) if os.path.isfile(path) else None
+        self.report(file_name, integrity_status(original_hash, recomputed_hash), original_hash, recomputed_hash)
+
+    def check_untracked(self) -> None:
+        """
+        Reports files still not in the evidence table once their grace period is over
+        :return:
+        """
+        for file_name, (path, first_seen) in list(self.untracked.items()):
+            if time.monotonic() - first_seen < UNTRACKED_GRACE:
+                continue
+            del self.untracked[file_name]
+            original_hash = DatabaseManager().fetch_evidence_hash_by_file_name(file_name)
+            if original_hash is None and os.path.isfile(path):
+                self.report(file_name, STATUS_UNTRACKED, None, None)
+            else:
+                self.check_file(file_name, path, original_hash)
+
+    def deep_check(self) -> None:
+        """
+        Re-hashes the next slice of all evidence, touched or not, so changes made while the toolkit wasn't running
+        are found too
+        :return:
+        """
+        original_hashes = {row['file_name']: row['hash_value']
+                           for row in DatabaseManager().fetch_evidence_filename_hash()}
+        files = IntegrityVerifier(self.case_directory).evidence_files()
+        file_names = sorted(original_hashes.keys() | files.keys())
+        if not file_names:
+            return
+
+        count = min(len(file_names), max(DEEP_CHECK_MIN_FILES, math.ceil(len(file_names) * DEEP_CHECK_FRACTION)))
+        started = time.perf_counter()
+        for i in range(count):
+            file_name = file_names[(self.deep_check_cursor + i) % len(file_names)]
+            if file_name not in files:
+                self.report(file_name, STATUS_MISSING, original_hashes[file_name], None)
+            else:
+                self.check_file(file_name, files[file_name], original_hashes.get(file_name))
+        self.deep_check_cursor = (self.deep_check_cursor + count) % len(file_names)
+        self.last_deep_check = time.time()
+        logging.info(f"Integrity monitor deep checked {count} of {len(file_names)} files in "
+                     f"{time.perf_counter() - started:.1f}s")
+
+    def report(self, file_name: str, status: str, original_hash: str, recomputed_hash: str) -> None:
+        """
+        Queues an alert if a file's status has changed, including a file passing again after an alert
+        :param file_name:
+        :param status:
+        :param original_hash:
+        :param recomputed_hash:
+        :return:
+        """
+        if self.stopped.is_set():
+            return
+        previous = self.statuses.get(file_name, STATUS_PASSED)
+        self.statuses[file_name] = status
+        if status == previous:
+            return
+        logging.warning(f"Integrity monitor: {file_name} {status}")
+        self.alerts.put({'file_name': file_name, 'status': status, 'original_hash': original_hash or '',
+                         'recomputed_hash': recomputed_hash or '', 'time': time.time()})
@@ -0,0 +1,112 @@
+import atexit
+import logging
+import os
+import threading
+
+logging.basicConfig(level=logging.INFO)
+
+# When buffered lines are forced to disk with fsync
+FSYNC_ALWAYS = 'always'      # every line is written and synced straight away
+FSYNC_ON_FLUSH = 'on_flush'  # lines are synced each time the buffer is flushed
+FSYNC_NEVER = 'never'        # left to the operating system
+FSYNC_POLICIES = [FSYNC_ALWAYS, FSYNC_ON_FLUSH, FSYNC_NEVER]
+
+# Buffered lines are flushed after this many seconds or once this many lines are waiting, whichever is first
+FLUSH_INTERVAL = 1.0
+FLUSH_LINES = 200
+
+
+class BufferedLogWriter:
+    """
+    Appends lines to a log file through an in-memory buffer, so bulk operations logging a line per file write once
+    rather than opening the file for every line
+    """
+
+    def __init__(self, path: str, fsync_policy: str = FSYNC_ON_FLUSH, flush_interval: float = FLUSH_INTERVAL,
+                 flush_lines: int = FLUSH_LINES):
+        """
+        :param path: log file to append to
+        :param fsync_policy: always, on_flush or never
+        :param flush_interval: greatest number of seconds a line waits in the buffer
+        :param flush_lines: number of waiting lines that triggers a flush
+        """
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy '{fsync_policy}', expected one of {FSYNC_POLICIES}")
+        self.path = path
+        self.fsync_policy = fsync_policy
+        self.flush_interval = flush_interval
+        self.flush_lines = 1 if fsync_policy == FSYNC_ALWAYS else flush_lines
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+
+        # Flushes on a timer so lines never wait long when there are few of them
+        self.flusher = threading.Thread(target=self._flush_periodically, name='log-flusher', daemon=True)
+        self.flusher.start()
+        atexit.register(self.close)
+
+    def write(self, line) -> None:
+        """
+        Adds a line to the buffer, flushing if enough lines are waiting
+        :param line: line including its newline, or an entry for subclasses that write entries
+        :return:
+        """
+        with self.lock:
+            self.buffer.append(line)
+            if len(self.buffer) >= self.flush_lines:
+                self._flush_locked()
+
+    def flush(self) -> None:
+        """
+        Writes all waiting lines to the file
+        :return:
+        """
+        with self.lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        """
+        Writes all waiting lines in one append, the lock must be held
+        """
+        if not self.buffer:
+            return
+        try:
+            self._write_batch(self.buffer)
+            self.buffer = []
+        except Exception as e:
+            # Lines are kept in the buffer and retried on the next flush
+            logging.error(f"Failed to write to log {self.path}: {str(e)}")
+
+    def _write_batch(self, lines: list) -> None:
+        """
+        Appends a batch of lines to the file in one write, subclasses override this to store entries differently
+        :param lines: buffered lines
+        :return:
+        """
+        with open(self.path, 'a') as log_file:
+            log_file.write(''.join(lines))
+            self._sync(log_file)
+
+    def _sync(self, log_file) -> None:
+        """
+        Forces a written file to disk unless the fsync policy is never
+        """
+        if self.fsync_policy != FSYNC_NEVER:
+            log_file.flush()
+            os.fsync(log_file.fileno())
+
+    def _flush_periodically(self) -> None:
+        """
+        Flushes every flush_interval seconds until closed
+        """
+        while not self.closed.wait(self.flush_interval):
+            self.flush()
+
+    def close(self) -> None:
+        """
+        Flushes remaining lines and stops the flush timer
+        :return:
+        """
+        self.closed.set()
+        self.flush()
+        atexit.unregister(self.close)
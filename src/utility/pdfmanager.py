@@ -1,11 +1,57 @@
+import hashlib
+import json
+import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from fpdf import FPDF
 from src.models.case import CaseModel
 from src.models.flags import FlagManager
 from src.models.incident import IncidentModel
+from src.models.metadata import MetadataManager
 from src.models.victim_suspect import VictimModel, SuspectModel
+from src.utility.thumbnails import ThumbnailCache
 from src.utility.utility import FileManager, DatabaseManager
 
+logging.basicConfig(level=logging.INFO)
+
+# Resolution media is embedded at, the originals are downscaled to this rather than embedded at full size
+REPORT_IMAGE_DPI = int(os.environ.get('CST_REPORT_IMAGE_DPI', 150))
+# Size media is shown at in the report
+REPORT_IMAGE_MM = 50
+# Worker threads downscaling media for the report
+REPORT_WORKERS = min(4, os.cpu_count() or 1)
+# Changed whenever the layout of a section changes, so sections cached by older versions are rendered again
+SECTION_CACHE_VERSION = 1
+
+# Fields of each person section as (label, model attribute)
+VICTIM_FIELDS = [("Name", 'name'), ("DoB", 'dob'), ("Nationality", 'nationality'),
+                 ("Special Considerations", 'special_considerations'), ("Address", 'address'), ("Email", 'email'),
+                 ("Phone", 'phone'), ("Profiles", 'profiles'), ("Screen Names", 'screen_names'),
+                 ("School", 'school'), ("Additional Info", 'additional_info')]
+SUSPECT_FIELDS = [("Name", 'name'), ("DoB", 'dob'), ("Nationality", 'nationality'),
+                  ("Special Considerations", 'special_considerations'), ("Address", 'address'), ("Email", 'email'),
+                  ("Phone", 'phone'), ("Profiles", 'profiles'), ("Screen Names", 'screen_names'),
+                  ("School", 'school'), ("Occupation", 'occupation'), ("Business Address", 'business_address'),
+                  ("Additional Info", 'additional_info')]
+INCIDENT_FIELDS = [("Sextortion Type", 'type_of_sextortion'), ("Threats", 'threats_made'),
+                   ("Demands", 'demands_made'), ("Start", 'start_date_time'), ("End", 'end_date_time')]
+
+
+class SectionRecorder:
+    """
+    Records the FPDF calls that draw a report section so they can be cached and replayed into later reports
+    """
+
+    def __init__(self):
+        # List of [method name, args, kwargs]
+        self.ops = []
+
+    def __getattr__(self, name):
+        def record(*args, **kwargs):
+            self.ops.append([name, list(args), kwargs])
+        return record
+
 
 class PDFManager:
     """
@@ -26,41 +72,139 @@ class PDFManager:
     def __init__(self):
         pass
 
-    @staticmethod
-    def create_pdf() -> None:
+    def create_pdf(self, image_dpi: int = REPORT_IMAGE_DPI) -> dict:
         """
-        Creates PDF report
-        :return:
+        Creates PDF report from sections, only sections whose inputs have changed since the last report are rendered
+        again, the rest are replayed from the section cache
+        :param image_dpi: resolution media is embedded at
+        :return: dictionary with the report path, seconds taken, size in bytes, number of media files and the
+        sections rendered
         """
+        start = time.perf_counter()
+
+        # Inputs of every section, everything flagged is fetched in a few set-based queries
+        inputs = self.section_inputs(image_dpi)
+        builders = {
+            'title': self.build_title,
+            'case': self.build_case,
+            'investigators': self.build_investigators,
+            'victim': lambda pdf, rows: self.build_details(pdf, "Victim Information", rows),
+            'suspect': lambda pdf, rows: self.build_details(pdf, "Suspect Information", rows),
+            'incident': lambda pdf, rows: self.build_details(pdf, "Incident Information", rows),
+            'clogs': self.build_clogs,
+            'media': self.build_media,
+        }
+
+        cache = self.load_section_cache()
+        rendered = []
+
         # Create instance of FPDF class
         pdf = FPDF('P', 'mm', 'Legal', 'case_number')
 
         # Add a page
         pdf.add_page()
 
-        # Title
-        title = CaseModel().case_name + " Report"
+        for name, build in builders.items():
+            fingerprint = hashlib.sha256(json.dumps([SECTION_CACHE_VERSION, inputs[name]], sort_keys=True,
+                                                    default=str).encode()).hexdigest()
+            cached = cache.get(name)
+            if cached is None or cached['fingerprint'] != fingerprint or not self.images_exist(cached['ops']):
+                recorder = SectionRecorder()
+                build(recorder, inputs[name])
+                cache[name] = {'fingerprint': fingerprint, 'ops': recorder.ops}
+                rendered.append(name)
+            # Stitch the section into the report
+            for method, args, kwargs in cache[name]['ops']:
+                getattr(pdf, method)(*args, **kwargs)
+
+        self.save_section_cache(cache)
+
+        # Save the PDF to a file
+        path = os.path.join(FileManager().case_directory, 'reports', f"{CaseModel().case_name}-report.pdf")
+        pdf.output(path)
+
+        report = {'path': path, 'seconds': time.perf_counter() - start, 'size_bytes': os.path.getsize(path),
+                  'media_files': len(inputs['media']['flagged']), 'sections_rendered': rendered}
+        logging.info(f"Generated report {path} in {report['seconds']:.1f}s, {report['size_bytes'] / 1e6:.1f} MB, "
+                     f"{report['media_files']} media files at {image_dpi} DPI, rendered sections {rendered}, "
+                     f"reused {len(builders) - len(rendered)}")
+        return report
+
+    @staticmethod
+    def section_inputs(image_dpi: int) -> dict:
+        """
+        Gathers everything each section is drawn from, a section is only rendered again if its inputs change
+        :param image_dpi: resolution media is embedded at
+        :return: dictionary of section name to inputs
+        """
+        flagged_media = FlagManager().load_flag_summaries('media')
+        media_hashes = {row[2]: row[5] for row in DatabaseManager().fetch_evidence_by_type('media')}
+        # Stored metadata of all flagged media in one query
+        media_metadata = MetadataManager().load_metadata([media['file_name'] for media in flagged_media])
+
+        return {
+            'title': CaseModel().case_name,
+            'case': [CaseModel().case_name, CaseModel().referral_source, FileManager().case_directory],
+            'investigators': [list(investigator) for investigator in DatabaseManager().fetch_all_investigators()],
+            'victim': [(label, str(getattr(VictimModel(), field))) for label, field in VICTIM_FIELDS],
+            'suspect': [(label, str(getattr(SuspectModel(), field))) for label, field in SUSPECT_FIELDS],
+            'incident': [(label, str(getattr(IncidentModel(), field))) for label, field in INCIDENT_FIELDS],
+            'clogs': FlagManager().load_flag_summaries('clog'),
+            'media': {
+                'flagged': flagged_media,
+                # Evidence digests, so a changed file is drawn again
+                'hashes': [media_hashes.get(media['file_name']) for media in flagged_media],
+                'exif': [media_metadata[media['file_name']].get('exif', {}) for media in flagged_media],
+                'size_px': round(REPORT_IMAGE_MM / 25.4 * image_dpi),
+            },
+        }
+
+    @staticmethod
+    def build_title(pdf, case_name: str) -> None:
+        """
+        Draws the report title
+        :param pdf: FPDF or SectionRecorder
+        :param case_name:
+        :return:
+        """
+        # The title is centred, measured on a scratch document as the recorder can't measure text
+        title = case_name + " Report"
+        measure = FPDF('P', 'mm', 'Legal')
+        measure.set_font('helvetica', 'B', 20)
+        title_width = measure.get_string_width(title) + 6
         pdf.set_font('helvetica', 'B', 20)
-        title_width = pdf.get_string_width(title) + 6
-        doc_width = pdf.w
-        pdf.set_x((doc_width - title_width) / 2)
+        pdf.set_x((measure.w - title_width) / 2)
         pdf.set_line_width(1)
         pdf.cell(title_width, 10, title, border=1, align='C')
         pdf.ln(10)
 
-        # Case Information Heading
+    @staticmethod
+    def build_case(pdf, case: list) -> None:
+        """
+        Draws the case information
+        :param pdf: FPDF or SectionRecorder
+        :param case: case name, referral source and case directory
+        :return:
+        """
+        case_name, referral_source, case_directory = case
         pdf.set_font('helvetica', 'B', 14)
         pdf.cell(0, 10, "Case Information", ln=True, align='L')
         pdf.set_font('helvetica', '', 10)
-        pdf.cell(0, 10, text=f"Case Name: {CaseModel().case_name}", ln=True)
-        pdf.cell(0, 10, text=f"Referral Source: {CaseModel().referral_source}", ln=True)
-        pdf.cell(0, 10, text=f"Case Directory: {FileManager().case_directory}", ln=True)
+        pdf.cell(0, 10, text=f"Case Name: {case_name}", ln=True)
+        pdf.cell(0, 10, text=f"Referral Source: {referral_source}", ln=True)
+        pdf.cell(0, 10, text=f"Case Directory: {case_directory}", ln=True)
         pdf.ln(10)
 
-        # Investigators Heading
+    @staticmethod
+    def build_investigators(pdf, investigators: list) -> None:
+        """
+        Draws the investigators
+        :param pdf: FPDF or SectionRecorder
+        :param investigators: investigator rows
+        :return:
+        """
         pdf.set_font('helvetica', 'B', 14)
         pdf.cell(0, 10, "Investigators", ln=True, align='L')
-        investigators = DatabaseManager().fetch_all_investigators()
         pdf.set_font('helvetica', '', 10)
         for investigator in investigators:
             pdf.cell(0, 10, text=f"Name: {investigator[1] + ' ' + investigator[2]}", ln=True)
@@ -68,95 +212,118 @@ class PDFManager:
             pdf.cell(0, 10, text=f"Email: {investigator[4]}", ln=True)
             pdf.ln(10)
 
-        # Victim Information Heading
-        pdf.set_font('helvetica', 'B', 14)
-        pdf.cell(0, 10, "Victim Information", ln=True, align='L')
-        pdf.set_font('helvetica', '', 10)
-        pdf.cell(0, 10, text=f"Name: {VictimModel().name}", ln=True)
-        pdf.cell(0, 10, text=f"DoB: {VictimModel().dob}", ln=True)
-        pdf.cell(0, 10, text=f"Nationality: {VictimModel().nationality}", ln=True)
-        pdf.cell(0, 10, text=f"Special Considerations: {VictimModel().special_considerations}", ln=True)
-        pdf.cell(0, 10, text=f"Address: {VictimModel().address}", ln=True)
-        pdf.cell(0, 10, text=f"Email: {VictimModel().email}", ln=True)
-        pdf.cell(0, 10, text=f"Phone: {VictimModel().phone}", ln=True)
-        pdf.cell(0, 10, text=f"Profiles: {VictimModel().profiles}", ln=True)
-        pdf.cell(0, 10, text=f"Screen Names: {VictimModel().screen_names}", ln=True)
-        pdf.cell(0, 10, text=f"School: {VictimModel().school}", ln=True)
-        pdf.cell(0, 10, text=f"Additional Info: {VictimModel().additional_info}", ln=True)
-        pdf.ln(10)
-
-        # Suspect Information Heading
-        pdf.set_font('helvetica', 'B', 14)
-        pdf.cell(0, 10, "Suspect Information", ln=True, align='L')
-        pdf.set_font('helvetica', '', 10)
-        pdf.cell(0, 10, text=f"Name: {SuspectModel().name}", ln=True)
-        pdf.cell(0, 10, text=f"DoB: {SuspectModel().dob}", ln=True)
-        pdf.cell(0, 10, text=f"Nationality: {SuspectModel().nationality}", ln=True)
-        pdf.cell(0, 10, text=f"Special Considerations: {SuspectModel().special_considerations}", ln=True)
-        pdf.cell(0, 10, text=f"Address: {SuspectModel().address}", ln=True)
-        pdf.cell(0, 10, text=f"Email: {SuspectModel().email}", ln=True)
-        pdf.cell(0, 10, text=f"Phone: {SuspectModel().phone}", ln=True)
-        pdf.cell(0, 10, text=f"Profiles: {SuspectModel().profiles}", ln=True)
-        pdf.cell(0, 10, text=f"Screen Names: {SuspectModel().screen_names}", ln=True)
-        pdf.cell(0, 10, text=f"School: {SuspectModel().school}", ln=True)
-        pdf.cell(0, 10, text=f"Occupation: {SuspectModel().occupation}", ln=True)
-        pdf.cell(0, 10, text=f"Business Address: {SuspectModel().business_address}", ln=True)
-        pdf.cell(0, 10, text=f"Additional Info: {SuspectModel().additional_info}", ln=True)
-        pdf.ln(10)
-
-        # Incident Information Heading
+    @staticmethod
+    def build_details(pdf, heading: str, rows: list) -> None:
+        """
+        Draws a heading and a line per field, used for the victim, suspect and incident
+        :param pdf: FPDF or SectionRecorder
+        :param heading:
+        :param rows: list of (label, value)
+        :return:
+        """
         pdf.set_font('helvetica', 'B', 14)
-        pdf.cell(0, 10, "Incident Information", ln=True, align='L')
+        pdf.cell(0, 10, heading, ln=True, align='L')
         pdf.set_font('helvetica', '', 10)
-        pdf.cell(0, 10, text=f"Sextortion Type: {IncidentModel().type_of_sextortion}", ln=True)
-        pdf.cell(0, 10, text=f"Threats: {IncidentModel().threats_made}", ln=True)
-        pdf.cell(0, 10, text=f"Demands: {IncidentModel().demands_made}", ln=True)
-        pdf.cell(0, 10, text=f"Start: {IncidentModel().start_date_time}", ln=True)
-        pdf.cell(0, 10, text=f"End: {IncidentModel().end_date_time}", ln=True)
+        for label, value in rows:
+            pdf.cell(0, 10, text=f"{label}: {value}", ln=True)
         pdf.ln(10)
 
-        # Flagged Chat Logs
+    @staticmethod
+    def build_clogs(pdf, flagged_clogs: [dict]) -> None:
+        """
+        Draws the flagged chat logs
+        :param pdf: FPDF or SectionRecorder
+        :param flagged_clogs: flag summaries
+        :return:
+        """
         pdf.set_font('helvetica', 'B', 14)
         pdf.cell(0, 10, "Flagged Chat Logs", ln=True, align='L')
-        flagged_clogs = FlagManager().load_flagged_clogs()
         for flagged_clog in flagged_clogs:
-            file_name = flagged_clog[0]
             pdf.set_font('helvetica', 'B', 12)
-            pdf.cell(0, 10, text=file_name, ln=True)
+            pdf.cell(0, 10, text=flagged_clog['file_name'], ln=True)
             pdf.set_font('helvetica', '', 10)
             pdf.cell(0, 10, text="Flagged Text: ", ln=True)
-            flagged_texts = FlagManager().load_flagged_text(file_name)
-            for flagged_text in flagged_texts:
+            for flagged_text in flagged_clog['flagged_texts']:
                 pdf.cell(0, 10, text=flagged_text, ln=True)
-            clog_comments = DatabaseManager().fetch_evidence_desc_by_file_name(file_name)[0]
-            pdf.cell(0, 10, text=f"Comments: {clog_comments}", ln=True)
+            pdf.cell(0, 10, text=f"Comments: {flagged_clog['comments']}", ln=True)
         pdf.ln(10)
 
-        # Flagged media here
-        pdf.set_font('helvetica', 'B', 14)
-        pdf.cell(0, 10, "Flagged Media Files", ln=True, align='L')
-        flagged_media = FlagManager().load_flagged_media_files()
-        for media_file in flagged_media:
-            pdf.set_font('helvetica', 'B', 12)
-            pdf.cell(0, 10, text=media_file, ln=True)
-            file_path = os.path.join(FileManager().case_directory, 'evidence', 'media', media_file)
-            file_extension = os.path.splitext(media_file)[1]
-            if file_extension in [".mp4", ".mov", ".avi", ".mkv"]:
-                # Is video
-                image = FileManager().generate_thumbnail(file_path, width=300, height=200)
-            else:
-                # Is photo
-                image = file_path
-            pdf.image(image, w=50, h=50)  # Adjust the path and dimensions as needed
-            pdf.set_font('helvetica', '', 10)
-            media_comments = DatabaseManager().fetch_evidence_desc_by_file_name(media_file)[0]
-            pdf.cell(0, 10, text=f"Comments: {media_comments}", ln=True)
-            # EXIF
-            exif = FileManager().extract_exif(file_path)
-            if not exif == 'no exif found':
-                pdf.cell(0, 10, text=f"EXIF:", ln=True)
-                lines = exif.splitlines()
-                for line in lines:
-                    pdf.cell(0, 10, text=line, ln=True)
-        # Save the PDF to a file
-        pdf.output(os.path.join(FileManager().case_directory, 'reports', f"{CaseModel().case_name}-report.pdf"))
+    @staticmethod
+    def build_media(pdf, media: dict) -> None:
+        """
+        Draws the flagged media, downscaling it in a worker pool
+        :param pdf: FPDF or SectionRecorder
+        :param media: flag summaries, evidence hashes, EXIF and image size in pixels
+        :return:
+        """
+        # Start downscaling all media before drawing so it is ready by the time each one is reached
+        size_px = media['size_px']
+        with ThreadPoolExecutor(max_workers=REPORT_WORKERS, thread_name_prefix='report') as executor:
+            media_images = [executor.submit(ThumbnailCache().thumbnail_path,
+                                            os.path.join(FileManager().case_directory, 'evidence', 'media',
+                                                         flagged['file_name']),
+                                            size_px, size_px, hash_value)
+                            for flagged, hash_value in zip(media['flagged'], media['hashes'])]
+
+            pdf.set_font('helvetica', 'B', 14)
+            pdf.cell(0, 10, "Flagged Media Files", ln=True, align='L')
+            for flagged, media_image, exif in zip(media['flagged'], media_images, media['exif']):
+                media_file = flagged['file_name']
+                pdf.set_font('helvetica', 'B', 12)
+                pdf.cell(0, 10, text=media_file, ln=True)
+                # Downscaled photo or video thumbnail, waits only if this one isn't ready yet
+                try:
+                    pdf.image(media_image.result(), w=REPORT_IMAGE_MM, h=REPORT_IMAGE_MM)
+                except Exception as e:
+                    logging.error(f"Failed to add {media_file} to report: {str(e)}")
+                    pdf.cell(0, 10, text="Preview unavailable", ln=True)
+                pdf.set_font('helvetica', '', 10)
+                pdf.cell(0, 10, text=f"Comments: {flagged['comments']}", ln=True)
+                # EXIF
+                exif = FileManager().format_exif(exif)
+                if not exif == 'no exif found':
+                    pdf.cell(0, 10, text=f"EXIF:", ln=True)
+                    lines = exif.splitlines()
+                    for line in lines:
+                        pdf.cell(0, 10, text=line, ln=True)
+
+    @staticmethod
+    def images_exist(ops: list) -> bool:
+        """
+        Checks the images a cached section draws are still on disk, e.g. the thumbnail cache hasn't been cleared
+        :param ops: recorded FPDF calls
+        :return:
+        """
+        return all(os.path.exists(args[0]) for method, args, _ in ops if method == 'image')
+
+    @staticmethod
+    def section_cache_path() -> str:
+        """
+        File the rendered sections of the current case's report are cached in
+        :return:
+        """
+        return os.path.join(FileManager().case_directory, 'cache', 'report', 'sections.json')
+
+    def load_section_cache(self) -> dict:
+        """
+        Loads the rendered sections of the last report
+        :return: dictionary of section name to fingerprint and recorded FPDF calls
+        """
+        try:
+            with open(self.section_cache_path()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_section_cache(self, cache: dict) -> None:
+        """
+        Saves the rendered sections for the next report
+        :param cache: dictionary of section name to fingerprint and recorded FPDF calls
+        :return:
+        """
+        path = self.section_cache_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so an interrupted save never leaves a corrupt cache
+        with open(path + '.tmp', 'w') as f:
+            json.dump(cache, f)
+        os.replace(path + '.tmp', path)
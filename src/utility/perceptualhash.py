@@ -0,0 +1,158 @@
+import logging
+import os
+import cv2
+import numpy as np
+from PIL import Image
+from src.ai.object_detection.framesampling import FrameSampler, SAMPLE_FPS
+
+logging.basicConfig(level=logging.INFO)
+
+# Perceptual hash types, each is 64 bits
+HASH_TYPES = ['ahash', 'dhash', 'phash']
+
+# Media types perceptual hashes are computed for
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.bmp']
+VIDEO_EXTENSIONS = ['.mp4', '.mov', '.avi', '.mkv']
+
+# Video frames are hashed once every this many seconds, up to a limit per video
+VIDEO_HASH_INTERVAL = 2.0
+MAX_VIDEO_HASH_FRAMES = 100
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    """
+    Packs an array of booleans into an integer, first element most significant
+    """
+    return int.from_bytes(np.packbits(bits.flatten()).tobytes(), 'big')
+
+
+def average_hash(gray: np.ndarray) -> int:
+    """
+    aHash, each bit is whether an 8x8 cell is brighter than the mean
+    :param gray: greyscale image
+    :return: 64 bit hash
+    """
+    small = cv2.resize(gray, (8, 8), interpolation=cv2.INTER_AREA).astype(np.float32)
+    return _bits_to_int(small > small.mean())
+
+
+def difference_hash(gray: np.ndarray) -> int:
+    """
+    dHash, each bit is whether a cell is brighter than its right hand neighbour
+    :param gray: greyscale image
+    :return: 64 bit hash
+    """
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA).astype(np.float32)
+    return _bits_to_int(small[:, 1:] > small[:, :-1])
+
+
+def perception_hash(gray: np.ndarray) -> int:
+    """
+    pHash, each bit is whether a low frequency DCT coefficient is above the median.
+    The most robust of the three to recompression and resizing
+    :param gray: greyscale image
+    :return: 64 bit hash
+    """
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low_frequencies = cv2.dct(small)[:8, :8]
+    return _bits_to_int(low_frequencies > np.median(low_frequencies))
+
+
+def image_hashes(gray: np.ndarray) -> dict:
+    """
+    Computes every perceptual hash type for an image
+    :param gray: greyscale image
+    :return: dictionary of hash type to 64 bit hash
+    """
+    return {'ahash': average_hash(gray), 'dhash': difference_hash(gray), 'phash': perception_hash(gray)}
+
+
+def hash_media_file(file_path: str) -> [(int, dict)]:
+    """
+    Computes perceptual hashes for an image, or for sampled frames of a video
+    :param file_path: path to the media file
+    :return: list of (frame index, hashes), frame index is None for images. Empty if the file can't be read
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    try:
+        if extension in IMAGE_EXTENSIONS:
+            # PIL is used rather than OpenCV as it can read GIFs
+            with Image.open(file_path) as image:
+                gray = np.asarray(image.convert('L'))
+            return [(None, image_hashes(gray))]
+        if extension in VIDEO_EXTENSIONS:
+            sampler = FrameSampler(SAMPLE_FPS, target_fps=1 / VIDEO_HASH_INTERVAL)
+            frame_hashes = []
+            for frame_index, _, frame in sampler.iter_frames(file_path):
+                frame_hashes.append((frame_index, image_hashes(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))))
+                if len(frame_hashes) == MAX_VIDEO_HASH_FRAMES:
+                    break
+            return frame_hashes
+    except Exception as e:
+        # Exception occurred
+        logging.error(f"Failed to compute perceptual hashes for {file_path}: {str(e)}")
+    return []
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """
+    Number of bits that differ between two hashes
+    """
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over 64 bit hashes using Hamming distance.
+    Searches only visit subtrees whose distance from the query could be within range, rather than every hash
+    """
+
+    def __init__(self):
+        # Each node is [hash, items with that hash, {distance: child node}]
+        self.root = None
+        self.size = 0
+
+    def add(self, hash_value: int, item) -> None:
+        """
+        Adds an item under a hash
+        :param hash_value: 64 bit hash
+        :param item: item returned by searches
+        :return:
+        """
+        self.size += 1
+        if self.root is None:
+            self.root = [hash_value, [item], {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming_distance(hash_value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [hash_value, [item], {}]
+                return
+            node = child
+
+    def search(self, hash_value: int, max_distance: int) -> [(int, object)]:
+        """
+        Finds items whose hash is within max_distance of a hash
+        :param hash_value: 64 bit hash to search for
+        :param max_distance: greatest Hamming distance to include
+        :return: list of (distance, item)
+        """
+        found = []
+        if self.root is None:
+            return found
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(hash_value, node[0])
+            if distance <= max_distance:
+                found.extend((distance, item) for item in node[1])
+            # By the triangle inequality only children within max_distance of this distance can match
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return found
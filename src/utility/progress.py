@@ -0,0 +1,107 @@
+import logging
+import threading
+import time
+
+logging.basicConfig(level=logging.INFO)
+
+# Least seconds between progress events, so operations over many small files don't flood the UI with updates
+PROGRESS_MIN_INTERVAL = 0.1
+
+
+class Cancelled(Exception):
+    """
+    Raised inside an operation when it has been cancelled
+    """
+
+
+class Progress:
+    """
+    Reports the progress of a long running operation and lets it be cancelled. Operations take one as an optional
+    argument, so they run the same from the UI, the command line or a benchmark.
+    Events are dictionaries of task, current, total, message and seconds elapsed, passed to the callback on the
+    thread running the operation
+    """
+
+    def __init__(self, callback=None, cancel_event: threading.Event = None,
+                 min_interval: float = PROGRESS_MIN_INTERVAL):
+        """
+        :param callback: function taking each event, None to only allow cancelling
+        :param cancel_event: event set to cancel the operation
+        :param min_interval: least seconds between events, the first and last events of a task are always sent
+        """
+        self.callback = callback
+        self.cancel_event = cancel_event or threading.Event()
+        self.min_interval = min_interval
+        self.task = None
+        self.current = 0
+        self.total = None
+        self.started = time.perf_counter()
+        self.last_emitted = 0.0
+
+    @property
+    def cancelled(self) -> bool:
+        """
+        Whether the operation has been cancelled
+        :return:
+        """
+        return self.cancel_event.is_set()
+
+    def cancel(self) -> None:
+        """
+        Cancels the operation, it stops at its next progress update
+        :return:
+        """
+        self.cancel_event.set()
+
+    def check_cancelled(self) -> None:
+        """
+        Stops the operation if it has been cancelled
+        :return:
+        """
+        if self.cancel_event.is_set():
+            raise Cancelled(f"{self.task or 'Operation'} cancelled")
+
+    def start(self, task: str, total: int = None, message: str = None) -> None:
+        """
+        Starts a task, operations with several stages start a task for each
+        :param task: what is being done e.g. Hashing files
+        :param total: number of steps, None if not known
+        :param message:
+        :return:
+        """
+        self.check_cancelled()
+        self.task = task
+        self.current = 0
+        self.total = total
+        self.emit(message, force=True)
+
+    def advance(self, steps: int = 1, message: str = None) -> None:
+        """
+        Records steps done in the current task
+        :param steps:
+        :param message: e.g. the file just processed
+        :return:
+        """
+        self.check_cancelled()
+        self.current += steps
+        self.emit(message, force=self.total is not None and self.current >= self.total)
+
+    def emit(self, message: str = None, force: bool = False) -> None:
+        """
+        Sends an event to the callback, unless one was sent too recently
+        :param message:
+        :param force: send even if one was sent recently
+        :return:
+        """
+        if self.callback is None:
+            return
+        now = time.perf_counter()
+        if not force and now - self.last_emitted < self.min_interval:
+            return
+        self.last_emitted = now
+        try:
+            self.callback({'task': self.task, 'current': self.current, 'total': self.total, 'message': message,
+                           'seconds': now - self.started})
+        except Exception as e:
+            # A failing progress display shouldn't stop the operation
+            logging.error(f"Progress callback failed: {str(e)}")
@@ -0,0 +1,124 @@
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from PIL import Image
+from src.utility.perceptualhash import VIDEO_EXTENSIONS
+from src.utility.utility import DatabaseManager, FileManager
+
+logging.basicConfig(level=logging.INFO)
+
+# Thumbnail size used by the analysis view and reports
+DEFAULT_THUMBNAIL_SIZE = (300, 200)
+# Sizes generated ahead of time when videos are ingested
+PREGENERATE_SIZES = [DEFAULT_THUMBNAIL_SIZE]
+# Worker threads for generating thumbnails at ingest, OpenCV releases the GIL while decoding
+THUMBNAIL_WORKERS = min(4, os.cpu_count() or 1)
+THUMBNAIL_JPEG_QUALITY = 90
+
+
+class ThumbnailCache:
+    """
+    Utility class for video thumbnails and downscaled photos cached on disk in the case directory, keyed by the
+    evidence MD5 hash and size so a thumbnail is only ever decoded once per case
+    """
+
+    __instance = None
+    # Pool generating thumbnails in the background, created on first use
+    executor = None
+    # Locks per cache file so the pool and the UI never generate the same thumbnail at once
+    locks = {}
+    locks_lock = threading.Lock()
+
+    def __new__(cls):
+        """
+        For Singleton design pattern
+        """
+
+        if cls.__instance is None:
+            cls.__instance = super(ThumbnailCache, cls).__new__(cls)
+        return cls.__instance
+
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def cache_directory() -> str:
+        """
+        Directory thumbnails for the current case are cached in
+        :return:
+        """
+        return os.path.join(FileManager().case_directory, 'cache', 'thumbnails')
+
+    def thumbnail_path(self, media_file: str, width: int, height: int, hash_value: str = None) -> str:
+        """
+        Gets the cached thumbnail of a video or photo, generating it if it isn't cached yet
+        :param media_file: path to the video or photo
+        :param width:
+        :param height:
+        :param hash_value: MD5 hash of the file, looked up from the evidence table if not given
+        :return: path to the thumbnail JPEG
+        """
+        if hash_value is None:
+            hash_value = (DatabaseManager().fetch_evidence_hash_by_file_name(os.path.basename(media_file))
+                          or FileManager().compute_md5_hash(media_file))
+        path = os.path.join(self.cache_directory(), f"{hash_value}_{width}x{height}.jpg")
+
+        with self.locks_lock:
+            lock = self.locks.setdefault(path, threading.Lock())
+        with lock:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if os.path.splitext(media_file)[1].lower() in VIDEO_EXTENSIONS:
+                    thumbnail = FileManager().generate_thumbnail(media_file, width=width, height=height)
+                else:
+                    with Image.open(media_file) as image:
+                        # Decode at reduced size where the format allows, JPEGs decode much faster this way
+                        image.draft('RGB', (width, height))
+                        thumbnail = image.convert('RGB').resize((width, height), Image.Resampling.LANCZOS)
+                # Write to a temporary file first so a partly written thumbnail is never read
+                thumbnail.save(path + '.tmp', format='JPEG', quality=THUMBNAIL_JPEG_QUALITY)
+                os.replace(path + '.tmp', path)
+                logging.info(f"Cached {width}x{height} thumbnail for {media_file}")
+        return path
+
+    def get_thumbnail(self, media_file: str, width: int, height: int, hash_value: str = None) -> Image.Image:
+        """
+        Loads the cached thumbnail of a video or photo
+        :param media_file: path to the video or photo
+        :param width:
+        :param height:
+        :param hash_value: MD5 hash of the file, looked up from the evidence table if not given
+        :return: thumbnail image
+        """
+        with Image.open(self.thumbnail_path(media_file, width, height, hash_value)) as image:
+            image.load()
+            return image
+
+    def pregenerate(self, videos: [(str, str)], sizes: [(int, int)] = None) -> [Future]:
+        """
+        Generates thumbnails in the background so views and reports find them already cached
+        :param videos: list of (path, MD5 hash), files that aren't videos are skipped
+        :param sizes: list of (width, height), PREGENERATE_SIZES if not given
+        :return: futures of the thumbnail paths
+        """
+        if self.executor is None:
+            ThumbnailCache.executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS,
+                                                         thread_name_prefix='thumbnails')
+        futures = []
+        for media_file, hash_value in videos:
+            if os.path.splitext(media_file)[1].lower() not in VIDEO_EXTENSIONS:
+                continue
+            for width, height in sizes or PREGENERATE_SIZES:
+                future = self.executor.submit(self.thumbnail_path, media_file, width, height, hash_value)
+                future.add_done_callback(self._log_failure)
+                futures.append(future)
+        return futures
+
+    @staticmethod
+    def _log_failure(future: Future) -> None:
+        """
+        Logs thumbnails that failed to generate in the background, they are retried when next needed
+        """
+        if future.exception() is not None:
+            logging.error(f"Failed to generate thumbnail: {str(future.exception())}")
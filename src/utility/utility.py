@@ -1,4 +1,3 @@
-import binascii
 import datetime
 import hashlib
 import json
@@ -13,9 +12,20 @@ import pandas as pd
 from PIL import Image, ExifTags
 from jsonschema import validate
 from jsonschema.exceptions import ValidationError
+from src.utility.activitystore import ActivityLogStore
+from src.utility.logwriter import FSYNC_ON_FLUSH
 
 logging.basicConfig(level=logging.INFO)
 
+# When activity log lines are forced to disk, always, on_flush or never
+ACTIVITY_LOG_FSYNC = os.environ.get('CST_ACTIVITY_LOG_FSYNC', FSYNC_ON_FLUSH)
+# Image types whose metadata is read with PIL rather than ffprobe
+IMAGE_METADATA_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.bmp']
+# Fractions of the way through a video tried in turn for its thumbnail frame
+THUMBNAIL_POSITIONS = [0.1, 0.25, 0.5, 0.75, 0.0]
+# Greyscale standard deviation above which a frame has enough detail to use without trying the rest
+THUMBNAIL_MIN_CONTRAST = 30
+
 
 class DatabaseManager:
     """
@@ -46,7 +56,8 @@ class DatabaseManager:
         connection = sqlite3.connect(self.database_directory)
         cursor = connection.cursor()
         # List of tables to check
-        tables = ["investigators", "cases", "incidents", "evidence", "victims", "suspects", "flags"]
+        tables = ["investigators", "cases", "incidents", "evidence", "victims", "suspects", "flags", "detection_runs",
+                  "detections", "perceptual_hashes"]
         for table in tables:
             cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table,))
             if cursor.fetchone() is None:
@@ -172,6 +183,52 @@ class DatabaseManager:
                     )
                 ''')
 
+        logging.info('Creating detection runs table')
+        cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS detection_runs (
+                        hash_value TEXT,
+                        model_version TEXT,
+                        file_name TEXT,
+                        detection_count INTEGER,
+                        processed_at TEXT,
+                        PRIMARY KEY (hash_value, model_version, file_name)
+                    )
+                ''')
+
+        logging.info('Creating detections table')
+        cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS detections (
+                        detection_id INTEGER PRIMARY KEY,
+                        hash_value TEXT,
+                        model_version TEXT,
+                        class_name TEXT,
+                        confidence REAL,
+                        x1 REAL,
+                        y1 REAL,
+                        x2 REAL,
+                        y2 REAL,
+                        frame_index INTEGER,
+                        timestamp REAL
+                    )
+                ''')
+        # Indexes so searching media by detected object doesn't scan every detection
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_detections_class ON detections (class_name, confidence)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_detections_hash ON detections (hash_value, model_version)')
+
+        # Perceptual hashes are stored as hex as SQLite integers can't hold unsigned 64 bit values
+        logging.info('Creating perceptual hashes table')
+        cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS perceptual_hashes (
+                        file_name TEXT,
+                        hash_value TEXT,
+                        frame_index INTEGER,
+                        ahash TEXT,
+                        dhash TEXT,
+                        phash TEXT
+                    )
+                ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_perceptual_hashes_file ON perceptual_hashes (file_name)')
+
         connection.commit()
         connection.close()
 
@@ -433,6 +490,31 @@ class DatabaseManager:
         connection.close()
         return result
 
+    def fetch_flag_summaries(self, file_type: str) -> [Tuple[str, str, str]]:
+        """
+        Fetch every flag of a file type with the comments on its file, in the order files were flagged
+        :param file_type: clog or media
+        :return: list of (file name, flagged text, comments)
+        """
+        connection = sqlite3.connect(self.database_directory)
+        cursor = connection.cursor()
+
+        # Construct the SQL query
+        query = '''
+            SELECT flags.file_name, flags.flagged_text, evidence.description
+            FROM flags
+            LEFT JOIN evidence ON evidence.file_name = flags.file_name
+            WHERE flags.file_type = ?
+            ORDER BY flags.flag_id
+        '''
+
+        cursor.execute(query, (file_type,))
+
+        result = cursor.fetchall()
+
+        connection.close()
+        return result
+
     def fetch_flag_by_file_name(self, file_name):
         """
         Fetch all flagged clog entries for filename
@@ -473,6 +555,61 @@ class DatabaseManager:
         connection.close()
         return result
 
+    def fetch_evidence_hash_by_file_name(self, file_name: str) -> str:
+        """
+        Fetch the MD5 hash of an evidence file
+        :param file_name:
+        :return: hash value, or None if the file isn't evidence
+        """
+        connection = sqlite3.connect(self.database_directory)
+        cursor = connection.cursor()
+
+        # Construct the SQL query
+        query = ''' SELECT hash_value FROM evidence WHERE file_name = ? '''
+
+        cursor.execute(query, (file_name,))
+
+        result = cursor.fetchone()
+
+        connection.close()
+        return result[0] if result else None
+
+    def update_evidence_metadata(self, file_metadata: [Tuple[str, str]]) -> None:
+        """
+        Stores extracted metadata of evidence files in one transaction
+        :param file_metadata: list of (file name, metadata JSON)
+        :return:
+        """
+        connection = sqlite3.connect(self.database_directory)
+        cursor = connection.cursor()
+
+        # Construct the SQL query
+        query = ''' UPDATE evidence SET exif_data = ? WHERE file_name = ? '''
+
+        cursor.executemany(query, [(metadata, file_name) for file_name, metadata in file_metadata])
+        connection.commit()
+
+        connection.close()
+
+    def fetch_evidence_metadata(self, evidence_type: str = 'media') -> Dict[str, str]:
+        """
+        Fetch the stored metadata of all evidence files of a type
+        :param evidence_type: media or chatlogs
+        :return: dictionary of file name to metadata JSON, None if not extracted yet
+        """
+        connection = sqlite3.connect(self.database_directory)
+        cursor = connection.cursor()
+
+        # Construct the SQL query
+        query = ''' SELECT file_name, exif_data FROM evidence WHERE evidence_type = ? '''
+
+        cursor.execute(query, (evidence_type,))
+
+        result = dict(cursor.fetchall())
+
+        connection.close()
+        return result
+
     def fetch_flagged_media_files(self):
         """
         Fetch all flagged media files
@@ -813,6 +950,209 @@ class DatabaseManager:
 
         connection.close()
 
+    def fetch_detection_runs(self, model_version: str) -> [Tuple[str, str]]:
+        """
+        Fetch the files object detection has already been run on with a model version
+        :param model_version: object detection model version
+        :return: list of (hash value, file name) tuples
+        """
+        logging.info(f"Fetching object detection runs for model version {model_version}")
+        connection = sqlite3.connect(self.database_directory)
+        cursor = connection.cursor()
+
+        # Construct the SQL query
+        query = ''' SELECT hash_value, file_name FROM detection_runs WHERE model_version = ? '''
+
+        cursor.execute(query, (model_version,))
+
+        result = cursor.fetchall()
+
+        connection.close()
+        return result
+
+    def insert_detections(self, file_name: str, hash_value: str, model_version: str, detections: [Dict]) -> None:
+        """
+        Replaces the stored object detections for a file's contents and records the run, in one transaction
+        :param file_name: evidence file name
+        :param hash_value: MD5 hash of the file
+        :param model_version: object detection model version
+        :param detections: detection dictionaries with class_name, confidence, bbox, frame_index and timestamp
+        :return:
+        """
+        logging.info(f"Saving {len(detections)} object detections for '{file_name}' to database")
+        connection = sqlite3.connect(self.database_directory)
+        cursor = connection.cursor()
+
+        # Remove detections left by an interrupted run before inserting
+        cursor.execute('DELETE FROM detections WHERE hash_value = ? AND model_version = ?',
+                       (hash_value, model_version))
+        query = '''
+                    INSERT INTO detections (hash_value, model_version, class_name, confidence, x1, y1, x2, y2,
+                                            frame_index, timestamp)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                '''
+        cursor.executemany(query, [(hash_value, model_version, detection['class_name'], detection['confidence'],
+                                    *detection['bbox'], detection['frame_index'], detection['timestamp'])
+                                   for detection in detections])
+        self._insert_detection_run(cursor, file_name, hash_value, model_version, len(detections))
+
+        connection.commit()
+        connection.close()
+
+    def insert_detection_run(self, file_name: str, hash_value: str, model_version: str) -> None:
+        """
+        Records a file as processed by object detection without storing detections, used for duplicate files
+        whose contents already have detections stored. The detection count is left empty
+        :param file_name: evidence file name
+        :param hash_value: MD5 hash of the file
+        :param model_version: object detection model version
+        :return:
+        """
+        connection = sqlite3.connect(self.database_directory)
+        cursor = connection.cursor()
+        self._insert_detection_run(cursor, file_name, hash_value, model_version, None)
+        connection.commit()
+        connection.close()
+
+    @staticmethod
+    def _insert_detection_run(cursor, file_name: str, hash_value: str, model_version: str,
+                              detection_count: int) -> None:
+        """
+        Inserts or replaces a detection run using an open cursor
+        :return:
+        """
+        query = '''
+                    INSERT OR REPLACE INTO detection_runs (hash_value, model_version, file_name, detection_count,
+                                                           processed_at)
+                    VALUES (?, ?, ?, ?, ?)
+                '''
+        cursor.execute(query, (hash_value, model_version, file_name, detection_count,
+                               datetime.datetime.now().isoformat(timespec='seconds')))
+
+    def fetch_media_by_detected_class(self, class_name: str, model_version: str,
+                                      min_confidence: float = 0.0) -> [Tuple[str, int, float]]:
+        """
+        Fetch media files containing a detected object class
+        :param class_name: object class e.g. person
+        :param model_version: object detection model version
+        :param min_confidence: lowest detection confidence to count
+        :return: list of (file name, number of detections, highest confidence), most confident first
+        """
+        logging.info(f"Fetching media files containing '{class_name}'")
+        connection = sqlite3.connect(self.database_directory)
+        cursor = connection.cursor()
+
+        # Construct the SQL query
+        query = '''
+                    SELECT r.file_name, COUNT(*), MAX(d.confidence)
+                    FROM detections d
+                    JOIN detection_runs r ON r.hash_value = d.hash_value AND r.model_version = d.model_version
+                    WHERE d.class_name = ? AND d.confidence >= ? AND d.model_version = ?
+                    GROUP BY r.file_name
+                    ORDER BY MAX(d.confidence) DESC
+                '''
+
+        cursor.execute(query, (class_name, min_confidence, model_version))
+
+        result = cursor.fetchall()
+
+        connection.close()
+        return result
+
+    def fetch_detected_classes(self, model_version: str) -> [Tuple[str, int]]:
+        """
+        Fetch every object class detected in the case's media
+        :param model_version: object detection model version
+        :return: list of (class name, number of files it was detected in)
+        """
+        connection = sqlite3.connect(self.database_directory)
+        cursor = connection.cursor()
+
+        # Construct the SQL query
+        query = '''
+                    SELECT d.class_name, COUNT(DISTINCT r.file_name)
+                    FROM detections d
+                    JOIN detection_runs r ON r.hash_value = d.hash_value AND r.model_version = d.model_version
+                    WHERE d.model_version = ?
+                    GROUP BY d.class_name
+                    ORDER BY d.class_name
+                '''
+
+        cursor.execute(query, (model_version,))
+
+        result = cursor.fetchall()
+
+        connection.close()
+        return result
+
+    def insert_perceptual_hashes(self, file_name: str, hash_value: str, frame_hashes: [Tuple[int, Dict]]) -> None:
+        """
+        Replaces the perceptual hashes stored for a media file
+        :param file_name: evidence file name
+        :param hash_value: MD5 hash of the file
+        :param frame_hashes: list of (frame index, {hash type: 64 bit hash}), frame index is None for images
+        :return:
+        """
+        logging.info(f"Saving {len(frame_hashes)} perceptual hashes for '{file_name}' to database")
+        connection = sqlite3.connect(self.database_directory)
+        cursor = connection.cursor()
+
+        cursor.execute('DELETE FROM perceptual_hashes WHERE file_name = ?', (file_name,))
+        query = '''
+                    INSERT INTO perceptual_hashes (file_name, hash_value, frame_index, ahash, dhash, phash)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                '''
+        cursor.executemany(query, [(file_name, hash_value, frame_index, f"{hashes['ahash']:016x}",
+                                    f"{hashes['dhash']:016x}", f"{hashes['phash']:016x}")
+                                   for frame_index, hashes in frame_hashes])
+
+        connection.commit()
+        connection.close()
+
+    def fetch_perceptual_hashes(self, hash_type: str, file_name: str = None) -> [Tuple[str, int, int]]:
+        """
+        Fetch one type of perceptual hash for every media file, or for one file
+        :param hash_type: ahash, dhash or phash
+        :param file_name: only fetch hashes for this file if given
+        :return: list of (file name, frame index, 64 bit hash)
+        """
+        if hash_type not in ['ahash', 'dhash', 'phash']:
+            raise ValueError(f"Unknown perceptual hash type {hash_type}")
+
+        connection = sqlite3.connect(self.database_directory)
+        cursor = connection.cursor()
+
+        # Construct the SQL query, hash type is checked above as column names can't be parameters
+        query = f''' SELECT file_name, frame_index, {hash_type} FROM perceptual_hashes '''
+
+        if file_name is None:
+            cursor.execute(query)
+        else:
+            cursor.execute(query + 'WHERE file_name = ?', (file_name,))
+
+        result = [(file_name, frame_index, int(hex_hash, 16)) for file_name, frame_index, hex_hash in cursor]
+
+        connection.close()
+        return result
+
+    def fetch_perceptual_hashed_files(self) -> [str]:
+        """
+        Fetch the names of media files with perceptual hashes stored
+        :return: list of file names
+        """
+        connection = sqlite3.connect(self.database_directory)
+        cursor = connection.cursor()
+
+        # Construct the SQL query
+        query = ''' SELECT DISTINCT file_name FROM perceptual_hashes '''
+
+        cursor.execute(query)
+
+        result = [row[0] for row in cursor.fetchall()]
+
+        connection.close()
+        return result
+
 
 class FileManager:
     """
@@ -821,6 +1161,8 @@ class FileManager:
 
     __instance = None
     case_directory = None
+    # Hash-chained activity log store of the current case
+    activity_log_store = None
 
     def __new__(cls):
         """
@@ -886,15 +1228,63 @@ class FileManager:
         except shutil.Error as e:
             logging.error("Error: moving file - {}".format(e))
 
-    def write_to_activity_log(self, entry: str) -> None:
+    @staticmethod
+    def copy_file(file_path: str, destination_dir: str) -> None:
+        """
+        Copies file to destination directory, keeping its timestamps, the original is left in place
+        :param file_path: file to copy
+        :param destination_dir: destination to copy file to
+        :return:
+        """
+        os.makedirs(destination_dir, exist_ok=True)
+
+        try:
+            shutil.copy2(file_path, destination_dir)
+            logging.info("Copied file {} to directory {}".format(file_path, destination_dir))
+        except FileNotFoundError as e:
+            logging.error("Error: File not found - {}".format(e))
+        except shutil.Error as e:
+            logging.error("Error: copying file - {}".format(e))
+
+    def activity_log(self, classify=None) -> ActivityLogStore:
+        """
+        Gets the activity log store of the current case, opening it when the case changes
+        Cases with only the old text log have it migrated into the store, the text file is kept
+        :param classify: function of message to (action, file name) used when migrating
+        :return:
+        """
+        store_directory = os.path.join(self.case_directory, 'reports', 'activitylog')
+        if self.activity_log_store is None or self.activity_log_store.directory != store_directory:
+            if self.activity_log_store is not None:
+                self.activity_log_store.close()
+            FileManager.activity_log_store = ActivityLogStore(store_directory, ACTIVITY_LOG_FSYNC)
+            self.activity_log_store.migrate_legacy_log(
+                os.path.join(self.case_directory, 'reports', 'ActivityLog.txt'),
+                classify or (lambda message: ('activity', None)))
+        return self.activity_log_store
+
+    def write_to_activity_log(self, entry: str, action: str = 'activity', file_name: str = None,
+                              timestamp: datetime.datetime = None, classify=None) -> None:
         """
         Creates new CoC log if one doesn't exist
         Writes to CoC log
+        :param entry: activity description
+        :param action: kind of activity
+        :param file_name: evidence file the activity concerns, if any
+        :param timestamp: when the activity happened
+        :param classify: function of message to (action, file name) used if a legacy log is migrated
+        :return:
+        """
+        # Entries are buffered and appended in batches
+        self.activity_log(classify).append(entry, action, file_name, timestamp)
+
+    def flush_activity_log(self) -> None:
+        """
+        Writes any buffered activity log entries to the store
         :return:
         """
-        log_file_path = os.path.join(self.case_directory, 'reports', 'ActivityLog.txt')
-        with open(log_file_path, "a") as log_file:
-            log_file.write(f"{entry}\n")
+        if self.activity_log_store is not None:
+            self.activity_log_store.flush()
 
     @staticmethod
     def compute_md5_hash(file_path: str) -> str:
@@ -1129,7 +1519,7 @@ class FileManager:
     @staticmethod
     def generate_thumbnail(video_file, width, height):
         """
-        Generates thumbnail for video file
+        Generates thumbnail for video file from a representative frame, as the first frame is often black
         :param video_file:
         :param width:
         :param height:
@@ -1137,12 +1527,32 @@ class FileManager:
         """
         # Open the video file
         cap = cv2.VideoCapture(video_file)
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+        # Seek to a few points through the video, seeking decodes from the nearest keyframe rather than from the
+        # start. The frame with the most contrast is used, black and faded frames have next to none
+        frame = None
+        best_contrast = -1
+        for position in THUMBNAIL_POSITIONS if frame_count > 1 else [0]:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int(position * (frame_count - 1)))
+            ret, candidate = cap.read()
+            if not ret:
+                continue
+            contrast = cv2.cvtColor(candidate, cv2.COLOR_BGR2GRAY).std()
+            if contrast > best_contrast:
+                frame = candidate
+                best_contrast = contrast
+            if contrast >= THUMBNAIL_MIN_CONTRAST:
+                break
+
+        # Close the video file
+        cap.release()
 
-        # Read the first frame
-        ret, frame = cap.read()
+        if frame is None:
+            raise ValueError(f"Could not read any frames from {video_file}")
 
         # Resize the frame
-        frame = cv2.resize(frame, (width, height))
+        frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
 
         # Convert the frame to RGB
         frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
@@ -1150,107 +1560,101 @@ class FileManager:
         # Convert the frame to PIL Image
         img = Image.fromarray(frame_rgb)
 
-        # Close the video file
-        cap.release()
-
         return img
 
     @staticmethod
-    def extract_hex(file_path: str, bytes_per_line=16) -> str:
+    def read_exif(file_path) -> Dict[str, str]:
         """
-        Extract hex from file with hex to left of string and plaintext to the right
-        :param file_path:
-        :param bytes_per_line:
-        :return:
+        Reads EXIF data from an image file in-process with PIL
+        :param file_path: Path to the image file.
+        :return: dictionary of EXIF tag name to value, empty if there is none
         """
-        hex_view = []
-        ascii_view = []
-        byte_count = 0
-        line_hex = []
-        line_ascii = []
-
-        with open(file_path, 'rb') as file:
-            # Read binary data from the file
-            while True:
-                byte = file.read(1)
-                if not byte:
-                    break
-                byte_hex = binascii.hexlify(byte).decode('utf-8').upper()
-                line_hex.append(byte_hex)
-                byte_ascii = chr(byte[0]) if 32 <= byte[0] <= 126 else '.'
-                line_ascii.append(byte_ascii)
-                byte_count += 1
-                if byte_count % bytes_per_line == 0:
-                    hex_view.append(' '.join(line_hex))
-                    ascii_view.append(''.join(line_ascii))
-                    line_hex = []
-                    line_ascii = []
-
-        # Format hexadecimal and ASCII views as strings
-        hex_string = '\n'.join(hex_view)
-        ascii_string = '\n'.join(ascii_view)
-
-        # Combine the hex and ASCII strings side by side
-        combined_string = "\n".join(
-            ["{:48} {}".format(hex_line, ascii_line) for hex_line, ascii_line in zip(hex_view, ascii_view)])
-
-        return combined_string
+        try:
+            with Image.open(file_path) as img:
+                return {str(ExifTags.TAGS.get(tag_id, tag_id)): str(value) for tag_id, value in img.getexif().items()}
+        except Exception as e:
+            # Exception occurred
+            logging.error(f"Failed to extract EXIF from media: {str(e)}")
+            return {}
 
     @staticmethod
-    def extract_exif(file_path) -> str:
+    def format_exif(exif: Dict[str, str]) -> str:
+        """
+        Formats EXIF data with a tag on each line
+        :param exif: dictionary of EXIF tag name to value
+        :return: String containing EXIF data or 'no exif found'.
+        """
+        if not exif:
+            return "no exif found"
+        return ''.join(f"{tag}: {value}\n" for tag, value in exif.items())
+
+    def extract_exif(self, file_path) -> str:
         """
         Extracts EXIF data from an image file.
         :param file_path: Path to the image file.
         :return: String containing EXIF data or 'no exif found'.
         """
-        try:
-            # Open the image
-            img = Image.open(file_path)
-            exif_data = img.getexif()
-
-            if exif_data:
-                # EXIF data exists
-                exif_string = ""
-                for tag_id, value in exif_data.items():
-                    tag = ExifTags.TAGS.get(tag_id, tag_id)
-                    exif_string += f"{tag}: {value}\n"
-                return exif_string
-            else:
-                # No EXIF data found
-                logging.info(f"No EXIF data was found for: {file_path}")
-                return "no exif found"
-        except Exception as e:
-            # Exception occurred
-            logging.error(f"Failed to extract EXIF from media: {str(e)}")
-            return "no exif found"
+        exif = self.read_exif(file_path)
+        if not exif:
+            # No EXIF data found
+            logging.info(f"No EXIF data was found for: {file_path}")
+        return self.format_exif(exif)
 
     @staticmethod
-    def extract_metadata(file_path) -> str:
+    def probe_metadata(file_path) -> Dict:
         """
-        Extracts detailed metadata from file
+        Reads container and stream metadata from a media file. Images are read in-process with PIL, other media
+        with ffprobe
         :param file_path:
-        :return:
+        :return: dictionary with 'streams' and 'format', empty if the file couldn't be read
         """
         try:
+            if os.path.splitext(file_path)[1].lower() in IMAGE_METADATA_EXTENSIONS:
+                with Image.open(file_path) as img:
+                    stream = {'codec_name': (img.format or '').lower(), 'width': img.width, 'height': img.height,
+                              'pix_fmt': img.mode, 'nb_frames': getattr(img, 'n_frames', 1)}
+                format_info = {'filename': file_path, 'format_name': img.format,
+                               'format_long_name': img.format_description, 'size': str(os.path.getsize(file_path))}
+                return {'streams': [stream], 'format': format_info}
+
             cmd = ["ffprobe", "-v", "quiet", "-print_format", "json", "-show_format", "-show_streams", file_path]
             result = subprocess.run(cmd, capture_output=True, text=True)
             metadata = json.loads(result.stdout)
-
-            # Extract relevant metadata
-            video_info = metadata.get("streams", [])[0]
-            format_info = metadata.get("format", {})
-
-            # Format metadata into separate lines
-            metadata_str = f"Media Metadata:\n"
-            for key, value in video_info.items():
-                metadata_str += f"{key}: {value}\n"
-
-            metadata_str += f"\nFormat Metadata:\n"
-            for key, value in format_info.items():
-                metadata_str += f"{key}: {value}\n"
-
-            return metadata_str
+            return {'streams': metadata.get("streams", []), 'format': metadata.get("format", {})}
         except Exception as e:
             # Exception occurred
             logging.error(f"Failed to extract metadata from media: {str(e)}")
+            return {}
+
+    @staticmethod
+    def format_metadata(metadata: Dict) -> str:
+        """
+        Formats the first stream's and the container's metadata into separate lines
+        :param metadata: dictionary with 'streams' and 'format'
+        :return: metadata string or 'no metadata found'
+        """
+        if not metadata.get('streams'):
             return "no metadata found"
+
+        # Extract relevant metadata
+        video_info = metadata['streams'][0]
+        format_info = metadata.get('format', {})
+
+        # Format metadata into separate lines
+        metadata_str = f"Media Metadata:\n"
+        for key, value in video_info.items():
+            metadata_str += f"{key}: {value}\n"
+
+        metadata_str += f"\nFormat Metadata:\n"
+        for key, value in format_info.items():
+            metadata_str += f"{key}: {value}\n"
+
+        return metadata_str
+
+    def extract_metadata(self, file_path) -> str:
+        """
+        Extracts detailed metadata from file
+        :param file_path:
+        :return:
+        """
+        return self.format_metadata(self.probe_metadata(file_path))
@@ -1,10 +1,13 @@
 import logging
-import os
 import customtkinter
 from PIL import Image
-from src.utility.utility import FileManager
 logging.basicConfig(level=logging.INFO)
 
+# Fraction of the flagged files list scrolled through before more cards are built
+LAZY_LOAD_THRESHOLD = 0.9
+# Size media previews are shown at
+PREVIEW_SIZE = (300, 300)
+
 
 class AnalysisView(customtkinter.CTkFrame):
     """
@@ -62,6 +65,14 @@ class AnalysisView(customtkinter.CTkFrame):
         else:
             return
 
+    def near_bottom(self) -> bool:
+        """
+        Checks if the bottom of the flagged files list is in view, or the list doesn't fill the frame
+        :return:
+        """
+        # The scrollable frame's canvas gives the fraction of its contents in view
+        return self.frame._parent_canvas.yview()[1] >= LAZY_LOAD_THRESHOLD
+
     def clear_frame(self):
         """
         Clears contents inside the frame
@@ -140,19 +151,9 @@ class FlaggedMediaView(customtkinter.CTkFrame):
         self.title = customtkinter.CTkLabel(self, text=file_name, font=customtkinter.CTkFont(size=20, weight='bold'))
         self.title.grid(row=0, column=0, padx=20, pady=20, sticky='nsew')
 
-        # Media preview
-        media_file_path = os.path.join(FileManager().case_directory, 'evidence', 'media', file_name)
-        file_extension = os.path.splitext(file_name)[1]
-        if file_extension in [".mp4", ".mov", ".avi", ".mkv"]:
-            # Is video
-            thumbnail = FileManager().generate_thumbnail(media_file_path, width=300, height=200)
-            photo = customtkinter.CTkImage(thumbnail, size=(300, 300))
-        else:
-            # Is photo
-            image = Image.open(media_file_path)
-            photo = customtkinter.CTkImage(image, size=(300, 300))
-
-        self.preview = customtkinter.CTkLabel(self, image=photo, text="")
+        # Media preview, loaded in the background
+        self.preview = customtkinter.CTkLabel(self, text="Loading preview...", width=PREVIEW_SIZE[0],
+                                              height=PREVIEW_SIZE[1])
         self.preview.grid(row=1, column=0, padx=20, pady=20, sticky='nsew')
 
         # View comments
@@ -164,7 +165,7 @@ class FlaggedMediaView(customtkinter.CTkFrame):
         # View EXIF / Metadata / Hex
         self.meta_label = customtkinter.CTkLabel(self, text='Extracted Data', font=customtkinter.CTkFont(weight='bold'))
         self.meta_label.grid(row=5, column=0, padx=20, pady=0, sticky='nsew')
-        self.meta_box = customtkinter.CTkLabel(self, text="")
+        self.meta_box = customtkinter.CTkLabel(self, text="Loading...")
         self.meta_box.grid(row=6, column=0, padx=20, pady=20, sticky='nsew')
 
         # Add all content to the frame
@@ -179,6 +180,17 @@ class FlaggedMediaView(customtkinter.CTkFrame):
         """
         self.comments_box.configure(text=comments)
 
+    def add_preview(self, image: Image.Image) -> None:
+        """
+        Shows the media preview
+        :param image: photo or video thumbnail, None if it couldn't be loaded
+        :return:
+        """
+        if image is None:
+            self.preview.configure(text="No preview available")
+        else:
+            self.preview.configure(image=customtkinter.CTkImage(image, size=PREVIEW_SIZE), text="")
+
     def add_meta(self, metadata: str) -> None:
         """
         Populates meta box with metadata
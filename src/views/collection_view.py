@@ -28,6 +28,10 @@ class CollectionView(customtkinter.CTkFrame):
         self.export_hashes_button = customtkinter.CTkButton(self, text="EXPORT HASHES OF MEDIA FILES")
         self.export_hashes_button.pack(padx=20, pady=20, expand=False, fill=tk.BOTH)
 
+        # Button to import a reference hash set to check evidence against
+        self.import_hash_set_button = customtkinter.CTkButton(self, text="IMPORT REFERENCE HASH SET")
+        self.import_hash_set_button.pack(padx=20, pady=20, expand=False, fill=tk.BOTH)
+
         # Add all content to the frame
         self.pack(fill="both", expand=True)
         self.pack_propagate(False)
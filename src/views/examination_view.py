@@ -77,6 +77,20 @@ class ExaminationView(customtkinter.CTkFrame):
         self.od_button = customtkinter.CTkButton(self.media_frame, text="SAFE VIEW (DETECT OBJECTS)")
         self.od_button.pack(padx=20, pady=10, fill='x', expand=False)
 
+        # Button to run object detection over all case media and store the results
+        self.od_all_button = customtkinter.CTkButton(self.media_frame, text="DETECT OBJECTS IN ALL MEDIA")
+        self.od_all_button.pack(padx=20, pady=10, fill='x', expand=False)
+
+        # Button to search media by stored detected objects
+        self.od_search_button = customtkinter.CTkButton(self.media_frame, text="FIND MEDIA CONTAINING OBJECT")
+        self.od_search_button.pack(padx=20, pady=10, fill='x', expand=False)
+
+        # Buttons to find near-duplicates of media using perceptual hashes
+        self.duplicates_button = customtkinter.CTkButton(self.media_frame, text="FIND NEAR-DUPLICATES")
+        self.duplicates_button.pack(padx=20, pady=10, fill='x', expand=False)
+        self.cluster_button = customtkinter.CTkButton(self.media_frame, text="GROUP ALL NEAR-DUPLICATE MEDIA")
+        self.cluster_button.pack(padx=20, pady=10, fill='x', expand=False)
+
         # Button to preview photo/video
         self.view_button = customtkinter.CTkButton(self.media_frame, text="PREVIEW IMAGE/VIDEO")
         self.view_button.pack(padx=20, pady=10, fill='x', expand=False)
@@ -28,6 +28,14 @@ class PreservationView(customtkinter.CTkFrame):
                                                       font=customtkinter.CTkFont(size=15, weight="bold"))
         self.integrity_label.pack(padx=20, pady=5, fill=tk.X)
 
+        # Background integrity monitor status and alerts
+        self.monitor_label = customtkinter.CTkLabel(self.integrity_frame, text="Integrity monitor not running")
+        self.monitor_label.pack(padx=20, pady=0, fill=tk.X)
+
+        self.alerts_box = customtkinter.CTkTextbox(self.integrity_frame, height=80, text_color='tomato')
+        self.alerts_box.pack(padx=20, pady=(5, 0), fill=tk.X)
+        self.alerts_box.configure(state='disabled')
+
         self.integrity_view_box = IntegrityViewBox(self.integrity_frame)
         self.integrity_view_box.pack(padx=20, pady=20, fill=tk.BOTH, expand=True)
 
@@ -49,3 +57,22 @@ class PreservationView(customtkinter.CTkFrame):
         self.pack(fill="both", expand=True)
         self.pack_propagate(False)
 
+    def add_integrity_alert(self, alert: str) -> None:
+        """
+        Adds an alert from the integrity monitor to the top of the alerts box
+        :param alert:
+        :return:
+        """
+        self.alerts_box.configure(state='normal')
+        self.alerts_box.insert('1.0', f"{alert}\n")
+        self.alerts_box.configure(state='disabled')
+
+    def clear_integrity_alerts(self) -> None:
+        """
+        Clears the alerts box
+        :return:
+        """
+        self.alerts_box.configure(state='normal')
+        self.alerts_box.delete('1.0', tk.END)
+        self.alerts_box.configure(state='disabled')
+
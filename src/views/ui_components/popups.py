@@ -7,6 +7,7 @@ import customtkinter
 from CTkListbox import *
 from customtkinter import CTkToplevel
 from src.models.victim_suspect import VictimModel, SuspectModel
+from src.utility.hexviewer import HexViewer, PAGE_ROWS, parse_offset, parse_search
 
 logging.basicConfig(level=logging.INFO)
 
@@ -636,20 +637,140 @@ class MetaPopup(CTkToplevel):
 
 class HexPopup(CTkToplevel):
     """
-    Popup for displaying hex beside plaintext
+    Popup for displaying hex beside plaintext, one page of rows at a time
     """
 
-    def __init__(self, file_name, master=None, **kwargs):
+    def __init__(self, file_name, viewer: HexViewer, master=None, **kwargs):
         super().__init__(master, **kwargs)
 
-        self.geometry('550x550')
+        self.geometry('700x600')
         self.title(f"{file_name} Hex")
 
+        # Memory-mapped file being viewed and the first row shown
+        self.viewer = viewer
+        self.first_row = 0
+        # Offset of the last search match, the next search starts after it
+        self.match_offset = -1
+
         self.title = customtkinter.CTkLabel(self, text=f"{file_name} Hex", font=customtkinter.CTkFont(size=20))
         self.title.pack(padx=20, pady=10, fill='x', expand=False)
 
-        self.data_dump = customtkinter.CTkTextbox(self)
+        # ---- Jump to offset and search ----
+        self.controls_frame = customtkinter.CTkFrame(self, fg_color='transparent')
+        self.controls_frame.pack(padx=20, pady=0, fill='x', expand=False)
+
+        self.offset_entry = customtkinter.CTkEntry(self.controls_frame, placeholder_text="Offset e.g. 0x1F40")
+        self.offset_entry.pack(side='left', padx=(0, 5))
+        self.offset_entry.bind('<Return>', self.jump_to_offset)
+        self.jump_button = customtkinter.CTkButton(self.controls_frame, text="Go", width=40,
+                                                   command=self.jump_to_offset)
+        self.jump_button.pack(side='left', padx=(0, 20))
+
+        self.search_entry = customtkinter.CTkEntry(self.controls_frame, placeholder_text="Text or hex e.g. FF D8 FF")
+        self.search_entry.pack(side='left', padx=(0, 5), fill='x', expand=True)
+        self.search_entry.bind('<Return>', self.search)
+        self.search_button = customtkinter.CTkButton(self.controls_frame, text="Find Next", width=80,
+                                                     command=self.search)
+        self.search_button.pack(side='left')
+
+        self.data_dump = customtkinter.CTkTextbox(self, font=customtkinter.CTkFont(family='Courier', size=13),
+                                                  wrap='none')
         self.data_dump.pack(padx=20, pady=10, fill='both', expand=True)
+        self.data_dump.tag_config('match', background='yellow', foreground='black')
+
+        # ---- Paging ----
+        self.paging_frame = customtkinter.CTkFrame(self, fg_color='transparent')
+        self.paging_frame.pack(padx=20, pady=(0, 10), fill='x', expand=False)
+
+        self.previous_button = customtkinter.CTkButton(self.paging_frame, text="< Previous", width=100,
+                                                       command=lambda: self.show_page(self.first_row - PAGE_ROWS))
+        self.previous_button.pack(side='left')
+        self.next_button = customtkinter.CTkButton(self.paging_frame, text="Next >", width=100,
+                                                   command=lambda: self.show_page(self.first_row + PAGE_ROWS))
+        self.next_button.pack(side='right')
+        self.position_label = customtkinter.CTkLabel(self.paging_frame, text="")
+        self.position_label.pack(side='left', fill='x', expand=True)
+
+        # ---- Window closing ----
+        self.protocol("WM_DELETE_WINDOW", self.on_window_close)
+
+        self.show_page(0)
+
+    def show_page(self, first_row: int) -> None:
+        """
+        Shows a page of rows, only these rows are read from the file
+        :param first_row: index of the first row to show
+        :return:
+        """
+        self.first_row = max(0, min(first_row, self.viewer.row_count - 1))
+        self.data_dump.configure(state='normal')
+        self.data_dump.delete('1.0', tk.END)
+        self.data_dump.insert(tk.END, self.viewer.page(self.first_row))
+        self.data_dump.configure(state='disabled')
+
+        last_offset = min((self.first_row + PAGE_ROWS) * self.viewer.bytes_per_line, self.viewer.size)
+        self.position_label.configure(text=f"0x{self.first_row * self.viewer.bytes_per_line:X} - "
+                                           f"0x{last_offset:X} of 0x{self.viewer.size:X} bytes")
+
+    def jump_to_offset(self, event: tk.Event = None) -> None:
+        """
+        Shows the page starting at the row containing an offset
+        :param event:
+        :return:
+        """
+        try:
+            offset = parse_offset(self.offset_entry.get())
+        except ValueError:
+            tk.messagebox.showerror('Error', 'Offset must be a decimal number or hex starting 0x')
+            return
+        self.show_page(self.viewer.row_of(offset))
+
+    def search(self, event: tk.Event = None) -> None:
+        """
+        Finds the next match after the last one, searching the whole file, and highlights it
+        :param event:
+        :return:
+        """
+        pattern = parse_search(self.search_entry.get())
+        if not pattern:
+            return
+        offset = self.viewer.find(pattern, self.match_offset + 1)
+        if offset == -1:
+            tk.messagebox.showinfo('Not found', f"'{self.search_entry.get()}' not found")
+            return
+        self.match_offset = offset
+
+        # Start the page a few rows before the match so it can be seen in context
+        self.show_page(self.viewer.row_of(offset) - 4)
+        self.highlight(offset, len(pattern))
+
+    def highlight(self, offset: int, length: int) -> None:
+        """
+        Highlights bytes on the current page in both the hex and plaintext columns
+        :param offset: file offset of the first byte
+        :param length: number of bytes
+        :return:
+        """
+        bytes_per_line = self.viewer.bytes_per_line
+        # Columns of the hex and plaintext in each formatted row, after the offset
+        hex_start = len(f"{offset:08X}  ")
+        ascii_start = hex_start + bytes_per_line * 3 + 1
+        for position in range(offset, min(offset + length, self.viewer.size)):
+            line = position // bytes_per_line - self.first_row + 1
+            column = position % bytes_per_line
+            if 1 <= line <= PAGE_ROWS:
+                self.data_dump.tag_add('match', f"{line}.{hex_start + column * 3}",
+                                       f"{line}.{hex_start + column * 3 + 2}")
+                self.data_dump.tag_add('match', f"{line}.{ascii_start + column}",
+                                       f"{line}.{ascii_start + column + 1}")
+
+    def on_window_close(self) -> None:
+        """
+        Handle window closing, the memory-mapped file is closed with the window
+        :return:
+        """
+        self.viewer.close()
+        self.destroy()
 
 
 class ObjectsPopup(CTkToplevel):
@@ -660,7 +781,7 @@ class ObjectsPopup(CTkToplevel):
     def __init__(self, file_name, master=None, **kwargs):
         super().__init__(master, **kwargs)
 
-        self.geometry('300x300')
+        self.geometry('450x300')
         self.title(f"{file_name} Detected Objects")
 
         self.title = customtkinter.CTkLabel(self, text=f"Detected Objects",
@@ -670,6 +791,65 @@ class ObjectsPopup(CTkToplevel):
         self.objects_box = customtkinter.CTkTextbox(self, font=customtkinter.CTkFont(size=15))
         self.objects_box.pack(padx=20, pady=10, fill='both', expand=True)
 
+    def add_tracked_objects(self, records: [dict]) -> None:
+        """
+        Adds objects tracked through a video to box, with when they were seen
+        :param records: tracked object records from ObjectDetection.detect_objects_video
+        :return:
+        """
+        for record in records:
+            self.objects_box.insert(tk.END, f"{record['class_name']} - average confidence "
+                                            f"{record['mean_confidence']:.0%}, seen "
+                                            f"{self.format_time(record['first_seen'])}-"
+                                            f"{self.format_time(record['last_seen'])}\n")
+
+    @staticmethod
+    def format_time(seconds: float) -> str:
+        """
+        Formats seconds into a video as minutes and seconds
+        :param seconds:
+        :return:
+        """
+        minutes, seconds = divmod(seconds, 60)
+        return f"{int(minutes):02d}:{seconds:04.1f}"
+
+
+class ObjectSearchPopup(CTkToplevel):
+    """
+    Popup for displaying media files containing a searched for object
+    """
+
+    def __init__(self, class_name, master=None, **kwargs):
+        super().__init__(master, **kwargs)
+
+        self.geometry('400x400')
+        self.title(f"Media containing '{class_name}'")
+
+        self.title = customtkinter.CTkLabel(self, text=f"Media containing '{class_name}'",
+                                            font=customtkinter.CTkFont(size=20))
+        self.title.pack(padx=20, pady=10, fill='x', expand=False)
+
+        self.results_box = customtkinter.CTkTextbox(self, font=customtkinter.CTkFont(size=15))
+        self.results_box.pack(padx=20, pady=10, fill='both', expand=True)
+
+
+class DuplicatesPopup(CTkToplevel):
+    """
+    Popup for displaying near-duplicate media
+    """
+
+    def __init__(self, title, master=None, **kwargs):
+        super().__init__(master, **kwargs)
+
+        self.geometry('450x400')
+        self.title(title)
+
+        self.title = customtkinter.CTkLabel(self, text=title, font=customtkinter.CTkFont(size=20))
+        self.title.pack(padx=20, pady=10, fill='x', expand=False)
+
+        self.duplicates_box = customtkinter.CTkTextbox(self, font=customtkinter.CTkFont(size=15))
+        self.duplicates_box.pack(padx=20, pady=10, fill='both', expand=True)
+
 
 class URLsPopup(CTkToplevel):
     """
@@ -785,3 +965,68 @@ class DetectedGroomingPopup(CTkToplevel):
         :return:
         """
         self.highlight_button.bind("<Button-1>", callback)
+
+
+class TaskPopup(CTkToplevel):
+    """
+    Popup showing the progress of a task running in the background, with a button to cancel it
+    """
+
+    def __init__(self, title, master=None, **kwargs):
+        super().__init__(master, **kwargs)
+
+        self.geometry('450x170')
+        self.title(title)
+        self.resizable(False, False)
+
+        self.task_label = customtkinter.CTkLabel(self, text=title, font=customtkinter.CTkFont(size=17))
+        self.task_label.pack(padx=20, pady=(15, 5), fill='x')
+
+        self.progress_bar = customtkinter.CTkProgressBar(self, mode='indeterminate')
+        self.progress_bar.pack(padx=20, pady=5, fill='x')
+        self.progress_bar.start()
+        self.determinate = False
+
+        self.message_label = customtkinter.CTkLabel(self, text='', font=customtkinter.CTkFont(size=13))
+        self.message_label.pack(padx=20, pady=5, fill='x')
+
+        self.cancel_button = customtkinter.CTkButton(self, text="CANCEL")
+        self.cancel_button.pack(padx=20, pady=(5, 15))
+
+    def update_progress(self, event: dict) -> None:
+        """
+        Shows a progress event, the bar only fills once the number of steps is known
+        :param event: progress event with task, current, total and message
+        :return:
+        """
+        if event['total']:
+            if not self.determinate:
+                self.progress_bar.stop()
+                self.progress_bar.configure(mode='determinate')
+                self.determinate = True
+            self.progress_bar.set(event['current'] / event['total'])
+            text = f"{event['task']} {event['current']} of {event['total']}"
+        else:
+            if self.determinate:
+                self.progress_bar.configure(mode='indeterminate')
+                self.progress_bar.start()
+                self.determinate = False
+            text = event['task']
+        self.task_label.configure(text=text)
+        self.message_label.configure(text=event['message'] or '')
+
+    def bind_cancel(self, callback: Callable[[], None]) -> None:
+        """
+        Binds the cancel button and closing the popup
+        :param callback:
+        :return:
+        """
+        self.cancel_button.configure(command=callback)
+        self.protocol("WM_DELETE_WINDOW", callback)
+
+    def show_cancelling(self) -> None:
+        """
+        Shows the task is stopping
+        :return:
+        """
+        self.cancel_button.configure(state='disabled', text="CANCELLING...")
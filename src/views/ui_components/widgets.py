@@ -33,6 +33,8 @@ class IntegrityViewBox(ttk.Treeview):
 
         self.tag_configure('failed', background='darkred')
         self.tag_configure('passed', background='darkgreen')
+        self.tag_configure('missing', background='darkorange3')
+        self.tag_configure('untracked', background='gray30')
 
     def clear(self) -> None:
         """